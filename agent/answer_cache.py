@@ -0,0 +1,110 @@
+"""Agent-level answer cache keyed on normalized question signatures."""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from agent.question_signature import signature_key
+
+
+DEFAULT_ANSWER_CACHE_PATH = ".cache/answer_cache.sqlite"
+
+
+class AnswerCache:
+    """Persist final answers, SQL and citations per question signature.
+
+    Entries are tagged with the database ``data_version`` and the docs
+    index hash they were computed against; a lookup under a different
+    version treats the entry as stale and drops it.
+    """
+
+    def __init__(self, path: str = DEFAULT_ANSWER_CACHE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                signature TEXT NOT NULL,
+                data_version TEXT NOT NULL,
+                docs_hash TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, signature: Dict[str, Any], data_version: str,
+            docs_hash: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result for signature if still valid."""
+        key = signature_key(signature)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data_version, docs_hash, result FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if row[0] != data_version or row[1] != docs_hash:
+                self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                self._conn.commit()
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[2])
+
+    def put(self, signature: Dict[str, Any], data_version: str,
+            docs_hash: str, result: Dict[str, Any]) -> bool:
+        """Store a result; returns False if it is not JSON-serializable."""
+        try:
+            payload = json.dumps(result)
+        except (TypeError, ValueError):
+            return False
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers "
+                "(key, signature, data_version, docs_hash, result, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (signature_key(signature), json.dumps(signature, sort_keys=True),
+                 data_version, docs_hash, payload, time.time())
+            )
+            self._conn.commit()
+        return True
+
+    def clear(self):
+        """Remove all cached answers."""
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process."""
+        lookups = self.hits + self.misses
+        return {
+            "path": str(self.path),
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations
+        }
+
+    def close(self):
+        """Close the underlying connection."""
+        with self._lock:
+            self._conn.close()
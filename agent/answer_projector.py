@@ -0,0 +1,111 @@
+"""Deterministic projection of SQL results onto a format_hint.
+
+When the SQL result already has the shape the question asks for (one
+scalar for ``int``/``float``, rows mapping onto ``{...}`` or
+``list[{...}]``), the answer can be built without a synthesizer LLM call.
+Anything ambiguous returns ``None`` so the caller falls back to the LLM.
+"""
+from typing import Any, List, Optional, Sequence, Tuple
+
+from agent.format_hints import compile_format_hint
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def coerce_value(value: Any, type_name: str) -> Tuple[bool, Any]:
+    """Strictly coerce one SQL value to a hint type, rounding floats to 2 decimals."""
+    if value is None:
+        return False, None
+    if type_name == "str":
+        if _is_number(value):
+            return False, None
+        return True, str(value)
+    if not _is_number(value):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False, None
+    if type_name == "int":
+        if abs(value - round(value)) > 1e-6:
+            return False, None
+        return True, int(round(value))
+    return True, round(float(value), 2)
+
+
+def _map_columns(columns: Sequence[str], fields: List[Tuple[str, str]],
+                 row: Sequence[Any]) -> Optional[List[int]]:
+    """Map each field to a column index by name, else by compatible position.
+
+    Positional mapping needs at least one field named by a column, and a
+    ``str`` field must sit on the column of the same name: a name column
+    in the right place but for the wrong entity (customers for
+    ``product``) would otherwise pass unnoticed.
+    """
+    if len(columns) != len(fields):
+        return None
+
+    lowered = [c.lower() for c in columns]
+    names = [name.lower() for name, _ in fields]
+    by_name = []
+    for name in names:
+        if name not in lowered:
+            break
+        by_name.append(lowered.index(name))
+    else:
+        if len(set(by_name)) == len(fields):
+            return by_name
+
+    if not set(names) & set(lowered):
+        return None
+    positional = list(range(len(fields)))
+    for idx, name, (_, type_name) in zip(positional, names, fields):
+        column = lowered[idx]
+        if column != name and (type_name == "str" or column in names):
+            return None
+        if not coerce_value(row[idx], type_name)[0]:
+            return None
+    return positional
+
+
+def _project_row(fields, row, mapping) -> Optional[dict]:
+    obj = {}
+    for (name, type_name), idx in zip(fields, mapping):
+        ok, value = coerce_value(row[idx], type_name)
+        if not ok:
+            return None
+        obj[name] = value
+    return obj
+
+
+def project_result(columns: Sequence[str], rows: Sequence[Sequence[Any]],
+                   format_hint: str) -> Optional[Any]:
+    """Project SQL rows onto format_hint, or return None when ambiguous."""
+    spec = compile_format_hint(format_hint)
+    if spec.kind == "text" or not rows or not columns:
+        return None
+
+    if spec.kind == "scalar":
+        if len(rows) != 1 or len(columns) != 1:
+            return None
+        ok, value = coerce_value(rows[0][0], spec.scalar_type)
+        return value if ok else None
+
+    detail = list(spec.fields)
+    mapping = _map_columns(columns, detail, rows[0])
+    if mapping is None:
+        return None
+
+    if spec.kind == "object":
+        if len(rows) != 1:
+            return None
+        return _project_row(detail, rows[0], mapping)
+
+    projected = []
+    for row in rows:
+        obj = _project_row(detail, row, mapping)
+        if obj is None:
+            return None
+        projected.append(obj)
+    return projected
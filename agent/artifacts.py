@@ -0,0 +1,184 @@
+"""Versioned store of optimized DSPy programs.
+
+Layout::
+
+    artifacts/
+        LATEST              # name of the current version, e.g. "v3"
+        v3/
+            manifest.json   # per-module file, signature fingerprint, metrics
+            nl_to_sql.json  # dspy Module.save() output
+
+Each save writes a new version carrying forward modules it did not
+replace. Loading is lazy and per-module: a program is only read when the
+agent first calls that module, and is skipped (falling back to the
+unoptimized module) if its signature no longer matches the code or it was
+optimized under a different decoding mode (cot / predict / short).
+"""
+import hashlib
+import json
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import dspy
+
+from agent.dspy_signatures import (
+    Router, Planner, NLToSQL, SQLRepairer, Synthesizer,
+    RouterSignature, PlannerSignature, NLToSQLSignature,
+    SQLRepairSignature, SynthesizerSignature
+)
+
+
+DEFAULT_ARTIFACTS_DIR = "artifacts"
+MANIFEST = "manifest.json"
+LATEST = "LATEST"
+
+MODULES: Dict[str, Tuple[type, type]] = {
+    "router": (Router, RouterSignature),
+    "planner": (Planner, PlannerSignature),
+    "nl_to_sql": (NLToSQL, NLToSQLSignature),
+    "sql_repairer": (SQLRepairer, SQLRepairSignature),
+    "synthesizer": (Synthesizer, SynthesizerSignature),
+}
+
+
+def signature_fingerprint(signature: type) -> str:
+    """Hash of a signature's instructions and field names."""
+    payload = json.dumps({
+        "instructions": " ".join((signature.__doc__ or "").split()),
+        "inputs": list(signature.input_fields),
+        "outputs": list(signature.output_fields)
+    })
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class ArtifactStore:
+    """Save and lazily load optimized modules from a versioned directory."""
+
+    def __init__(self, root: str = DEFAULT_ARTIFACTS_DIR, version: Optional[str] = None):
+        self.root = Path(root)
+        self.version = version or self.latest_version()
+        self.load_report: Dict[str, Dict[str, Any]] = {}
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def latest_version(self) -> Optional[str]:
+        pointer = self.root / LATEST
+        if pointer.exists():
+            return pointer.read_text().strip() or None
+        versions = sorted(self._version_numbers())
+        return f"v{versions[-1]}" if versions else None
+
+    def _version_numbers(self):
+        if not self.root.exists():
+            return []
+        return [
+            int(p.name[1:]) for p in self.root.iterdir()
+            if p.is_dir() and p.name.startswith("v") and p.name[1:].isdigit()
+        ]
+
+    def manifest(self) -> Dict[str, Any]:
+        """The selected version's manifest (empty when there are no artifacts)."""
+        if self._manifest is None:
+            path = self.root / str(self.version) / MANIFEST
+            self._manifest = json.loads(path.read_text()) if self.version and path.exists() else {}
+        return self._manifest
+
+    def save(self, modules: Dict[str, dspy.Module], metrics: Dict[str, Any] = None) -> str:
+        """Write a new version containing modules plus any not replaced from the latest."""
+        base = self.latest_version()
+        base_manifest = ArtifactStore(str(self.root), base).manifest() if base else {}
+        version = f"v{max(self._version_numbers(), default=0) + 1}"
+        out_dir = self.root / version
+        out_dir.mkdir(parents=True)
+
+        entries = {}
+        for name, entry in base_manifest.get("modules", {}).items():
+            if name not in modules:
+                shutil.copyfile(self.root / base / entry["file"], out_dir / entry["file"])
+                entries[name] = entry
+        for name, module in modules.items():
+            if name not in MODULES:
+                raise ValueError(f"unknown module {name!r}; expected one of {sorted(MODULES)}")
+            file_name = f"{name}.json"
+            module.save(str(out_dir / file_name))
+            entries[name] = {
+                "file": file_name,
+                "signature": MODULES[name][1].__name__,
+                "signature_fingerprint": signature_fingerprint(MODULES[name][1]),
+                "mode": getattr(module, "mode", "cot"),
+                "demos": sum(len(p.demos) for _, p in module.named_predictors()),
+                "metrics": (metrics or {}).get(name, {})
+            }
+
+        manifest = {
+            "version": version,
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "dspy_version": getattr(dspy, "__version__", "unknown"),
+            "parent": base,
+            "modules": entries
+        }
+        (out_dir / MANIFEST).write_text(json.dumps(manifest, indent=2))
+        (self.root / LATEST).write_text(version)
+        self.version = version
+        self._manifest = manifest
+        return version
+
+    def load(self, name: str, mode: str = None) -> dspy.Module:
+        """Build module name, loading its saved program when present and compatible."""
+        module_cls, signature = MODULES[name]
+        module = module_cls(mode)
+        start = time.perf_counter()
+        entry = self.manifest().get("modules", {}).get(name)
+
+        if entry is None:
+            status = "missing"
+        elif entry.get("signature_fingerprint") != signature_fingerprint(signature):
+            status = "signature_mismatch"
+        elif entry.get("mode", "cot") != module.mode:
+            # Demos and parameter names differ between cot and predict programs.
+            status = "mode_mismatch"
+        else:
+            try:
+                module.load(str(self.root / self.version / entry["file"]))
+                status = "loaded"
+            except Exception as e:
+                module = module_cls(mode)
+                status = f"error: {e}"
+
+        with self._lock:
+            self.load_report[name] = {
+                "version": self.version if entry is not None else None,
+                "status": status,
+                "mode": module.mode,
+                "demos": sum(len(p.demos) for _, p in module.named_predictors()),
+                "load_ms": round((time.perf_counter() - start) * 1000, 3)
+            }
+        return module
+
+
+class LazyModule:
+    """Defer building a module until it is first called or inspected."""
+
+    def __init__(self, factory: Callable[[], dspy.Module]):
+        self.factory = factory
+        self.module = None
+        self._lock = threading.Lock()
+
+    def _get(self) -> dspy.Module:
+        if self.module is None:
+            with self._lock:
+                if self.module is None:
+                    self.module = self.factory()
+        return self.module
+
+    def __call__(self, *args, **kwargs):
+        return self._get()(*args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        if name in ("module", "factory", "_lock"):
+            raise AttributeError(name)
+        return getattr(self._get(), name)
@@ -0,0 +1,153 @@
+"""Token budgets for the SQL results and document context sent to the LLM.
+
+SQL results are rendered as compact CSV (or a markdown table) instead of
+indented JSON; when rows have to be dropped, per-column stats summarize
+what was cut. Retrieved chunks are de-duplicated and truncated to fit.
+Token counts use ``estimate_tokens``, so no tokenizer download is needed.
+"""
+import csv
+import io
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence, Tuple
+
+from agent.profiling import estimate_tokens
+
+
+RESULT_FORMATS = ("csv", "markdown")
+# Below this many tokens a truncated chunk carries too little to be worth sending.
+MIN_CHUNK_TOKENS = 16
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:.4f}".rstrip("0").rstrip(".")
+    return str(value)
+
+
+def column_stats(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> List[str]:
+    """One line per column: min/max/sum/mean for numbers, distinct count otherwise."""
+    lines = []
+    for idx, name in enumerate(columns):
+        values = [row[idx] for row in rows if row[idx] is not None]
+        numbers = [v for v in values if _is_number(v)]
+        if numbers and len(numbers) == len(values):
+            lines.append(
+                f"{name}: min={_cell(min(numbers))} max={_cell(max(numbers))} "
+                f"sum={_cell(float(sum(numbers)))} mean={_cell(sum(numbers) / len(numbers))}"
+            )
+        else:
+            lines.append(f"{name}: {len(set(map(str, values)))} distinct")
+    return lines
+
+
+def render_rows(columns: Sequence[str], rows: Sequence[Sequence[Any]], fmt: str = "csv") -> str:
+    """Render rows as CSV or a markdown table."""
+    if fmt == "markdown":
+        lines = ["| " + " | ".join(columns) + " |", "|" + "---|" * len(columns)]
+        lines += ["| " + " | ".join(_cell(v) for v in row) + " |" for row in rows]
+        return "\n".join(lines)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    writer.writerows([[_cell(v) for v in row] for row in rows])
+    return buffer.getvalue().rstrip("\n")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def _truncate_words(text: str, max_tokens: int) -> str:
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(" ".join(words[:mid])) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return " ".join(words[:low]) + " ..."
+
+
+@dataclass
+class ContextBudgeter:
+    """Fit SQL results and retrieved chunks into a token budget.
+
+    ``max_context_tokens`` covers both parts. When a question also needs
+    SQL, results get ``sql_share`` of it and chunks the rest; document-only
+    questions give chunks the whole budget.
+    """
+    max_context_tokens: int = 1200
+    sql_share: float = 0.6
+    max_rows: int = 50
+    result_format: str = "csv"
+
+    def __post_init__(self):
+        if self.result_format not in RESULT_FORMATS:
+            raise ValueError(f"result_format must be one of {RESULT_FORMATS}, got {self.result_format!r}")
+
+    def render_sql_results(self, columns: Sequence[str], rows: Sequence[Sequence[Any]],
+                           budget: int = None) -> Tuple[str, Dict[str, int]]:
+        """Compact rendering of a result set, dropping rows beyond the budget."""
+        if not rows:
+            return "", {"pre_tokens": 0, "post_tokens": 0, "rows_kept": 0, "rows_total": 0}
+        budget = budget if budget is not None else int(self.max_context_tokens * self.sql_share)
+        pre = estimate_tokens(json.dumps({"columns": list(columns), "rows": [list(r) for r in rows]},
+                                         indent=2, default=str))
+
+        keep = min(len(rows), self.max_rows)
+        while True:
+            text = render_rows(columns, rows[:keep], self.result_format)
+            if keep < len(rows):
+                text += (f"\n({keep} of {len(rows)} rows shown; all-row stats)\n"
+                         + "\n".join(column_stats(columns, rows)))
+            tokens = estimate_tokens(text)
+            if tokens <= budget or keep <= 1:
+                break
+            keep = max(1, min(keep - 1, int(keep * budget / tokens)))
+
+        return text, {"pre_tokens": pre, "post_tokens": tokens, "rows_kept": keep, "rows_total": len(rows)}
+
+    def chunk_budget(self, needs_sql: bool) -> int:
+        if not needs_sql:
+            return self.max_context_tokens
+        return self.max_context_tokens - int(self.max_context_tokens * self.sql_share)
+
+    def compact_chunks(self, chunks: Sequence[Tuple[str, str]], budget: int = None
+                       ) -> Tuple[str, List[str], Dict[str, int]]:
+        """De-duplicate and truncate (chunk_id, content) pairs to fit the budget.
+
+        Returns the rendered context, the ids that made it in and a token report.
+        """
+        budget = budget if budget is not None else self.max_context_tokens
+        pre = estimate_tokens("\n\n".join(f"[{cid}] {content}" for cid, content in chunks))
+
+        parts, kept, seen = [], [], []
+        remaining = budget
+        for chunk_id, content in chunks:
+            normalized = _normalize(content)
+            if not normalized or any(normalized in prior for prior in seen):
+                continue
+            seen.append(normalized)
+            text = f"[{chunk_id}] {content}"
+            tokens = estimate_tokens(text)
+            if tokens > remaining:
+                if remaining < MIN_CHUNK_TOKENS:
+                    break
+                text = _truncate_words(text, remaining - estimate_tokens(" ..."))
+                tokens = estimate_tokens(text)
+            parts.append(text)
+            kept.append(chunk_id)
+            remaining -= tokens
+
+        context = "\n\n".join(parts)
+        return context, kept, {"pre_tokens": pre, "post_tokens": estimate_tokens(context),
+                               "chunks_kept": len(kept), "chunks_total": len(chunks)}
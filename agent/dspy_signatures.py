@@ -1,5 +1,20 @@
 import dspy
-from typing import List, Dict, Any, Literal
+from typing import List, Dict, Any, Literal, Tuple
+
+
+# How each module decodes:
+#   cot     ChainOfThought: a free-text rationale before the outputs
+#   predict Predict: outputs only
+#   short   Predict on the module's essential outputs, with max_tokens and
+#           stop caps so the model stops right after the answer
+MODULE_MODES = ("cot", "predict", "short")
+DEFAULT_MODULE_MODES = {
+    "router": "short",
+    "planner": "cot",
+    "nl_to_sql": "cot",
+    "sql_repairer": "predict",
+    "synthesizer": "cot",
+}
 
 
 class RouterSignature(dspy.Signature):
@@ -49,57 +64,123 @@ class SynthesizerSignature(dspy.Signature):
     confidence = dspy.OutputField(desc="Confidence score 0.0-1.0")
 
 
-class Router(dspy.Module):
-    """Router module to classify questions."""
+def parse_module_modes(spec: str) -> Dict[str, str]:
+    """Parse "router=short,synthesizer=predict" (or "all=cot") into per-module modes."""
+    modes = dict(DEFAULT_MODULE_MODES)
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, mode = item.partition("=")
+        name, mode = name.strip(), mode.strip()
+        if mode not in MODULE_MODES:
+            raise ValueError(f"mode for {name!r} must be one of {MODULE_MODES}, got {mode!r}")
+        if name == "all":
+            modes = {module: mode for module in modes}
+        elif name in modes:
+            modes[name] = mode
+        else:
+            raise ValueError(f"unknown module {name!r}; expected one of {sorted(modes)} or 'all'")
+    return modes
+
+
+class ModeModule(dspy.Module):
+    """Base for agent modules whose decoding mode is configurable.
+
+    Subclasses set ``name``, ``signature`` and the short-mode caps:
+    ``short_outputs`` (outputs kept; others are dropped from the signature
+    and read back as ""), ``short_max_tokens`` and ``short_stop``.
+    """
+    name = ""
+    signature = None
+    short_outputs: Tuple[str, ...] = ()
+    short_max_tokens = 256
+    short_stop: Tuple[str, ...] = ()
     
-    def __init__(self):
+    def __init__(self, mode: str = None):
         super().__init__()
-        self.predict = dspy.ChainOfThought(RouterSignature)
+        self.mode = mode or DEFAULT_MODULE_MODES[self.name]
+        if self.mode not in MODULE_MODES:
+            raise ValueError(f"mode must be one of {MODULE_MODES}, got {self.mode!r}")
+        self.lm_config: Dict[str, Any] = {}
+        if self.mode == "cot":
+            self.predict = dspy.ChainOfThought(self.signature)
+        elif self.mode == "predict":
+            self.predict = dspy.Predict(self.signature)
+        else:
+            self.predict = dspy.Predict(self._short_signature())
+            self.lm_config = {"max_tokens": self.short_max_tokens}
+            if self.short_stop:
+                self.lm_config["stop"] = list(self.short_stop)
+    
+    def _short_signature(self):
+        signature = self.signature
+        if not self.short_outputs or not hasattr(signature, "delete"):
+            return signature
+        for field in list(signature.output_fields):
+            if field not in self.short_outputs:
+                signature = signature.delete(field)
+        return signature
+    
+    def _call(self, config: Dict[str, Any] = None, **inputs) -> dspy.Prediction:
+        """Run the predictor with the mode's LM caps (config overrides them)."""
+        prediction = self.predict(**inputs, config={**self.lm_config, **(config or {})})
+        for field in self.signature.output_fields:
+            if field not in prediction:
+                prediction[field] = ""
+        return prediction
+
+
+class Router(ModeModule):
+    """Router module to classify questions."""
+    name = "router"
+    signature = RouterSignature
+    short_outputs = ("route",)
+    short_max_tokens = 16
+    short_stop = ("\n\n",)
     
     def forward(self, question: str) -> dspy.Prediction:
         """Route the question."""
-        return self.predict(question=question)
+        return self._call(question=question)
 
 
-class Planner(dspy.Module):
+class Planner(ModeModule):
     """Planner module to extract constraints."""
-    
-    def __init__(self):
-        super().__init__()
-        self.predict = dspy.ChainOfThought(PlannerSignature)
+    name = "planner"
+    signature = PlannerSignature
+    short_max_tokens = 200
     
     def forward(self, question: str, context: str) -> dspy.Prediction:
         """Extract constraints from question and context."""
-        return self.predict(question=question, context=context)
+        return self._call(question=question, context=context)
 
 
-class NLToSQL(dspy.Module):
+class NLToSQL(ModeModule):
     """Natural language to SQL module."""
+    name = "nl_to_sql"
+    signature = NLToSQLSignature
+    short_outputs = ("sql_query",)
+    short_max_tokens = 300
     
-    def __init__(self):
-        super().__init__()
-        self.predict = dspy.ChainOfThought(NLToSQLSignature)
-    
-    def forward(self, question: str, schema: str, constraints: str) -> dspy.Prediction:
-        """Generate SQL query."""
-        return self.predict(
+    def forward(self, question: str, schema: str, constraints: str,
+                config: Dict[str, Any] = None) -> dspy.Prediction:
+        """Generate SQL query; config overrides LM kwargs such as temperature."""
+        return self._call(
+            config,
             question=question,
             schema=schema,
             constraints=constraints
         )
 
 
-class SQLRepairer(dspy.Module):
+class SQLRepairer(ModeModule):
     """SQL repair module."""
-    
-    def __init__(self):
-        super().__init__()
-        self.predict = dspy.ChainOfThought(SQLRepairSignature)
+    name = "sql_repairer"
+    signature = SQLRepairSignature
+    short_outputs = ("repaired_query",)
+    short_max_tokens = 300
     
     def forward(self, original_query: str, error_message: str, 
                 schema: str, question: str) -> dspy.Prediction:
         """Repair failed SQL query."""
-        return self.predict(
+        return self._call(
             original_query=original_query,
             error_message=error_message,
             schema=schema,
@@ -107,17 +188,16 @@ class SQLRepairer(dspy.Module):
         )
 
 
-class Synthesizer(dspy.Module):
+class Synthesizer(ModeModule):
     """Answer synthesis module."""
-    
-    def __init__(self):
-        super().__init__()
-        self.predict = dspy.ChainOfThought(SynthesizerSignature)
+    name = "synthesizer"
+    signature = SynthesizerSignature
+    short_max_tokens = 200
     
     def forward(self, question: str, format_hint: str, 
                 sql_results: str, rag_context: str) -> dspy.Prediction:
         """Synthesize final answer."""
-        return self.predict(
+        return self._call(
             question=question,
             format_hint=format_hint,
             sql_results=sql_results,
@@ -130,36 +210,48 @@ def router_accuracy(example, pred, trace=None):
     return example.route.lower() == pred.route.lower()
 
 
-def sql_validity(example, pred, trace=None):
-    """Metric for SQL validity (simplified)."""
-    sql = pred.sql_query.strip()
+def sql_validity(example, pred, trace=None, executor=None, gold_store=None):
+    """Metric for SQL validity.
+
+    On its own only the form is checked: a single SELECT (or WITH) statement.
+    With an ``agent.evaluation.CachedSQLExecutor`` the query must also run,
+    and with a ``GoldResultStore`` its result must match the gold result of
+    ``example.sql_query`` under ``agent.evaluation.results_match``.
+    """
+    from agent.evaluation import results_match
+    from agent.graph_hybrid import strip_sql_fences
+    sql = strip_sql_fences(pred.sql_query)
     if not sql:
         return 0.0
-    if not sql.upper().startswith('SELECT'):
+    if not sql.upper().startswith(('SELECT', 'WITH')):
         return 0.0
-    if ';' in sql[:-1]:  
+    if ';' in sql[:-1]:
         return 0.0
-    return 1.0
+    if executor is None:
+        return 1.0
+    
+    gold = None
+    if gold_store is not None:
+        gold = gold_store.get(example.sql_query)
+        if gold is None:
+            return 0.0
+    success, data, cols, err = executor.execute(sql)
+    if not success:
+        return 0.0
+    if gold is None:
+        return 1.0
+    return 1.0 if results_match(gold, data) else 0.0
 
 
 def format_adherence(example, pred, trace=None):
     """Metric for format adherence."""
-    import json
-    format_hint = example.format_hint
-    answer = pred.final_answer
+    from agent.format_hints import compile_format_hint
+    spec = compile_format_hint(example.format_hint)
+    if spec.kind == "text":
+        return 0.5
     
     try:
-        if format_hint == "int":
-            int(answer)
-            return 1.0
-        elif format_hint == "float":
-            float(answer)
-            return 1.0
-        elif format_hint.startswith("{") or format_hint.startswith("list["):
-
-            json.loads(answer if isinstance(answer, str) else json.dumps(answer))
-            return 1.0
-    except:
+        answer = spec.parse(pred.final_answer)
+    except Exception:
         return 0.0
-    
-    return 0.5
+    return 1.0 if spec.is_valid(answer) else 0.0
@@ -0,0 +1,299 @@
+"""Parallel, cached and resumable evaluation helpers for DSPy optimization.
+
+``CachedSQLExecutor`` memoizes query results so repeated metric calls on
+the same predicted SQL hit the database once. ``GoldResultStore`` keeps a
+fingerprint of each gold query's result on disk so execution accuracy
+only needs the predicted query to run. ``Checkpoint`` persists
+per-item results of each optimization stage to a JSON file, and
+``run_stage`` maps a function over items on a thread pool, skipping items
+the checkpoint already holds so an interrupted run resumes where it
+stopped.
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from agent.sql_candidates import result_fingerprint
+from tools.sqlite_tool import SQLiteTool
+
+
+DEFAULT_CHECKPOINT_PATH = ".cache/optimize_checkpoint.json"
+DEFAULT_GOLD_PATH = ".cache/gold_results.json"
+# Gold rows are kept for tolerant comparison only when the result is this small.
+GOLD_MAX_ROWS = 1000
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace and trailing semicolons so trivially equal queries share a key."""
+    return " ".join(sql.strip().rstrip(";").split())
+
+
+class CachedSQLExecutor:
+    """Thread-safe read-only executor that memoizes results per normalized query."""
+
+    def __init__(self, db_tool: SQLiteTool, timeout_s: float = 10.0):
+        self.db_tool = db_tool
+        self.timeout_s = timeout_s
+        self.hits = 0
+        self.misses = 0
+        self._results: Dict[str, Tuple[bool, List[tuple], List[str], str]] = {}
+        self._lock = threading.Lock()
+
+    def execute(self, sql: str) -> Tuple[bool, List[tuple], List[str], str]:
+        """Return (success, rows, columns, error), executing each distinct query once."""
+        key = normalize_sql(sql)
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            self.misses += 1
+        result = self.db_tool.execute_readonly(sql, timeout_s=self.timeout_s)
+        with self._lock:
+            self._results[key] = result
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._results),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+def _value_kind(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return "num"
+    return "text"
+
+
+def _sort_key(value: Any, precision: int) -> Tuple[str, str]:
+    if isinstance(value, float):
+        value = round(value, precision)
+    return _value_kind(value), json.dumps(value, default=str)
+
+
+def _canonical_row(row: Sequence[Any], precision: int = 2) -> List[Any]:
+    """Order a row's values by kind and rounded value so column order does not matter."""
+    return sorted(row, key=lambda v: _sort_key(v, precision))
+
+
+def result_shape(rows: Sequence[Sequence[Any]]) -> Dict[str, Any]:
+    """Row count, column count and sorted value kinds of the first row."""
+    return {
+        "rows": len(rows),
+        "columns": len(rows[0]) if rows else 0,
+        "kinds": sorted(_value_kind(v) for v in rows[0]) if rows else []
+    }
+
+
+def gold_fingerprint(rows: Sequence[Sequence[Any]], precision: int = 2) -> Dict[str, Any]:
+    """Order-insensitive hash (rows and columns) plus shape of a result set."""
+    canonical = [_canonical_row(row, precision) for row in rows]
+    entry = {
+        "hash": result_fingerprint(canonical, precision=precision),
+        "shape": result_shape(rows)
+    }
+    if len(rows) <= GOLD_MAX_ROWS:
+        entry["rows"] = sorted(canonical, key=lambda row: [_sort_key(v, precision) for v in row])
+    return entry
+
+
+def _values_close(a: Any, b: Any, rel_tol: float, abs_tol: float) -> bool:
+    if _value_kind(a) == "num" and _value_kind(b) == "num":
+        return math.isclose(a, b, rel_tol=rel_tol, abs_tol=abs_tol)
+    return a == b
+
+
+def results_match(gold: Dict[str, Any], rows: Sequence[Sequence[Any]],
+                  rel_tol: float = 1e-4, abs_tol: float = 0.01) -> bool:
+    """Compare a result set to a gold fingerprint, ignoring order, within float tolerance."""
+    predicted = gold_fingerprint(rows)
+    if predicted["shape"] != gold["shape"]:
+        return False
+    if predicted["hash"] == gold["hash"]:
+        return True
+    if "rows" not in gold or "rows" not in predicted:
+        return False
+    # Hashes round floats, so values straddling a rounding boundary land here.
+    # Rows are matched as a multiset: sorting alone can pair them up wrongly.
+    unmatched = list(gold["rows"])
+    for row in predicted["rows"]:
+        for idx, candidate in enumerate(unmatched):
+            if len(candidate) == len(row) and all(
+                _values_close(x, y, rel_tol, abs_tol) for x, y in zip(candidate, row)
+            ):
+                del unmatched[idx]
+                break
+        else:
+            return False
+    return True
+
+
+class GoldResultStore:
+    """Gold result fingerprints keyed by normalized gold SQL and database version."""
+
+    def __init__(self, path: Optional[str], executor: CachedSQLExecutor):
+        self.path = Path(path) if path else None
+        self.executor = executor
+        self.data_version = executor.db_tool.get_data_version()
+        self.computed = 0
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            try:
+                self._entries = json.loads(self.path.read_text())
+            except ValueError:
+                self._entries = {}
+
+    def _key(self, sql: str) -> str:
+        payload = f"{self.data_version}\n{normalize_sql(sql)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+    def get(self, sql: str) -> Optional[Dict[str, Any]]:
+        """Fingerprint of the gold query's result, computing and storing it on first use."""
+        key = self._key(sql)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+
+        success, rows, _, error = self.executor.execute(sql)
+        if not success:
+            return None
+        entry = gold_fingerprint(rows)
+        with self._lock:
+            self._entries[key] = entry
+            self.computed += 1
+            self._write()
+        return entry
+
+    def precompute(self, sqls: Sequence[str]) -> int:
+        """Fingerprint every gold query up front; returns how many failed to execute."""
+        return sum(1 for sql in sqls if self.get(sql) is None)
+
+    def _write(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self._entries, default=str))
+        os.replace(tmp, self.path)
+
+
+def config_fingerprint(config: Dict[str, Any]) -> str:
+    """Stable hash of the settings a checkpoint is only valid for."""
+    payload = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class Checkpoint:
+    """JSON file of per-stage, per-item results, rewritten atomically on each record."""
+
+    def __init__(self, path: Optional[str], config: Dict[str, Any]):
+        self.path = Path(path) if path else None
+        self.fingerprint = config_fingerprint(config)
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.resumed = False
+        self._lock = threading.Lock()
+
+        if self.path is not None and self.path.exists():
+            try:
+                data = json.loads(self.path.read_text())
+            except ValueError:
+                data = {}
+            if data.get("fingerprint") == self.fingerprint:
+                self.stages = data.get("stages", {})
+                self.resumed = bool(self.stages)
+
+    def get(self, stage: str, key: str) -> Optional[Any]:
+        with self._lock:
+            return self.stages.get(stage, {}).get(key)
+
+    def record(self, stage: str, key: str, value: Any):
+        with self._lock:
+            self.stages.setdefault(stage, {})[key] = value
+            self._write()
+
+    def completed(self, stage: str) -> int:
+        with self._lock:
+            return len(self.stages.get(stage, {}))
+
+    def _write(self):
+        """Write to a temp file and rename so a kill never leaves partial JSON (lock held)."""
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps({"fingerprint": self.fingerprint, "stages": self.stages},
+                                  indent=2, default=str))
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        with self._lock:
+            self.stages = {}
+            if self.path is not None and self.path.exists():
+                self.path.unlink()
+
+
+def run_stage(stage: str, items: Sequence[Any], fn: Callable[[Any], Dict[str, Any]],
+              checkpoint: Checkpoint, workers: int = 4,
+              on_result: Callable[[int, Dict[str, Any], bool], None] = None) -> List[Dict[str, Any]]:
+    """Run fn over items on a thread pool, recording each result in the checkpoint.
+
+    fn must return a JSON-serializable dict; ``latency_ms`` is added here.
+    on_result(index, result, from_checkpoint) is called as results arrive.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    pending = []
+    for idx in range(len(items)):
+        saved = checkpoint.get(stage, str(idx))
+        if saved is not None:
+            results[idx] = saved
+            if on_result:
+                on_result(idx, saved, True)
+        else:
+            pending.append(idx)
+
+    def timed(idx: int) -> Dict[str, Any]:
+        start = time.perf_counter()
+        result = fn(items[idx])
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(timed, idx): idx for idx in pending}
+        for future in as_completed(futures):
+            idx = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"score": 0.0, "error": str(e), "latency_ms": 0.0}
+            results[idx] = result
+            checkpoint.record(stage, str(idx), result)
+            if on_result:
+                on_result(idx, result, False)
+
+    return results
+
+
+def latency_summary(results: Sequence[Dict[str, Any]]) -> Dict[str, float]:
+    """Mean/p50/p95 of per-item latency_ms."""
+    latencies = sorted(r.get("latency_ms", 0.0) for r in results)
+    if not latencies:
+        return {"mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0}
+    return {
+        "mean_ms": sum(latencies) / len(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    }
@@ -0,0 +1,195 @@
+"""Compiled format_hint specs: parse, coerce and validate typed answers.
+
+Hints such as ``int``, ``{category:str, quantity:int}`` or
+``list[{product:str, revenue:float}]`` are compiled once per distinct
+string and memoized, so the agent, the projector and ``verify_output``
+share one cheap validator.
+"""
+import ast
+import json
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
+
+
+SCALAR_TYPES = ("int", "float", "str")
+
+_OBJECT_RE = re.compile(r"^\{(.*)\}$")
+_LIST_RE = re.compile(r"^list\[(.*)\]$")
+_INT_RE = re.compile(r"-?\d[\d,]*")
+_FLOAT_RE = re.compile(r"-?\d[\d,]*\.?\d*")
+_JSON_RE = re.compile(r"(\{.*\}|\[.*\])", re.DOTALL)
+_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*\n?(.*?)\n?```\s*$", re.DOTALL)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _to_number(value: Any) -> Optional[float]:
+    if _is_number(value):
+        return value
+    if isinstance(value, str):
+        match = _FLOAT_RE.search(value)
+        if match:
+            try:
+                return float(match.group().replace(",", ""))
+            except ValueError:
+                return None
+    return None
+
+
+@dataclass(frozen=True)
+class FormatSpec:
+    """A compiled format hint."""
+    hint: str
+    kind: str
+    scalar_type: Optional[str] = None
+    fields: Tuple[Tuple[str, str], ...] = ()
+
+    def parse(self, answer: Any) -> Any:
+        """Parse raw LLM output into a value shaped like this spec."""
+        if not isinstance(answer, str):
+            return self.coerce(answer)
+
+        text = answer.strip()
+        fenced = _FENCE_RE.match(text)
+        if fenced:
+            text = fenced.group(1).strip()
+
+        if self.kind == "scalar" and self.scalar_type == "int":
+            match = _INT_RE.search(text)
+            return int(match.group().replace(",", "")) if match else 0
+        if self.kind == "scalar" and self.scalar_type == "float":
+            number = _to_number(text)
+            return round(float(number), 2) if number is not None else 0.0
+        if self.kind in ("object", "list"):
+            return self.coerce(_load_structured(text))
+        return text
+
+    def coerce(self, value: Any) -> Any:
+        """Best-effort coercion of an already-parsed value; leaves mismatches as-is."""
+        if self.kind == "scalar":
+            return _coerce_scalar(value, self.scalar_type)
+        if self.kind == "object":
+            if isinstance(value, list) and len(value) == 1 and isinstance(value[0], dict):
+                value = value[0]
+            return self._coerce_object(value)
+        if self.kind == "list":
+            if isinstance(value, dict):
+                value = [value]
+            if isinstance(value, list):
+                return [self._coerce_object(item) for item in value]
+        return value
+
+    def _coerce_object(self, value: Any) -> Any:
+        if not isinstance(value, dict):
+            return value
+        by_lower = {str(k).lower(): v for k, v in value.items()}
+        coerced = {}
+        for name, type_name in self.fields:
+            if name.lower() not in by_lower:
+                return value
+            coerced[name] = _coerce_scalar(by_lower[name.lower()], type_name)
+        return coerced
+
+    def validate(self, value: Any) -> List[str]:
+        """Return a list of validation errors (empty when valid)."""
+        if value is None:
+            return ["answer is missing"]
+        if self.kind == "scalar":
+            return _check_scalar(value, self.scalar_type, "answer")
+        if self.kind == "object":
+            return self._check_object(value, "answer")
+        if self.kind == "list":
+            if not isinstance(value, list):
+                return [f"expected list, got {type(value).__name__}"]
+            errors = []
+            for idx, item in enumerate(value):
+                errors.extend(self._check_object(item, f"answer[{idx}]"))
+            return errors
+        return []
+
+    def is_valid(self, value: Any) -> bool:
+        return not self.validate(value)
+
+    def _check_object(self, value: Any, path: str) -> List[str]:
+        if not isinstance(value, dict):
+            return [f"{path}: expected object, got {type(value).__name__}"]
+        errors = []
+        for name, type_name in self.fields:
+            if name not in value:
+                errors.append(f"{path}: missing key '{name}'")
+            else:
+                errors.extend(_check_scalar(value[name], type_name, f"{path}.{name}"))
+        extra = set(value) - {name for name, _ in self.fields}
+        if extra:
+            errors.append(f"{path}: unexpected keys {sorted(extra)}")
+        return errors
+
+
+def _coerce_scalar(value: Any, type_name: str) -> Any:
+    if type_name == "str":
+        return value if isinstance(value, str) else (str(value) if value is not None else value)
+    number = _to_number(value)
+    if number is None:
+        return value
+    if type_name == "int":
+        return int(round(number))
+    return round(float(number), 2)
+
+
+def _check_scalar(value: Any, type_name: str, path: str) -> List[str]:
+    if type_name == "int" and not (isinstance(value, int) and not isinstance(value, bool)):
+        return [f"{path}: expected int, got {type(value).__name__}"]
+    if type_name == "float" and not _is_number(value):
+        return [f"{path}: expected float, got {type(value).__name__}"]
+    if type_name == "str" and not isinstance(value, str):
+        return [f"{path}: expected str, got {type(value).__name__}"]
+    return []
+
+
+def _load_structured(text: str) -> Any:
+    """Load JSON (or a Python literal) from text, extracting the first {...}/[...] span."""
+    candidates = [text]
+    match = _JSON_RE.search(text)
+    if match and match.group(1) != text:
+        candidates.append(match.group(1))
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            pass
+        try:
+            return ast.literal_eval(candidate)
+        except (ValueError, SyntaxError):
+            pass
+    return text
+
+
+@lru_cache(maxsize=256)
+def compile_format_hint(format_hint: str) -> FormatSpec:
+    """Compile (and memoize) a format hint string into a FormatSpec."""
+    hint = re.sub(r"\s+", "", format_hint or "")
+    if hint in SCALAR_TYPES:
+        return FormatSpec(hint, "scalar", scalar_type=hint)
+
+    list_match = _LIST_RE.match(hint)
+    if list_match:
+        inner = compile_format_hint(list_match.group(1))
+        if inner.kind == "object":
+            return FormatSpec(hint, "list", fields=inner.fields)
+        return FormatSpec(hint, "text")
+
+    object_match = _OBJECT_RE.match(hint)
+    if object_match:
+        fields = []
+        for part in object_match.group(1).split(","):
+            name, _, type_name = part.partition(":")
+            if not name or type_name not in SCALAR_TYPES:
+                return FormatSpec(hint, "text")
+            fields.append((name, type_name))
+        return FormatSpec(hint, "object", fields=tuple(fields))
+
+    return FormatSpec(hint, "text")
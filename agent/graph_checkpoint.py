@@ -0,0 +1,233 @@
+"""Per-node checkpoints of agent graph runs, keyed by question id.
+
+After every graph node the store records what that node changed in the
+state. When a killed batch is restarted, the graph re-traverses the same
+path and each node already recorded returns its saved changes instead of
+running again, so router/planner/SQL LLM calls are not paid twice.
+Finished questions keep only their final result.
+
+State is stored as per-step deltas: only keys a node changed, lists that
+grew as their appended tail, and retrieved chunks by reference (their
+text is already in ``rag_context``), so SQL rows and chunk text are
+written once per question rather than once per node. Process-local
+timings (``TRANSIENT_KEYS``) are never stored and read as None after a
+resume.
+"""
+import contextvars
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from agent.profiling import current_span
+
+
+DEFAULT_GRAPH_CHECKPOINT_PATH = ".cache/graph_checkpoints.sqlite"
+APPEND = "__append__"
+# perf_counter readings only mean something in the process that took them.
+TRANSIENT_KEYS = ("sql_started_at",)
+
+_current_run: contextvars.ContextVar = contextvars.ContextVar("agent_checkpoint_run", default=None)
+
+
+def _fingerprint(value: Any) -> Any:
+    """Cheap change detector: lists by identity and length, everything else by value."""
+    if isinstance(value, list):
+        return ("list", id(value), len(value))
+    if isinstance(value, dict):
+        return ("dict", json.dumps(value, sort_keys=True, default=str))
+    return ("value", value)
+
+
+def _compact(key: str, value: Any) -> Any:
+    if key == "rag_chunks":
+        return [{k: v for k, v in chunk.items() if k != "content"} for chunk in value]
+    return value
+
+
+def state_delta(previous: Dict[str, Any], state: Dict[str, Any]) -> Dict[str, Any]:
+    """Keys that changed since previous fingerprints; grown lists as their new tail."""
+    delta = {}
+    for key, value in state.items():
+        if key in TRANSIENT_KEYS:
+            continue
+        before = previous.get(key)
+        after = _fingerprint(value)
+        if before == after:
+            continue
+        if before is not None and before[0] == "list" and after[0] == "list" \
+                and before[1] == after[1] and after[2] > before[2]:
+            delta[key] = {APPEND: value[before[2]:]}
+        else:
+            delta[key] = _compact(key, value)
+    return delta
+
+
+def apply_delta(state: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    for key, value in delta.items():
+        if isinstance(value, dict) and set(value) == {APPEND}:
+            state[key] = list(state.get(key) or []) + value[APPEND]
+        else:
+            state[key] = value
+    return state
+
+
+class CheckpointRun:
+    """Step counter and saved deltas for one question's graph run."""
+
+    def __init__(self, store: "GraphCheckpointStore", thread_id: str,
+                 saved: Dict[int, Dict[str, Any]]):
+        self.store = store
+        self.thread_id = thread_id
+        self.saved = saved
+        self.step = 0
+        self.resumed_steps = 0
+        self.fingerprints: Dict[str, Any] = {}
+
+    def run_node(self, name: str, fn: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 state: Dict[str, Any]) -> Dict[str, Any]:
+        step, self.step = self.step, self.step + 1
+        saved = self.saved.get(step)
+        if saved is not None and saved["node"] == name:
+            state = apply_delta(state, saved["delta"])
+            for key in TRANSIENT_KEYS:
+                if key in state:
+                    state[key] = None
+            self.resumed_steps += 1
+            span = current_span()
+            if span is not None:
+                span.incr("checkpoint_resumed")
+        else:
+            # Past the recorded prefix (or the path diverged): run and record.
+            self.saved = {s: v for s, v in self.saved.items() if s < step}
+            state = fn(state)
+            self.store.record(self.thread_id, step, name, state_delta(self.fingerprints, state))
+        self.fingerprints = {key: _fingerprint(value) for key, value in state.items()}
+        return state
+
+
+class GraphCheckpointStore:
+    """SQLite store of per-node state deltas and final results per question id."""
+
+    def __init__(self, path: str = DEFAULT_GRAPH_CHECKPOINT_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.resumed_questions = 0
+        self.resumed_steps = 0
+        self.completed_hits = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                thread_id TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                result TEXT,
+                updated REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS steps (
+                thread_id TEXT NOT NULL,
+                step INTEGER NOT NULL,
+                node TEXT NOT NULL,
+                delta TEXT NOT NULL,
+                PRIMARY KEY (thread_id, step)
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def fingerprint(**inputs: Any) -> str:
+        payload = json.dumps(inputs, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+    def begin(self, thread_id: str, fingerprint: str):
+        """Return (final result or None, CheckpointRun); stale checkpoints are discarded."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, result FROM runs WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+            if row is not None and row[0] != fingerprint:
+                self._conn.execute("DELETE FROM steps WHERE thread_id = ?", (thread_id,))
+                row = None
+            if row is not None and row[1] is not None:
+                self.completed_hits += 1
+                return json.loads(row[1]), None
+            saved = {
+                step: {"node": node, "delta": json.loads(delta)}
+                for step, node, delta in self._conn.execute(
+                    "SELECT step, node, delta FROM steps WHERE thread_id = ? ORDER BY step", (thread_id,)
+                )
+            }
+            self._conn.execute(
+                "INSERT OR REPLACE INTO runs (thread_id, fingerprint, result, updated) VALUES (?, ?, NULL, ?)",
+                (thread_id, fingerprint, time.time())
+            )
+            self._conn.commit()
+            if saved:
+                self.resumed_questions += 1
+        return None, CheckpointRun(self, thread_id, saved)
+
+    def record(self, thread_id: str, step: int, node: str, delta: Dict[str, Any]):
+        payload = json.dumps(delta, default=str)
+        with self._lock:
+            self._conn.execute("DELETE FROM steps WHERE thread_id = ? AND step >= ?", (thread_id, step))
+            self._conn.execute(
+                "INSERT INTO steps (thread_id, step, node, delta) VALUES (?, ?, ?, ?)",
+                (thread_id, step, node, payload)
+            )
+            self._conn.commit()
+
+    def finish(self, thread_id: str, result: Dict[str, Any], run: CheckpointRun = None):
+        """Keep only the final result for a completed question."""
+        payload = json.dumps(result, default=str)
+        with self._lock:
+            if run is not None:
+                self.resumed_steps += run.resumed_steps
+            self._conn.execute("DELETE FROM steps WHERE thread_id = ?", (thread_id,))
+            self._conn.execute(
+                "UPDATE runs SET result = ?, updated = ? WHERE thread_id = ?",
+                (payload, time.time(), thread_id)
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_progress = self._conn.execute("SELECT COUNT(*) FROM runs WHERE result IS NULL").fetchone()[0]
+            completed = self._conn.execute("SELECT COUNT(*) FROM runs WHERE result IS NOT NULL").fetchone()[0]
+        return {
+            "path": str(self.path),
+            "completed": completed,
+            "in_progress": in_progress,
+            "completed_hits": self.completed_hits,
+            "resumed_questions": self.resumed_questions,
+            "resumed_steps": self.resumed_steps
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def checkpointed(name: str, fn: Callable[[Dict[str, Any]], Dict[str, Any]]):
+    """Wrap a graph node so it is recorded/resumed when a checkpoint run is active."""
+    def wrapper(state):
+        run = _current_run.get()
+        if run is None:
+            return fn(state)
+        return run.run_node(name, fn, state)
+    return wrapper
+
+
+def activate(run: Optional[CheckpointRun]):
+    """Make run the active checkpoint run in this context; returns a reset token."""
+    return _current_run.set(run)
+
+
+def deactivate(token):
+    _current_run.reset(token)
@@ -1,15 +1,76 @@
-from typing import TypedDict, Annotated, List, Dict, Any, Literal
-from langgraph.graph import StateGraph, END
+from typing import TypedDict, Annotated, List, Dict, Any, Literal, Optional
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import dspy
+import hashlib
 import json
 import sys
+import threading
+import time
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).parent.parent))
 
-from agent.dspy_signatures import Router, Planner, NLToSQL, SQLRepairer, Synthesizer
-from rag.retrieval import TFIDFRetriever
-from tools.sqlite_tool import SQLiteTool
+from agent.dspy_signatures import (
+    Router, Planner, NLToSQL, SQLRepairer, Synthesizer, DEFAULT_MODULE_MODES
+)
+from agent.answer_cache import AnswerCache
+from agent.artifacts import ArtifactStore, LazyModule
+from agent.context_budget import ContextBudgeter
+from agent.answer_projector import project_result
+from agent.format_hints import compile_format_hint
+from agent.graph_checkpoint import GraphCheckpointStore, activate, checkpointed, deactivate
+from agent.lazy_imports import IMPORT_MS, lazy_import
+from agent.profiling import Profiler, ProfiledLM, ProfiledModule, current_span
+from agent.tracing import get_tracer, traced
+from agent.question_signature import QuestionNormalizer, asks_for_one, is_cacheable
+from agent.sql_candidates import (
+    SQLCandidate, candidate_errors, candidate_temperatures, select_candidate
+)
+from agent.sql_templates import SQLTemplateLibrary, render_sql
+from rag.retrieval import TFIDFRetriever, docs_fingerprint
+from tools.sharded_sqlite import ShardedSQLiteTool
+from tools.sql_rewrite import RewriteResult, SQLRewriter
+from tools.sqlite_tool import SQL_ENGINES, SQLiteTool
+
+
+TRACE_LEVELS = ("off", "summary", "full")
+SUMMARY_MAX_CHARS = 160
+SUMMARY_MAX_ITEMS = 5
+
+
+def payload_ref(value: Any) -> Dict[str, Any]:
+    """Size and short hash standing in for a large payload."""
+    text = value if isinstance(value, str) else json.dumps(value, default=str, sort_keys=True)
+    ref = {"sha1": hashlib.sha1(text.encode("utf-8")).hexdigest()[:12], "chars": len(text)}
+    if isinstance(value, (list, tuple)):
+        ref["items"] = len(value)
+    return ref
+
+
+def summarize_payload(value: Any) -> Any:
+    """Replace long strings and long lists with references, recursively."""
+    if isinstance(value, str):
+        return value if len(value) <= SUMMARY_MAX_CHARS else payload_ref(value)
+    if isinstance(value, dict):
+        return {k: summarize_payload(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        if len(value) > SUMMARY_MAX_ITEMS:
+            return payload_ref(value)
+        return [summarize_payload(v) for v in value]
+    return value
+
+
+def strip_sql_fences(sql: str) -> str:
+    """Remove markdown code fences around generated SQL."""
+    sql = sql.strip()
+    if sql.startswith("```sql"):
+        sql = sql[6:]
+    if sql.startswith("```"):
+        sql = sql[3:]
+    if sql.endswith("```"):
+        sql = sql[:-3]
+    return sql.strip()
 
 
 class AgentState(TypedDict):
@@ -21,49 +82,178 @@ class AgentState(TypedDict):
     rag_chunks: List[Dict[str, Any]]
     constraints: Dict[str, Any]
     sql_query: str
+    sql_params: List[Any]
+    sql_template: str
+    sql_started_at: Optional[float]
     sql_results: Any
     sql_columns: List[str]
     sql_error: str
+    sql_prefetched: bool
     final_answer: Any
     explanation: str
     confidence: float
     citations: List[str]
     repair_count: int
+    synthesis_attempts: int
+    validation_errors: List[str]
+    context_tokens: Dict[str, int]
     trace: List[Dict[str, Any]]
 
 
 class HybridAgent:
     """Hybrid RAG + SQL agent using LangGraph."""
     
-    def __init__(self, db_path: str, docs_dir: str, lm: dspy.LM):
-        """Initialize the agent."""
-        self.db_tool = SQLiteTool(db_path)
-        self.retriever = TFIDFRetriever(docs_dir)
+    def __init__(self, db_path: str, docs_dir: str, lm: dspy.LM,
+                 answer_cache: AnswerCache = None, use_sql_templates: bool = True,
+                 max_synthesis_retries: int = 1, profiler: Profiler = None,
+                 trace_level: str = "summary", sql_candidates: int = 1,
+                 sql_timeout_s: float = 5.0, artifacts: ArtifactStore = None,
+                 context_budget: ContextBudgeter = None, module_modes: Dict[str, str] = None,
+                 checkpoints: GraphCheckpointStore = None, shards: List[str] = None,
+                 shard_executor: str = "process", sql_engine: str = "sqlite",
+                 rewrite_sql: bool = True):
+        """Initialize the agent.
+
+        With ``shards`` (paths or name=path specs of databases sharing the
+        schema) queries fan out over all of them and db_path is ignored.
+        ``sql_engine`` "columnar" answers supported aggregate queries from
+        in-memory columnar arrays; "cross-check" also verifies each of those
+        answers against SQLite. With ``rewrite_sql`` every query is cleaned
+        up by tools/sql_rewrite.py before it is executed.
+        """
+        if sql_engine not in SQL_ENGINES:
+            raise ValueError(f"sql_engine must be one of {SQL_ENGINES}, got {sql_engine!r}")
+        if shards and sql_engine != "sqlite":
+            raise ValueError("the columnar engine does not support sharded databases")
+        self.startup_ms: Dict[str, float] = {}
+        started = time.perf_counter()
+        if shards:
+            self.db_tool = ShardedSQLiteTool(shards, executor=shard_executor)
+        elif sql_engine != "sqlite":
+            columnar = lazy_import("tools.columnar_engine")
+            self.db_tool = columnar.ColumnarSQLiteTool(db_path, cross_check=sql_engine == "cross-check")
+        else:
+            self.db_tool = SQLiteTool(db_path)
+        # The TF-IDF index and the compiled graph are built on first use.
+        self.docs_dir = docs_dir
+        self.docs_hash = docs_fingerprint(docs_dir)
+        self.lazy_init_ms: Dict[str, float] = {}
+        self._retriever = None
+        self._graph = None
+        self._init_lock = threading.Lock()
+        self._mark_startup("db", started)
         self.lm = lm
+        self.answer_cache = answer_cache
+        self.checkpoints = checkpoints
+        self.max_synthesis_retries = max_synthesis_retries
+        self.profiler = profiler
+        if trace_level not in TRACE_LEVELS:
+            raise ValueError(f"trace_level must be one of {TRACE_LEVELS}, got {trace_level!r}")
+        self.trace_level = trace_level
+        self.sql_candidates = max(1, sql_candidates)
+        self.sql_timeout_s = sql_timeout_s
+        self.context_budget = context_budget or ContextBudgeter()
+        self.normalizer = QuestionNormalizer(docs_dir)
+        self.sql_templates = SQLTemplateLibrary(self.normalizer) if use_sql_templates else None
+        self.sql_rewriter = SQLRewriter(getattr(self.db_tool, "validate", None)) if rewrite_sql else None
+        self._mark_startup("normalizer", started)
 
-        dspy.settings.configure(lm=lm)
-        self.router = Router()
-        self.planner = Planner()
-        self.nl_to_sql = NLToSQL()
-        self.sql_repairer = SQLRepairer()
-        self.synthesizer = Synthesizer()
+        dspy.settings.configure(lm=ProfiledLM(lm) if profiler is not None else lm)
+        self.artifacts = artifacts
+        self.module_modes = {**DEFAULT_MODULE_MODES, **(module_modes or {})}
+        self.router = self._profile_module("dspy.Router", self._dspy_module("router", Router))
+        self.planner = self._profile_module("dspy.Planner", self._dspy_module("planner", Planner))
+        self.nl_to_sql = self._profile_module("dspy.NLToSQL", self._dspy_module("nl_to_sql", NLToSQL))
+        self.sql_repairer = self._profile_module(
+            "dspy.SQLRepairer", self._dspy_module("sql_repairer", SQLRepairer)
+        )
+        self.synthesizer = self._profile_module(
+            "dspy.Synthesizer", self._dspy_module("synthesizer", Synthesizer)
+        )
+        self._mark_startup("modules", started)
 
         self.schema = self.db_tool.get_schema()
-
-        self.graph = self._build_graph()
+        self._mark_startup("schema", started)
+    
+    def _lazy(self, attr: str, build):
+        """Build a deferred component once, thread-safely, recording its init time."""
+        value = getattr(self, attr)
+        if value is None:
+            with self._init_lock:
+                value = getattr(self, attr)
+                if value is None:
+                    started = time.perf_counter()
+                    value = build()
+                    setattr(self, attr, value)
+                    self.lazy_init_ms[attr.lstrip("_")] = round((time.perf_counter() - started) * 1000, 3)
+        return value
+    
+    @property
+    def retriever(self) -> TFIDFRetriever:
+        """TF-IDF index, built on the first rag/hybrid question."""
+        return self._lazy("_retriever", lambda: TFIDFRetriever(self.docs_dir))
+    
+    @property
+    def graph(self):
+        """Compiled LangGraph workflow, built on the first answer-cache miss."""
+        return self._lazy("_graph", self._build_graph)
+    
+    def warm_up(self):
+        """Build deferred components now (for long-running processes)."""
+        if hasattr(self.db_tool, "warm_up"):
+            self.db_tool.warm_up()
+        return self.retriever, self.graph
+    
+    def _mark_startup(self, phase: str, started: float):
+        """Record time spent in a startup phase since the previous mark."""
+        elapsed = (time.perf_counter() - started) * 1000
+        self.startup_ms[phase] = round(elapsed - sum(self.startup_ms.values()), 3)
+    
+    def _dspy_module(self, name: str, module_cls):
+        """A fresh module, or one lazily loaded from the artifacts store on first use."""
+        mode = self.module_modes[name]
+        if self.artifacts is None:
+            return module_cls(mode)
+        return LazyModule(lambda: self.artifacts.load(name, mode))
     
-    def _build_graph(self) -> StateGraph:
+    def startup_report(self) -> Dict[str, Any]:
+        """Startup phase, deferred-init and lazy-import timings plus per-module artifact load status."""
+        return {
+            "startup_ms": dict(self.startup_ms),
+            "lazy_init_ms": dict(self.lazy_init_ms),
+            "import_ms": dict(IMPORT_MS),
+            "artifacts_version": self.artifacts.version if self.artifacts is not None else None,
+            "modules": dict(self.artifacts.load_report) if self.artifacts is not None else {}
+        }
+    
+    def _profile_module(self, name: str, module: dspy.Module):
+        """Wrap a DSPy module in a profiling span when profiling is on."""
+        if self.profiler is None:
+            return module
+        return ProfiledModule(module, self.profiler, name)
+    
+    def _node(self, name: str, fn):
+        """Wrap a graph node in checkpointing, profiling and tracing spans."""
+        if self.checkpoints is not None:
+            fn = checkpointed(name, fn)
+        if self.profiler is not None:
+            fn = self.profiler.wrap(f"node.{name}", fn)
+        return traced(f"node.{name}", fn)
+    
+    def _build_graph(self):
         """Build the LangGraph workflow."""
-        workflow = StateGraph(AgentState)
+        langgraph = lazy_import("langgraph.graph")
+        END = langgraph.END
+        workflow = langgraph.StateGraph(AgentState)
 
-        workflow.add_node("router", self._route_question)
-        workflow.add_node("retriever", self._retrieve_documents)
-        workflow.add_node("planner", self._plan_extraction)
-        workflow.add_node("sql_generator", self._generate_sql)
-        workflow.add_node("executor", self._execute_sql)
-        workflow.add_node("synthesizer", self._synthesize_answer)
-        workflow.add_node("validator", self._validate_output)
-        workflow.add_node("repairer", self._repair_sql)
+        workflow.add_node("router", self._node("router", self._route_question))
+        workflow.add_node("retriever", self._node("retriever", self._retrieve_documents))
+        workflow.add_node("planner", self._node("planner", self._plan_extraction))
+        workflow.add_node("sql_generator", self._node("sql_generator", self._generate_sql))
+        workflow.add_node("executor", self._node("executor", self._execute_sql))
+        workflow.add_node("synthesizer", self._node("synthesizer", self._synthesize_answer))
+        workflow.add_node("validator", self._node("validator", self._validate_output))
+        workflow.add_node("repairer", self._node("repairer", self._repair_sql))
 
         workflow.set_entry_point("router")
 
@@ -121,6 +311,14 @@ class HybridAgent:
         
         return workflow.compile()
     
+    def _trace(self, state: AgentState, entry: Dict[str, Any]):
+        """Append a trace entry according to the configured trace level."""
+        if self.trace_level == "off":
+            return
+        if self.trace_level == "summary":
+            entry = summarize_payload(entry)
+        state["trace"].append(entry)
+    
     def _route_question(self, state: AgentState) -> AgentState:
         """Route the question to appropriate handler."""
         result = self.router(question=state["question"])
@@ -130,7 +328,7 @@ class HybridAgent:
             route = "hybrid" 
         
         state["route"] = route
-        state["trace"].append({
+        self._trace(state, {
             "node": "router",
             "route": route,
             "reasoning": result.reasoning
@@ -141,29 +339,62 @@ class HybridAgent:
         """Retrieve relevant documents."""
         chunks = self.retriever.retrieve(state["question"], top_k=3)
         
-        state["rag_chunks"] = [
-            {
-                "chunk_id": c.chunk_id,
-                "content": c.content,
-                "score": c.score
-            }
-            for c in chunks
-        ]
-        
-        state["rag_context"] = "\n\n".join([
-            f"[{c.chunk_id}] {c.content}" for c in chunks
-        ])
-        
-        state["trace"].append({
+        context, kept_ids, report = self.context_budget.compact_chunks(
+            [(c.chunk_id, c.content) for c in chunks],
+            self.context_budget.chunk_budget(state["route"] in ["sql", "hybrid"])
+        )
+        # Only chunks that reach the prompt are cited.
+        chunks = [c for c in chunks if c.chunk_id in kept_ids]
+        self._count_context_tokens(state, "rag", report)
+        
+        if self.trace_level == "full":
+            state["rag_chunks"] = [
+                {
+                    "chunk_id": c.chunk_id,
+                    "content": c.content,
+                    "score": c.score
+                }
+                for c in chunks
+            ]
+        else:
+            # The text already lives once in rag_context; keep references only.
+            state["rag_chunks"] = [
+                {"chunk_id": c.chunk_id, "score": c.score, **payload_ref(c.content)}
+                for c in chunks
+            ]
+        
+        state["rag_context"] = context
+        
+        self._trace(state, {
             "node": "retriever",
-            "chunks_found": len(chunks),
-            "chunk_ids": [c.chunk_id for c in chunks]
+            "chunks_found": report["chunks_total"],
+            "chunk_ids": kept_ids,
+            "context_tokens": report
         })
         
         return state
     
     def _plan_extraction(self, state: AgentState) -> AgentState:
         """Extract constraints and plan."""
+        state["sql_started_at"] = time.perf_counter()
+        
+        match = None
+        if self.sql_templates is not None and state["route"] in ["sql", "hybrid"]:
+            match = self.sql_templates.match(state["question"], state["format_hint"])
+        
+        if match is not None:
+            state["constraints"] = match.constraints
+            state["sql_template"] = match.template
+            state["sql_query"] = match.sql
+            state["sql_params"] = match.params
+            self._trace(state, {
+                "node": "planner",
+                "template": match.template,
+                "template_confidence": match.confidence,
+                "constraints": match.constraints
+            })
+            return state
+        
         context = state.get("rag_context", "")
         result = self.planner(question=state["question"], context=context)
         
@@ -183,15 +414,32 @@ class HybridAgent:
             }
         
         state["constraints"] = constraints
-        state["trace"].append({
+        self._trace(state, {
             "node": "planner",
             "constraints": constraints
         })
         
         return state
     
+    def _record_sql_latency(self, source: str, state: AgentState):
+        """Time from planning to SQL; unknown (None) when planning was replayed from a checkpoint."""
+        if self.sql_templates is not None and state["sql_started_at"] is not None:
+            self.sql_templates.record_latency(source, time.perf_counter() - state["sql_started_at"])
+    
     def _generate_sql(self, state: AgentState) -> AgentState:
         """Generate SQL query."""
+        if state.get("sql_template"):
+            self._record_sql_latency("template", state)
+            self._trace(state, {
+                "node": "sql_generator",
+                "sql": render_sql(state["sql_query"], state["sql_params"]),
+                "template": state["sql_template"]
+            })
+            return state
+        
+        if self.sql_candidates > 1:
+            return self._generate_sql_candidates(state)
+        
         constraints_str = json.dumps(state["constraints"], indent=2)
         
         result = self.nl_to_sql(
@@ -200,17 +448,12 @@ class HybridAgent:
             constraints=constraints_str
         )
         
-        sql = result.sql_query.strip()
-        if sql.startswith("```sql"):
-            sql = sql[6:]
-        if sql.startswith("```"):
-            sql = sql[3:]
-        if sql.endswith("```"):
-            sql = sql[:-3]
-        sql = sql.strip()
+        sql = strip_sql_fences(result.sql_query)
         
         state["sql_query"] = sql
-        state["trace"].append({
+        state["sql_params"] = []
+        self._record_sql_latency("llm", state)
+        self._trace(state, {
             "node": "sql_generator",
             "sql": sql,
             "explanation": result.explanation
@@ -218,45 +461,152 @@ class HybridAgent:
         
         return state
     
+    def _generate_sql_candidates(self, state: AgentState) -> AgentState:
+        """Sample K queries concurrently, execute them all, and keep the consensus."""
+        constraints_str = json.dumps(state["constraints"], indent=2)
+        temperatures = candidate_temperatures(self.sql_candidates)
+        
+        def sample(index: int, temperature: float) -> SQLCandidate:
+            try:
+                result = self.nl_to_sql(
+                    question=state["question"],
+                    schema=self.schema,
+                    constraints=constraints_str,
+                    config={"temperature": temperature}
+                )
+                return SQLCandidate(index, temperature, strip_sql_fences(result.sql_query),
+                                    explanation=result.explanation)
+            except Exception as e:
+                return SQLCandidate(index, temperature, "", error=f"generation failed: {e}")
+        
+        def execute(candidate: SQLCandidate) -> SQLCandidate:
+            if not candidate.sql:
+                return candidate
+            start = time.perf_counter()
+            rewrite = self._rewrite_sql(state, candidate.sql, [])
+            candidate.sql, candidate.rewrites = rewrite.sql, rewrite.rewrites
+            if rewrite.error:
+                candidate.success, candidate.rows, candidate.columns, error = False, [], [], rewrite.error
+            else:
+                candidate.success, candidate.rows, candidate.columns, error = (
+                    self.db_tool.execute_readonly(rewrite.sql, rewrite.params, timeout_s=self.sql_timeout_s)
+                )
+            candidate.error = candidate.error or error
+            candidate.exec_ms = (time.perf_counter() - start) * 1000
+            return candidate
+        
+        # Copy the context per task so profiling and tracing spans nest correctly.
+        with ThreadPoolExecutor(max_workers=self.sql_candidates) as pool:
+            candidates = list(pool.map(
+                lambda args: contextvars.copy_context().run(sample, *args),
+                enumerate(temperatures)
+            ))
+            candidates = list(pool.map(
+                lambda c: contextvars.copy_context().run(execute, c), candidates
+            ))
+        
+        chosen = select_candidate(candidates, state["format_hint"])
+        if chosen is not None:
+            state["sql_results"] = chosen.rows
+            state["sql_columns"] = chosen.columns
+            state["sql_error"] = ""
+        else:
+            # Every candidate failed: hand all their errors to the repairer
+            # instead of re-running the first one in the executor.
+            chosen = next((c for c in candidates if c.sql), candidates[0])
+            state["sql_results"] = []
+            state["sql_columns"] = []
+            state["sql_error"] = candidate_errors(candidates, chosen)
+        state["sql_prefetched"] = True
+        
+        state["sql_query"] = chosen.sql
+        state["sql_params"] = []
+        self._record_sql_latency("llm", state)
+        
+        span = current_span()
+        if span is not None:
+            span.set(sql_candidates=len(candidates), sql_candidates_ok=sum(c.success for c in candidates))
+        self._trace(state, {
+            "node": "sql_generator",
+            "sql": chosen.sql,
+            "explanation": chosen.explanation,
+            "selected": chosen.index,
+            "candidates": [c.summary() for c in candidates]
+        })
+        
+        return state
+    
     def _execute_sql(self, state: AgentState) -> AgentState:
         """Execute SQL query."""
-        success, data, columns, error = self.db_tool.execute_query(state["sql_query"])
+        if state.get("sql_prefetched"):
+            # Already executed while choosing among SQL candidates.
+            state["sql_prefetched"] = False
+            self._trace(state, {
+                "node": "executor",
+                "success": not state["sql_error"],
+                "rows": len(state["sql_results"]),
+                "prefetched": True,
+                "error": state["sql_error"]
+            })
+            return state
+        
+        start = time.perf_counter()
+        rewrite = self._rewrite_sql(state, state["sql_query"], state.get("sql_params"))
+        state["sql_query"], state["sql_params"] = rewrite.sql, rewrite.params
+        if rewrite.error:
+            success, data, columns, error = False, [], [], rewrite.error
+        else:
+            success, data, columns, error = self.db_tool.execute_query(rewrite.sql, rewrite.params)
+        sql_ms = (time.perf_counter() - start) * 1000
+        
+        span = current_span()
+        if span is not None:
+            span.set(sql_ms=round(sql_ms, 3), rows=len(data), success=success)
+            if rewrite.rewrites:
+                span.set(sql_rewrites=",".join(rewrite.rewrites))
         
         state["sql_results"] = data
         state["sql_columns"] = columns
         state["sql_error"] = error
         
-        state["trace"].append({
+        entry = {
             "node": "executor",
             "success": success,
             "rows": len(data) if data else 0,
+            "sql_ms": round(sql_ms, 3),
             "error": error
-        })
+        }
+        if rewrite.rewrites or rewrite.warnings:
+            entry["rewrites"] = rewrite.rewrites
+            entry["warnings"] = rewrite.warnings
+        self._trace(state, entry)
         
         return state
     
+    def _rewrite_sql(self, state: AgentState, sql: str, params: List[Any]) -> RewriteResult:
+        """Clean up a generated query before execution; prepared template SQL is left alone."""
+        if self.sql_rewriter is None or (state.get("sql_template") and not state.get("repair_count")):
+            return RewriteResult(sql, list(params or []))
+        top_n = self.normalizer.signature(state["question"], state["format_hint"])["top_n"]
+        return self.sql_rewriter.rewrite(sql, params, state["format_hint"], top_n,
+                                         asks_for_one(state["question"]))
+    
     def _repair_sql(self, state: AgentState) -> AgentState:
         """Repair failed SQL query."""
         result = self.sql_repairer(
-            original_query=state["sql_query"],
+            original_query=render_sql(state["sql_query"], state.get("sql_params")),
             error_message=state["sql_error"],
             schema=self.schema,
             question=state["question"]
         )
         
-        sql = result.repaired_query.strip()
-        if sql.startswith("```sql"):
-            sql = sql[6:]
-        if sql.startswith("```"):
-            sql = sql[3:]
-        if sql.endswith("```"):
-            sql = sql[:-3]
-        sql = sql.strip()
+        sql = strip_sql_fences(result.repaired_query)
         
         state["sql_query"] = sql
+        state["sql_params"] = []
         state["repair_count"] += 1
         
-        state["trace"].append({
+        self._trace(state, {
             "node": "repairer",
             "repaired_sql": sql,
             "changes": result.changes,
@@ -267,16 +617,32 @@ class HybridAgent:
     
     def _synthesize_answer(self, state: AgentState) -> AgentState:
         """Synthesize final answer."""
+        if state.get("sql_results") and not state.get("sql_error"):
+            projected = project_result(
+                state["sql_columns"], state["sql_results"], state["format_hint"]
+            )
+            if projected is not None:
+                return self._project_answer(state, projected)
+        
         sql_results_str = ""
         if state.get("sql_results"):
-            sql_results_str = json.dumps({
-                "columns": state["sql_columns"],
-                "rows": state["sql_results"]
-            }, indent=2)
+            sql_results_str, report = self.context_budget.render_sql_results(
+                state["sql_columns"], state["sql_results"]
+            )
+            if state["synthesis_attempts"] == 0:
+                self._count_context_tokens(state, "sql", report)
+        
+        format_hint = state["format_hint"]
+        if state.get("validation_errors"):
+            format_hint += (
+                f" (previous answer {json.dumps(state['final_answer'], default=str)} was invalid: "
+                f"{'; '.join(state['validation_errors'])})"
+            )
+        state["synthesis_attempts"] += 1
         
         result = self.synthesizer(
             question=state["question"],
-            format_hint=state["format_hint"],
+            format_hint=format_hint,
             sql_results=sql_results_str,
             rag_context=state.get("rag_context", "")
         )
@@ -294,21 +660,54 @@ class HybridAgent:
         citations = self._extract_citations(state)
         state["citations"] = citations
         
-        state["trace"].append({
+        self._trace(state, {
             "node": "synthesizer",
             "final_answer": final_answer,
-            "explanation": result.explanation
+            "explanation": result.explanation,
+            "context_tokens": dict(state["context_tokens"])
+        })
+        
+        return state
+    
+    def _count_context_tokens(self, state: AgentState, part: str, report: Dict[str, int]):
+        """Accumulate pre/post budgeting token counts on the state and profiling span."""
+        totals = state["context_tokens"]
+        for key in ("pre_tokens", "post_tokens"):
+            totals[f"{part}_{key}"] = totals.get(f"{part}_{key}", 0) + report[key]
+        span = current_span()
+        if span is not None:
+            span.incr("context_tokens_pre", report["pre_tokens"])
+            span.incr("context_tokens_post", report["post_tokens"])
+    
+    def _project_answer(self, state: AgentState, final_answer: Any) -> AgentState:
+        """Use a deterministic projection of the SQL result as the answer."""
+        state["final_answer"] = final_answer
+        state["synthesis_attempts"] += 1
+        state["explanation"] = (
+            f"Computed directly from the SQL result "
+            f"({len(state['sql_results'])} row(s), columns: {', '.join(state['sql_columns'])})."
+        )
+        state["confidence"] = max(0.5, 0.9 - 0.1 * state["repair_count"])
+        state["citations"] = self._extract_citations(state)
+        
+        self._trace(state, {
+            "node": "synthesizer",
+            "final_answer": final_answer,
+            "projected": True
         })
         
         return state
     
     def _validate_output(self, state: AgentState) -> AgentState:
         """Validate output format and citations."""
-        is_valid = state["final_answer"] is not None
+        errors = compile_format_hint(state["format_hint"]).validate(state["final_answer"])
+        state["validation_errors"] = errors
         
-        state["trace"].append({
+        self._trace(state, {
             "node": "validator",
-            "valid": is_valid
+            "valid": not errors,
+            "errors": errors,
+            "attempt": state["synthesis_attempts"]
         })
         
         return state
@@ -316,32 +715,7 @@ class HybridAgent:
     def _parse_answer(self, answer: str, format_hint: str) -> Any:
         """Parse answer according to format hint."""
         try:
-
-            if answer.startswith("```"):
-                lines = answer.split("\n")
-                answer = "\n".join(lines[1:-1]) if len(lines) > 2 else answer
-            
-            if format_hint == "int":
-                import re
-                match = re.search(r'-?\d+', answer)
-                return int(match.group()) if match else 0
-            
-            elif format_hint == "float":
-                import re
-                match = re.search(r'-?\d+\.?\d*', answer)
-                return round(float(match.group()), 2) if match else 0.0
-            
-            elif format_hint.startswith("{") or format_hint.startswith("list["):
-                try:
-                    return json.loads(answer)
-                except:
-                    import re
-                    json_match = re.search(r'(\{.*\}|\[.*\])', answer, re.DOTALL)
-                    if json_match:
-                        return json.loads(json_match.group(1))
-                    return answer
-            
-            return answer
+            return compile_format_hint(format_hint).parse(answer)
         except Exception as e:
             print(f"Parse error: {e}")
             return answer
@@ -359,6 +733,8 @@ class HybridAgent:
             for table in tables:
                 if table.upper() in sql or f'"{table.upper()}"' in sql:
                     citations.append(table)
+            for shard in self.db_tool.shards_for(state["sql_query"]):
+                citations.append(f"shard:{shard}")
         
         return list(set(citations))
     
@@ -380,11 +756,59 @@ class HybridAgent:
         return "retry" if state["repair_count"] < 2 else "give_up"
     
     def _check_validation(self, state: AgentState) -> str:
-        """Check validation result."""
-        return "valid"  
+        """Check validation result, retrying synthesis within the retry budget."""
+        if not state.get("validation_errors"):
+            return "valid"
+        if state["synthesis_attempts"] > self.max_synthesis_retries:
+            return "valid"
+        return "invalid"
     
-    def run(self, question: str, format_hint: str) -> Dict[str, Any]:
-        """Run the agent on a question."""
+    def run(self, question: str, format_hint: str, question_id: str = None) -> Dict[str, Any]:
+        """Run the agent on a question.
+
+        With a checkpoint store and a question_id, progress is saved after
+        every node and a rerun of the same id resumes where it stopped.
+        """
+        with get_tracer().span("agent.run") as trace_span:
+            trace_span.set_attribute("agent.format_hint", format_hint)
+            trace_span.set_attribute("agent.question_chars", len(question))
+            
+            if self.profiler is None:
+                return self._run(question, format_hint, question_id)
+            
+            with self.profiler.span("question", format_hint=format_hint) as span:
+                result = self._run(question, format_hint, question_id)
+            result["profile"] = span.to_dict()
+            return result
+    
+    def _run(self, question: str, format_hint: str, question_id: str = None) -> Dict[str, Any]:
+        """Answer one question, consulting the answer cache and checkpoints first."""
+        signature = None
+        if self.answer_cache is not None:
+            signature = self.normalizer.signature(question, format_hint)
+            if is_cacheable(signature):
+                cached = self.answer_cache.get(
+                    signature, self.db_tool.get_data_version(), self.docs_hash
+                )
+                if cached is not None:
+                    cached["trace"] = [] if self.trace_level == "off" else [
+                        {"node": "answer_cache", "hit": True, "signature": signature}
+                    ]
+                    return cached
+        
+        run = None
+        if self.checkpoints is not None and question_id is not None:
+            fingerprint = self.checkpoints.fingerprint(
+                question=question, format_hint=format_hint,
+                data_version=self.db_tool.get_data_version(), docs_hash=self.docs_hash
+            )
+            completed, run = self.checkpoints.begin(question_id, fingerprint)
+            if completed is not None:
+                completed["trace"] = [] if self.trace_level == "off" else [
+                    {"node": "checkpoint", "completed": True, "question_id": question_id}
+                ]
+                return completed
+        
         initial_state = AgentState(
             question=question,
             format_hint=format_hint,
@@ -393,24 +817,47 @@ class HybridAgent:
             rag_chunks=[],
             constraints={},
             sql_query="",
+            sql_params=[],
+            sql_template="",
+            sql_started_at=0.0,
             sql_results=None,
             sql_columns=[],
             sql_error="",
+            sql_prefetched=False,
             final_answer=None,
             explanation="",
             confidence=0.0,
             citations=[],
             repair_count=0,
+            synthesis_attempts=0,
+            validation_errors=[],
+            context_tokens={},
             trace=[]
         )
         
-        final_state = self.graph.invoke(initial_state)
+        token = activate(run)
+        try:
+            final_state = self.graph.invoke(initial_state)
+        finally:
+            deactivate(token)
         
-        return {
+        result = {
             "final_answer": final_state["final_answer"],
-            "sql": final_state.get("sql_query", ""),
+            "sql": render_sql(final_state.get("sql_query", ""), final_state.get("sql_params")),
             "confidence": final_state.get("confidence", 0.0),
             "explanation": final_state.get("explanation", ""),
             "citations": final_state.get("citations", []),
-            "trace": final_state.get("trace", [])
+            "context_tokens": final_state.get("context_tokens", {})
         }
+        
+        if (is_cacheable(signature) and result["final_answer"] is not None
+                and not final_state.get("sql_error")):
+            self.answer_cache.put(
+                signature, self.db_tool.get_data_version(), self.docs_hash, result
+            )
+        
+        if run is not None:
+            self.checkpoints.finish(question_id, result, run)
+        
+        result["trace"] = final_state.get("trace", [])
+        return result
@@ -0,0 +1,31 @@
+"""Deferred imports of heavy optional-path dependencies.
+
+sklearn and langgraph together add seconds to interpreter start, yet a
+batch of SQL-only or answer-cache hits never needs the retriever and a
+fully cached batch never runs the graph. Callers import them through
+``lazy_import`` at first use, which also records how long each first
+import took for ``--profile-startup``.
+"""
+import importlib
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Dict
+
+IMPORT_MS: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Import a module on first use, timing the first import."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    with _lock:
+        if name in sys.modules:
+            return sys.modules[name]
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        IMPORT_MS[name] = round((time.perf_counter() - start) * 1000, 3)
+    return module
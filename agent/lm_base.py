@@ -0,0 +1,11 @@
+"""Common base class for the agent's LM wrappers.
+
+DSPy >= 2.5 only accepts ``dspy.BaseLM`` instances as the configured LM,
+while 2.4 (``dspy.OllamaLocal``) duck-types any callable with ``kwargs``.
+Wrappers inherit from whichever applies and forward everything else to the
+LM they wrap.
+"""
+import dspy
+
+
+LMBase = getattr(dspy, "BaseLM", object)
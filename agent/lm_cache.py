@@ -0,0 +1,191 @@
+"""Persistent prompt→completion cache for DSPy language models."""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from agent.lm_base import LMBase
+from agent.profiling import current_span
+
+
+DEFAULT_CACHE_PATH = ".cache/llm_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 50000
+
+
+def lm_model_name(lm: Any) -> str:
+    """Best-effort model identifier for an LM instance."""
+    for attr in ("model", "model_name"):
+        value = getattr(lm, attr, None)
+        if isinstance(value, str) and value:
+            return value
+    kwargs = getattr(lm, "kwargs", None) or {}
+    return str(kwargs.get("model", type(lm).__name__))
+
+
+def make_cache_key(model: str, prompt: Any, params: Dict[str, Any]) -> str:
+    """Hash model name, rendered prompt and sampling params into a cache key."""
+    payload = json.dumps(
+        {"model": model, "prompt": prompt, "params": params},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LMCache:
+    """SQLite-backed completion store with least-recently-used eviction."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """Open (or create) the cache database at path."""
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_completions_access ON completions(last_access)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[List[Any]]:
+        """Return the cached response for key, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE completions SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, model: str, response: List[Any]) -> bool:
+        """Store a response; returns False if it is not JSON-serializable."""
+        try:
+            payload = json.dumps(response)
+        except (TypeError, ValueError):
+            return False
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, model, response, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, payload, now, now)
+            )
+            self.writes += 1
+            self._evict()
+            self._conn.commit()
+        return True
+
+    def _evict(self):
+        """Drop least-recently-used entries beyond max_entries (lock held)."""
+        if not self.max_entries:
+            return
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM completions WHERE key IN ("
+                "SELECT key FROM completions ORDER BY last_access ASC LIMIT ?)",
+                (excess,)
+            )
+            self.evictions += excess
+
+    def clear(self):
+        """Remove all cached completions."""
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process."""
+        lookups = self.hits + self.misses
+        return {
+            "path": str(self.path),
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions
+        }
+
+    def close(self):
+        """Close the underlying connection."""
+        with self._lock:
+            self._conn.close()
+
+
+class CachedLM(LMBase):
+    """Wrap a DSPy LM so identical requests are served from an LMCache.
+
+    Attribute access falls through to the wrapped LM, so DSPy can keep
+    reading ``kwargs``, ``history`` and friends from it.
+    """
+
+    def __init__(self, lm: Any, cache: LMCache):
+        self.lm = lm
+        self.cache = cache
+        self.model_name = lm_model_name(lm)
+
+    def __call__(self, prompt: Any = None, messages: Any = None, **kwargs) -> List[Any]:
+        """Return a cached completion list, calling the wrapped LM on a miss."""
+        params = dict(getattr(self.lm, "kwargs", None) or {})
+        params.update(kwargs)
+        key = make_cache_key(
+            self.model_name,
+            messages if messages is not None else prompt,
+            params
+        )
+
+        cached = self.cache.get(key)
+        span = current_span()
+        if span is not None:
+            span.incr("llm_cache_hits" if cached is not None else "llm_cache_misses")
+        if cached is not None:
+            return cached
+
+        if messages is None:
+            response = self.lm(prompt, **kwargs)
+        else:
+            response = self.lm(prompt=prompt, messages=messages, **kwargs)
+
+        self.cache.put(key, self.model_name, response)
+        return response
+
+    def copy(self, **kwargs) -> "CachedLM":
+        """Copy the wrapped LM with new kwargs, sharing the same cache."""
+        return CachedLM(self.lm.copy(**kwargs), self.cache)
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "lm":
+            raise AttributeError(name)
+        return getattr(self.lm, name)
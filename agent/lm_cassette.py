@@ -0,0 +1,186 @@
+"""Record real LM traffic to a cassette file and replay it deterministically.
+
+A cassette is JSONL: a header line describing the recorded LM, then one
+line per call with the request (prompt or messages plus call kwargs), the
+completion list and the measured latency. ``ReplayLM`` serves those
+completions in recorded order per request, optionally sleeping for the
+recorded latency, so a run can be repeated without Ollama and timing
+differences isolate non-LLM overhead.
+"""
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+
+from agent.lm_base import LMBase
+from agent.lm_cache import lm_model_name, make_cache_key
+
+
+CASSETTE_VERSION = 1
+
+
+class CassetteMissError(KeyError):
+    """A replayed run made a request the cassette does not contain."""
+
+
+def request_key(prompt: Any, messages: Any, kwargs: Dict[str, Any]) -> str:
+    """Key for one request; the model name is left out so cassettes replay under any --model."""
+    params = {k: v for k, v in kwargs.items() if k != "model"}
+    return make_cache_key("", messages if messages is not None else prompt, params)
+
+
+class RecordingLM(LMBase):
+    """Wrap an LM and append every call (request, response, latency) to a cassette."""
+
+    def __init__(self, lm: Any, path: str, _shared: Dict[str, Any] = None):
+        self.lm = lm
+        self.path = Path(path)
+        if _shared is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            _shared = {"file": self.path.open("w", encoding="utf-8"), "lock": threading.Lock(),
+                       "seq": 0}
+            header = {
+                "cassette": CASSETTE_VERSION,
+                "model": lm_model_name(lm),
+                "kwargs": dict(getattr(lm, "kwargs", None) or {}),
+                "created": datetime.now(timezone.utc).isoformat(timespec="seconds")
+            }
+            _shared["file"].write(json.dumps(header, default=str) + "\n")
+        self._shared = _shared
+
+    @property
+    def recorded(self) -> int:
+        return self._shared["seq"]
+
+    def __call__(self, prompt: Any = None, messages: Any = None, **kwargs) -> List[Any]:
+        start = time.perf_counter()
+        if messages is None:
+            response = self.lm(prompt, **kwargs)
+        else:
+            response = self.lm(prompt=prompt, messages=messages, **kwargs)
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        entry = {
+            "key": request_key(prompt, messages, kwargs),
+            "prompt": prompt,
+            "messages": messages,
+            "kwargs": kwargs,
+            "response": response,
+            "latency_ms": round(latency_ms, 3)
+        }
+        with self._shared["lock"]:
+            entry["seq"] = self._shared["seq"]
+            self._shared["seq"] += 1
+            self._shared["file"].write(json.dumps(entry, default=str) + "\n")
+            self._shared["file"].flush()
+        return response
+
+    def copy(self, **kwargs) -> "RecordingLM":
+        """Copy the wrapped LM with new kwargs, recording into the same cassette."""
+        return RecordingLM(self.lm.copy(**kwargs), str(self.path), self._shared)
+
+    def close(self):
+        with self._shared["lock"]:
+            if not self._shared["file"].closed:
+                self._shared["file"].close()
+
+    def __getattr__(self, name: str) -> Any:
+        if name in ("lm", "_shared"):
+            raise AttributeError(name)
+        return getattr(self.lm, name)
+
+
+class ReplayLM(LMBase):
+    """Serve completions from a cassette instead of calling a model.
+
+    Repeated identical requests get the recorded responses in order and
+    then keep getting the last one. With ``simulate_latency`` each call
+    sleeps for its recorded latency times ``latency_scale``. A request
+    missing from the cassette raises ``CassetteMissError``, or is passed to
+    ``fallback`` when one is given.
+    """
+
+    def __init__(self, path: str, simulate_latency: bool = False, latency_scale: float = 1.0,
+                 fallback: Any = None):
+        self.path = Path(path)
+        self.simulate_latency = simulate_latency
+        self.latency_scale = latency_scale
+        self.fallback = fallback
+        self.entries: Dict[str, List[Dict[str, Any]]] = {}
+        # Mutable replay state lives in containers so copies share it.
+        self._counts = {"hits": 0, "misses": 0, "replayed_latency_ms": 0.0}
+        self._cursor: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        with self.path.open(encoding="utf-8") as f:
+            header = json.loads(f.readline() or "{}")
+            if header.get("cassette") != CASSETTE_VERSION:
+                raise ValueError(f"{path} is not a version {CASSETTE_VERSION} LM cassette")
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.entries.setdefault(entry["key"], []).append(entry)
+        for recorded in self.entries.values():
+            recorded.sort(key=lambda e: e.get("seq", 0))
+
+        self.model = header.get("model", "replay")
+        self.model_type = "chat"
+        self.cache = False
+        self.callbacks = []
+        self.num_retries = 0
+        self.kwargs = dict(header.get("kwargs") or {"model": self.model})
+        self.history: List[Dict[str, Any]] = []
+
+    def __call__(self, prompt: Any = None, messages: Any = None, **kwargs) -> List[Any]:
+        key = request_key(prompt, messages, kwargs)
+        with self._lock:
+            recorded = self.entries.get(key)
+            if recorded:
+                index = self._cursor.get(key, 0)
+                self._cursor[key] = index + 1
+                entry = recorded[min(index, len(recorded) - 1)]
+                self._counts["hits"] += 1
+                self._counts["replayed_latency_ms"] += entry.get("latency_ms", 0.0)
+            else:
+                entry = None
+                self._counts["misses"] += 1
+
+        if entry is None:
+            if self.fallback is None:
+                raise CassetteMissError(f"request not in cassette {self.path} (key {key[:12]})")
+            if messages is None:
+                return self.fallback(prompt, **kwargs)
+            return self.fallback(prompt=prompt, messages=messages, **kwargs)
+
+        if self.simulate_latency and entry.get("latency_ms"):
+            time.sleep(entry["latency_ms"] * self.latency_scale / 1000)
+        self.history.append({"prompt": prompt, "messages": messages, "kwargs": kwargs,
+                             "response": entry["response"]})
+        del self.history[:-100]
+        return entry["response"]
+
+    def copy(self, **kwargs) -> "ReplayLM":
+        """A view sharing entries, cursors and counters; kwargs only change the advertised defaults."""
+        clone = object.__new__(ReplayLM)
+        clone.__dict__.update(self.__dict__)
+        clone.kwargs = {**self.kwargs, **kwargs}
+        return clone
+
+    def inspect_history(self, n: int = 1):
+        return self.history[-n:]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses = self._counts["hits"], self._counts["misses"]
+            replayed = self._counts["replayed_latency_ms"]
+        lookups = hits + misses
+        return {
+            "path": str(self.path),
+            "requests": sum(len(r) for r in self.entries.values()),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "replayed_latency_ms": round(replayed, 3)
+        }
@@ -0,0 +1,331 @@
+"""HTTP LM client with keep-alive pooling, bounded in-flight requests and batching.
+
+``HTTPModelLM`` talks to the local model server directly instead of going
+through ``dspy.OllamaLocal``:
+
+- connections are pooled and reused (HTTP/1.1 keep-alive), so concurrent
+  module calls do not each pay a TCP handshake;
+- at most ``max_in_flight`` requests are outstanding at once, matching
+  how many sequences the server can usefully run in parallel on CPU;
+- with ``api="openai"`` (llama.cpp server, vLLM and other OpenAI-compatible
+  servers), requests with identical sampling params that arrive within
+  ``batch_window_ms`` of each other are coalesced into one
+  ``/v1/completions`` call with a list of prompts. DSPy's chat adapter
+  sends ``messages``, and ``/v1/chat/completions`` takes one conversation
+  per request, so chat requests are rendered into prompts with the
+  model's ``chat_template`` first (``chat_template=None`` sends them one by
+  one instead). Ollama's API takes one prompt per request, so with
+  ``api="ollama"`` requests are only pooled and throttled.
+"""
+import http.client
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from agent.lm_base import LMBase
+
+
+DEFAULT_LM_URL = "http://localhost:11434"
+LM_APIS = ("ollama", "openai")
+# Params that change the completion and so must match for requests to share a batch.
+BATCH_PARAMS = ("temperature", "max_tokens", "top_p", "stop", "n")
+# Prompt formats for batching chat requests: (per message, generation prompt, end of turn).
+CHAT_TEMPLATES = {
+    "phi3": ("<|{role}|>\n{content}<|end|>\n", "<|assistant|>\n", "<|end|>"),
+    "chatml": ("<|im_start|>{role}\n{content}<|im_end|>\n", "<|im_start|>assistant\n", "<|im_end|>"),
+}
+DEFAULT_CHAT_TEMPLATE = "phi3"
+
+
+class LMServerError(RuntimeError):
+    """The model server returned an error status or an unparseable body."""
+
+
+class ConnectionPool:
+    """LIFO pool of keep-alive HTTP connections to one host."""
+
+    def __init__(self, url: str, size: int = 4, timeout_s: float = 300.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.https = parts.scheme == "https"
+        self.timeout_s = timeout_s
+        self.created = 0
+        self.reused = 0
+        self._idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+
+    def _connect(self) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        with self._lock:
+            self.created += 1
+        return cls(self.host, self.port, timeout=self.timeout_s)
+
+    def post_json(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """POST a JSON body and decode the JSON reply, retrying once on a stale connection."""
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        for attempt in range(2):
+            try:
+                conn = self._idle.get_nowait()
+                with self._lock:
+                    self.reused += 1
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (ConnectionError, http.client.HTTPException, OSError):
+                conn.close()
+                # An idle keep-alive connection may have been closed by the server.
+                if attempt == 0:
+                    continue
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                try:
+                    self._idle.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+            if response.status >= 400:
+                raise LMServerError(f"{path} returned {response.status}: {data[:200]!r}")
+            try:
+                return json.loads(data)
+            except ValueError as e:
+                raise LMServerError(f"{path} returned invalid JSON: {e}") from e
+        raise LMServerError(f"{path}: no response")
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def render_chat(messages: List[Dict[str, Any]], template: str) -> str:
+    """Render chat messages into one completion prompt with a CHAT_TEMPLATES format."""
+    turn, generation, _ = CHAT_TEMPLATES[template]
+    parts = []
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(turn.format(role=message.get("role", "user"), content=content))
+    return "".join(parts) + generation
+
+
+class _Pending:
+    """One prompt waiting to join a batch."""
+
+    __slots__ = ("prompt", "params", "future")
+
+    def __init__(self, prompt: str, params: Dict[str, Any]):
+        self.prompt = prompt
+        self.params = params
+        self.future: Future = Future()
+
+
+class HTTPModelLM(LMBase):
+    """DSPy-compatible LM for a local model server (Ollama or OpenAI-compatible)."""
+
+    def __init__(self, model: str, url: str = DEFAULT_LM_URL, api: str = "ollama",
+                 max_tokens: int = 1000, temperature: float = 0.1, max_in_flight: int = 2,
+                 batch_window_ms: float = 5.0, max_batch_size: int = 8,
+                 timeout_s: float = 300.0, keep_alive: str = "30m",
+                 chat_template: Optional[str] = DEFAULT_CHAT_TEMPLATE):
+        if api not in LM_APIS:
+            raise ValueError(f"api must be one of {LM_APIS}, got {api!r}")
+        if chat_template is not None and chat_template not in CHAT_TEMPLATES:
+            raise ValueError(f"chat_template must be one of {tuple(CHAT_TEMPLATES)} or None, "
+                             f"got {chat_template!r}")
+        self.model = model
+        self.url = url
+        self.api = api
+        self.model_type = "chat"
+        self.cache = False
+        self.callbacks = []
+        self.num_retries = 0
+        self.kwargs = {"model": model, "temperature": temperature, "max_tokens": max_tokens}
+        self.history: List[Dict[str, Any]] = []
+        self.max_in_flight = max(1, max_in_flight)
+        self.batch_window_s = batch_window_ms / 1000
+        self.max_batch_size = max(1, max_batch_size)
+        self.keep_alive = keep_alive
+        self.chat_template = chat_template
+        self.batching = api == "openai" and self.max_batch_size > 1
+        self.pool = ConnectionPool(url, size=self.max_in_flight, timeout_s=timeout_s)
+
+        self.requests = 0
+        self.prompts = 0
+        self.batches = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._dispatcher: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def __call__(self, prompt: Any = None, messages: Any = None, **kwargs) -> List[str]:
+        params = dict(self.kwargs)
+        params.update(kwargs)
+        batchable = messages is None or self.chat_template is not None
+        if batchable and self.batching and params.get("n", 1) == 1:
+            if messages is not None:
+                prompt_text = render_chat(messages, self.chat_template)
+                end_of_turn = CHAT_TEMPLATES[self.chat_template][2]
+                stop = params.get("stop") or []
+                stop = [stop] if isinstance(stop, str) else list(stop)
+                params["stop"] = stop if end_of_turn in stop else stop + [end_of_turn]
+            else:
+                prompt_text = str(prompt or "")
+            pending = _Pending(prompt_text, params)
+            self._ensure_dispatcher()
+            self._queue.put(pending)
+            completions = [pending.future.result()]
+        else:
+            completions = self._send([prompt] if messages is None else [messages], params,
+                                     chat=messages is not None)
+        with self._lock:
+            self.history.append({"prompt": prompt, "messages": messages, "kwargs": kwargs,
+                                 "response": completions})
+            del self.history[:-100]
+        return completions
+
+    def _send(self, inputs: List[Any], params: Dict[str, Any], chat: bool) -> List[str]:
+        """One HTTP request for one chat or one or more prompts, within the in-flight limit."""
+        with self._slots:
+            with self._lock:
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                self.requests += 1
+                self.prompts += len(inputs)
+                self.batches += len(inputs) > 1
+            try:
+                path, payload = self._request(inputs, params, chat)
+                return self._parse(self.pool.post_json(path, payload), chat)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+
+    def _request(self, inputs: List[Any], params: Dict[str, Any], chat: bool
+                 ) -> Tuple[str, Dict[str, Any]]:
+        max_tokens = params.get("max_tokens")
+        stop = params.get("stop")
+        if self.api == "ollama":
+            options = {"temperature": params.get("temperature"), "num_predict": max_tokens}
+            if stop:
+                options["stop"] = stop if isinstance(stop, list) else [stop]
+            payload = {"model": self.model, "stream": False, "keep_alive": self.keep_alive,
+                       "options": {k: v for k, v in options.items() if v is not None}}
+            if chat:
+                return "/api/chat", {**payload, "messages": inputs[0]}
+            return "/api/generate", {**payload, "prompt": inputs[0], "raw": True}
+
+        payload = {"model": self.model, "temperature": params.get("temperature"),
+                   "max_tokens": max_tokens, "stop": stop, "top_p": params.get("top_p")}
+        payload = {k: v for k, v in payload.items() if v is not None}
+        if chat:
+            return "/v1/chat/completions", {**payload, "messages": inputs[0]}
+        return "/v1/completions", {**payload, "prompt": inputs if len(inputs) > 1 else inputs[0]}
+
+    def _parse(self, data: Dict[str, Any], chat: bool) -> List[str]:
+        if self.api == "ollama":
+            if chat:
+                return [data.get("message", {}).get("content", "")]
+            return [data.get("response", "")]
+        choices = sorted(data.get("choices", []), key=lambda c: c.get("index", 0))
+        if chat:
+            return [c.get("message", {}).get("content", "") for c in choices]
+        return [c.get("text", "") for c in choices]
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None:
+            with self._lock:
+                if self._dispatcher is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight,
+                                                        thread_name_prefix="lm-batch")
+                    self._dispatcher = threading.Thread(target=self._dispatch_loop,
+                                                        name="lm-dispatcher", daemon=True)
+                    self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        """Collect prompts for up to batch_window_s, then send one request per param group."""
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            groups: Dict[str, List[_Pending]] = {}
+            groups[self._batch_key(first.params)] = [first]
+            deadline = time.perf_counter() + self.batch_window_s
+            queued = 1
+            while queued < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                groups.setdefault(self._batch_key(item.params), []).append(item)
+                queued += 1
+            for group in groups.values():
+                self._executor.submit(self._send_batch, group)
+
+    @staticmethod
+    def _batch_key(params: Dict[str, Any]) -> str:
+        return json.dumps({k: params.get(k) for k in BATCH_PARAMS}, sort_keys=True, default=str)
+
+    def _send_batch(self, group: List[_Pending]):
+        try:
+            completions = self._send([p.prompt for p in group], group[0].params, chat=False)
+            if len(completions) != len(group):
+                raise LMServerError(f"expected {len(group)} completions, got {len(completions)}")
+        except Exception as e:
+            for pending in group:
+                pending.future.set_exception(e)
+            return
+        for pending, completion in zip(group, completions):
+            pending.future.set_result(completion)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "api": self.api,
+                "requests": self.requests,
+                "prompts": self.prompts,
+                "batches": self.batches,
+                "mean_batch_size": self.prompts / self.requests if self.requests else 0.0,
+                "peak_in_flight": self.peak_in_flight,
+                "max_in_flight": self.max_in_flight,
+                "connections_created": self.pool.created,
+                "connections_reused": self.pool.reused
+            }
+
+    def copy(self, **kwargs) -> "HTTPModelLM":
+        """Same server settings with new default kwargs (shares nothing mutable)."""
+        clone = HTTPModelLM(self.model, self.url, self.api, max_in_flight=self.max_in_flight,
+                            batch_window_ms=self.batch_window_s * 1000,
+                            max_batch_size=self.max_batch_size, timeout_s=self.pool.timeout_s,
+                            keep_alive=self.keep_alive, chat_template=self.chat_template)
+        clone.kwargs.update({**self.kwargs, **kwargs})
+        return clone
+
+    def inspect_history(self, n: int = 1):
+        return self.history[-n:]
+
+    def close(self):
+        if self._dispatcher is not None:
+            self._queue.put(None)
+            self._executor.shutdown(wait=True)
+        self.pool.close()
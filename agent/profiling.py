@@ -0,0 +1,229 @@
+"""Per-question profiling spans for agent nodes, DSPy modules and LM calls.
+
+Spans are tracked through a context variable so that LM wrappers and
+tools can annotate whatever node or module is currently running without
+being passed a handle explicitly.
+"""
+import contextvars
+import json
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from agent.lm_base import LMBase
+
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("agent_profile_span", default=None)
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate: words and punctuation, ~4/3 tokens per word."""
+    if not text:
+        return 0
+    pieces = _TOKEN_RE.findall(text)
+    words = sum(1 for p in pieces if p[0].isalnum() or p[0] == "_")
+    return int(words * 4 / 3) + (len(pieces) - words)
+
+
+def prompt_text(prompt: Any = None, messages: Any = None) -> str:
+    """Flatten a prompt string or chat messages into plain text."""
+    if messages:
+        return "\n".join(str(m.get("content", "")) if isinstance(m, dict) else str(m) for m in messages)
+    return prompt if isinstance(prompt, str) else ("" if prompt is None else str(prompt))
+
+
+def completion_text(response: Any) -> str:
+    """Flatten an LM completion list into plain text."""
+    if isinstance(response, list):
+        return "\n".join(
+            r.get("text", json.dumps(r, default=str)) if isinstance(r, dict) else str(r)
+            for r in response
+        )
+    return str(response)
+
+
+def current_span() -> Optional["Span"]:
+    """The innermost active span in this context, if profiling is on."""
+    return _current_span.get()
+
+
+class Span:
+    """Wall/CPU timing plus counters for one unit of work."""
+
+    __slots__ = ("name", "parent", "root", "attributes", "counters", "children",
+                 "_wall_start", "_cpu_start", "wall_ms", "cpu_ms")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Dict[str, Any] = None):
+        self.name = name
+        self.parent = parent
+        self.root = parent.root if parent is not None else self
+        self.attributes = dict(attributes or {})
+        self.counters: Dict[str, float] = {}
+        self.children: List["Span"] = []
+        self.wall_ms = 0.0
+        self.cpu_ms = 0.0
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+        if parent is not None:
+            parent.children.append(self)
+
+    def set(self, **attributes):
+        """Attach attributes (e.g. row counts) to the span."""
+        self.attributes.update(attributes)
+
+    def incr(self, key: str, amount: float = 1):
+        """Increment a counter on this span."""
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def finish(self):
+        self.wall_ms = (time.perf_counter() - self._wall_start) * 1000
+        self.cpu_ms = (time.thread_time() - self._cpu_start) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "wall_ms": round(self.wall_ms, 3),
+            "cpu_ms": round(self.cpu_ms, 3),
+            "attributes": self.attributes,
+            "counters": self.counters,
+            "children": [child.to_dict() for child in self.children]
+        }
+
+    def walk(self) -> Iterator["Span"]:
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+class Profiler:
+    """Collect one span tree per question and aggregate them.
+
+    ``max_questions`` bounds memory in long-running processes by keeping
+    only the most recent span trees.
+    """
+
+    def __init__(self, max_questions: Optional[int] = None):
+        self.questions = deque(maxlen=max_questions)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """Open a child of the current span (or a new root)."""
+        parent = _current_span.get()
+        span = Span(name, parent, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            span.finish()
+            _current_span.reset(token)
+            if parent is None:
+                with self._lock:
+                    self.questions.append(span)
+
+    def wrap(self, name: str, fn):
+        """Return fn wrapped in a span named name."""
+        def wrapped(*args, **kwargs):
+            with self.span(name):
+                return fn(*args, **kwargs)
+        wrapped.__name__ = getattr(fn, "__name__", name)
+        return wrapped
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Aggregate wall/CPU percentiles and counters per span name."""
+        with self._lock:
+            roots = list(self.questions)
+
+        grouped: Dict[str, List[Span]] = {}
+        for root in roots:
+            for span in root.walk():
+                grouped.setdefault(span.name, []).append(span)
+
+        summary = {}
+        for name, spans in grouped.items():
+            walls = [s.wall_ms for s in spans]
+            counters: Dict[str, float] = {}
+            for s in spans:
+                for key, value in s.counters.items():
+                    counters[key] = counters.get(key, 0) + value
+            summary[name] = {
+                "count": len(spans),
+                "mean_ms": sum(walls) / len(walls),
+                "p50_ms": _percentile(walls, 50),
+                "p95_ms": _percentile(walls, 95),
+                "cpu_mean_ms": sum(s.cpu_ms for s in spans) / len(spans),
+                **counters
+            }
+        return summary
+
+    def export_jsonl(self, path: str):
+        """Write one span tree per line."""
+        with self._lock:
+            roots = list(self.questions)
+        with open(path, "w") as f:
+            for root in roots:
+                f.write(json.dumps(root.to_dict(), default=str) + "\n")
+
+
+class ProfiledModule:
+    """Proxy a DSPy module so each call is recorded as a span."""
+
+    def __init__(self, module: Any, profiler: Profiler, name: str):
+        self.module = module
+        self.profiler = profiler
+        self.span_name = name
+
+    def __call__(self, *args, **kwargs):
+        with self.profiler.span(self.span_name):
+            return self.module(*args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "module":
+            raise AttributeError(name)
+        return getattr(self.module, name)
+
+
+class ProfiledLM(LMBase):
+    """Wrap an LM to record call latency, characters and tokens on the current span."""
+
+    def __init__(self, lm: Any):
+        self.lm = lm
+
+    def __call__(self, prompt: Any = None, messages: Any = None, **kwargs) -> List[Any]:
+        span = _current_span.get()
+        start = time.perf_counter()
+        if messages is None:
+            response = self.lm(prompt, **kwargs)
+        else:
+            response = self.lm(prompt=prompt, messages=messages, **kwargs)
+        if span is not None:
+            sent = prompt_text(prompt, messages)
+            received = completion_text(response)
+            span.incr("llm_calls")
+            span.incr("llm_ms", (time.perf_counter() - start) * 1000)
+            span.incr("prompt_chars", len(sent))
+            span.incr("completion_chars", len(received))
+            span.incr("prompt_tokens", estimate_tokens(sent))
+            span.incr("completion_tokens", estimate_tokens(received))
+        return response
+
+    def copy(self, **kwargs) -> "ProfiledLM":
+        return ProfiledLM(self.lm.copy(**kwargs))
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "lm":
+            raise AttributeError(name)
+        return getattr(self.lm, name)
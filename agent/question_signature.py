@@ -0,0 +1,247 @@
+"""Deterministic question normalization into an intent signature.
+
+The signature captures what a question asks for (route, resolved date
+ranges, entities, KPI, grouping dimension, ordering, format) without any
+LLM calls, so paraphrases of the same request collapse onto one key.
+"""
+import calendar
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+
+MONTHS = {name.lower(): idx for idx, name in enumerate(calendar.month_name) if name}
+
+KPI_PATTERNS = [
+    ("aov", r"\baov\b|average order value"),
+    ("gross_margin", r"gross margin|\bmargin\b"),
+    ("return_window", r"\breturns? (window|policy|period)|\breturnable\b"),
+    ("revenue", r"\brevenue\b|\bsales amount\b"),
+    ("quantity", r"\bquantity\b|\bunits? sold\b|\bqty\b"),
+    ("order_count", r"how many orders|number of orders|\border count\b"),
+    ("product_count", r"how many products|number of products"),
+]
+
+DIMENSIONS = [
+    ("category", r"\b(?:product\s+)?categor(?:y|ies)\b"),
+    ("customer", r"\bcustomers?\b"),
+    ("product", r"\bproducts?\b"),
+    ("supplier", r"\bsuppliers?\b"),
+    ("employee", r"\bemployees?\b"),
+]
+
+QUALIFIERS = ["unopened", "opened", "perishable", "non-perishable"]
+
+DOC_HINTS = r"policy|marketing calendar|kpi (docs|definition)|according to|as defined"
+SQL_HINTS = r"revenue|quantity|orders?|top \d+|customers?|aov|average order value|margin|total"
+# The noun after these words is what a question ranks or picks.
+HEAD_TRIGGERS = r"\b(?:top(?:\s+\d+)?|which|what|best|worst)\s+"
+# "which ..." or "top ..." without a count above one: the answer is a single item.
+SINGLE_PICK = r"\bwhich\b|\btop\b(?!\s+\d)|\btop\s+1\b"
+DIRECTION_WORDS = r"\b(top|highest|most|best|maximum|largest|lowest|least|bottom|minimum|worst)\b"
+
+# Phrases that restate the answer format, a KPI formula or the documented
+# cost assumption; they carry no constraint of their own.
+BOILERPLATE = [
+    r"(?:^|(?<=[.?!]))\s*return\s+(?:an?\s+|the\s+)?(?:integer|int|float|number|string|str|list|"
+    r"value|answer|\{|\[)[^?!]*?(?:\.(?!\d)|$)",
+    r"\b[a-z_]+\((?:[^()]|\([^()]*\))*\)",
+    r"\bassume\b[^.?!]*\b(?:70\s*%|0\.7)[^.?!]*",
+    r"\bper (?:the|our)\b",
+]
+# Words that never narrow what a question asks for.
+FILLER = frozenset("""
+    a an the of in on for to from by during at with and or as is was were are be been being
+    what which who whose how much did does do has had have it its this that these those there
+    me us give show list find tell get compute calculate using use uses used according defined
+    definition docs doc kpi kpis calendar marketing policy total overall all time alltime ever
+    dates date period sold value amount order orders details days number count please rounded
+    decimals decimal approximately approximated placed
+""".split())
+
+
+class QuestionNormalizer:
+    """Resolve campaign names, categories and KPIs from the docs corpus."""
+
+    def __init__(self, docs_dir: str):
+        self.docs_dir = Path(docs_dir)
+        self.campaigns = self._load_campaigns()
+        self.categories = self._load_categories()
+
+    def _read_doc(self, name: str) -> str:
+        path = self.docs_dir / name
+        return path.read_text(encoding="utf-8") if path.exists() else ""
+
+    def _load_campaigns(self) -> Dict[str, Tuple[str, str]]:
+        """Parse '## Name' / '- Dates: start to end' pairs from the calendar."""
+        campaigns = {}
+        current = None
+        for line in self._read_doc("marketing_calendar.md").splitlines():
+            header = re.match(r"^##\s+(.+)$", line.strip())
+            if header:
+                current = header.group(1).strip()
+                continue
+            dates = re.search(r"(\d{4}-\d{2}-\d{2})\s+to\s+(\d{4}-\d{2}-\d{2})", line)
+            if current and dates:
+                campaigns[current] = (dates.group(1), dates.group(2))
+        return campaigns
+
+    def _load_categories(self) -> List[str]:
+        """Parse the category list from the catalog snapshot."""
+        match = re.search(r"Categories include (.+?)\.\s*$", self._read_doc("catalog.md"), re.MULTILINE)
+        if not match:
+            return []
+        return [c.strip() for c in match.group(1).split(",") if c.strip()]
+
+    def resolve_campaigns(self, question: str) -> List[str]:
+        """Campaigns whose name tokens all appear in the question."""
+        tokens = set(re.findall(r"[a-z0-9]+", question.lower()))
+        matched = []
+        for name in self.campaigns:
+            name_tokens = set(re.findall(r"[a-z0-9]+", name.lower()))
+            if name_tokens and name_tokens <= tokens:
+                matched.append(name)
+        return matched
+
+    def resolve_date_ranges(self, question: str) -> List[Tuple[str, str]]:
+        """Resolve campaign names, 'Month YYYY' and bare years into ISO ranges."""
+        text = question.lower()
+        ranges = []
+
+        for name in self.resolve_campaigns(question):
+            ranges.append(self.campaigns[name])
+
+        for month, year in re.findall(r"\b(" + "|".join(MONTHS) + r")\s+(\d{4})\b", text):
+            month_idx = MONTHS[month]
+            last_day = calendar.monthrange(int(year), month_idx)[1]
+            ranges.append((f"{year}-{month_idx:02d}-01", f"{year}-{month_idx:02d}-{last_day:02d}"))
+
+        if not ranges:
+            for year in re.findall(r"\b(19\d{2}|20\d{2})\b", text):
+                ranges.append((f"{year}-01-01", f"{year}-12-31"))
+
+        return sorted(set(ranges))
+
+    def resolve_categories(self, question: str) -> List[str]:
+        """Categories named in the question, ignoring those inside campaign names."""
+        text = question.lower()
+        for name in self.campaigns:
+            text = text.replace(name.lower(), " ")
+        return sorted(c for c in self.categories if c.lower() in text)
+
+    def signature(self, question: str, format_hint: str) -> Dict[str, Any]:
+        """Build the normalized intent signature for a question."""
+        text = question.lower()
+
+        kpi = next((name for name, pattern in KPI_PATTERNS if re.search(pattern, text)), None)
+        dimensions = find_dimensions(text)
+
+        top_n = None
+        top_match = re.search(r"\btop\s+(\d+)\b", text)
+        if top_match:
+            top_n = int(top_match.group(1))
+
+        direction = None
+        if re.search(r"\b(lowest|least|bottom|minimum|worst)\b", text):
+            direction = "asc"
+        elif re.search(DIRECTION_WORDS, text):
+            direction = "desc"
+
+        qualifiers = sorted(q for q in QUALIFIERS if re.search(r"\b" + re.escape(q) + r"\b", text))
+
+        uses_docs = (
+            bool(re.search(DOC_HINTS, text))
+            or bool(self.resolve_campaigns(question))
+            or kpi in ("aov", "gross_margin", "return_window")
+        )
+        uses_sql = bool(re.search(SQL_HINTS, text)) and kpi != "return_window"
+        if uses_docs and uses_sql:
+            route = "hybrid"
+        elif uses_sql:
+            route = "sql"
+        else:
+            route = "rag"
+
+        return {
+            "route": route,
+            "date_ranges": self.resolve_date_ranges(question),
+            "entities": self.resolve_categories(question),
+            "kpi": kpi,
+            "dimension": head_dimension(text, dimensions),
+            "dimensions": sorted({name for _, name in dimensions}),
+            "direction": direction,
+            "top_n": top_n,
+            "qualifiers": qualifiers,
+            "residual": self.residual_terms(question),
+            "format_hint": re.sub(r"\s+", "", format_hint),
+        }
+
+    def residual_terms(self, question: str) -> List[str]:
+        """Content words the other signature fields do not account for.
+
+        Countries, product names, "per customer", "excluding discontinued"
+        and the like all land here; two questions differing only in such
+        words must not share a key or be answered by a template that
+        ignores them.
+        """
+        text = question.lower()
+        for pattern in BOILERPLATE:
+            text = re.sub(pattern, " ", text)
+        consumed = [pattern for _, pattern in KPI_PATTERNS + DIMENSIONS]
+        consumed += [re.escape(name.lower()) for name in self.campaigns]
+        consumed += [re.escape(c.lower()) for c in self.categories]
+        consumed += [r"\b" + re.escape(q) + r"\b" for q in QUALIFIERS]
+        consumed += [r"\b(" + "|".join(MONTHS) + r")\s+\d{4}\b", r"\b(19|20)\d{2}\b",
+                     r"\btop\s+\d+\b", DIRECTION_WORDS, DOC_HINTS]
+        for pattern in consumed:
+            text = re.sub(pattern, " ", text)
+        return sorted({w for w in re.findall(r"[a-z0-9]+", text) if w not in FILLER})
+
+
+def find_dimensions(text: str) -> List[Tuple[int, str]]:
+    """(position, dimension) for every dimension noun, in question order.
+
+    Matched spans are blanked as they are found, so "product category"
+    counts once, as a category.
+    """
+    found = []
+    for name, pattern in DIMENSIONS:
+        for match in re.finditer(pattern, text):
+            found.append((match.start(), name))
+            text = text[:match.start()] + " " * (match.end() - match.start()) + text[match.end():]
+    return sorted(found)
+
+
+def head_dimension(text: str, dimensions: List[Tuple[int, str]]) -> Optional[str]:
+    """The dimension a question ranks or picks: the first one after "top N"/"which", else the first."""
+    if not dimensions:
+        return None
+    trigger = re.search(HEAD_TRIGGERS, text)
+    if trigger:
+        after = [name for start, name in dimensions if start >= trigger.end()]
+        if after:
+            return after[0]
+    return dimensions[0][1]
+
+
+def asks_for_one(question: str) -> bool:
+    """Whether the question picks a single item ("which category", "the top customer")."""
+    return bool(re.search(SINGLE_PICK, question.lower()))
+
+
+def signature_key(signature: Dict[str, Any]) -> str:
+    """Stable hash of a signature dict."""
+    payload = json.dumps(signature, sort_keys=True, default=list)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(signature: Optional[Dict[str, Any]]) -> bool:
+    """Only signatures with a recognized KPI, one dimension and no unaccounted words may share answers.
+
+    A second dimension noun ("top products ... for customers") is a filter
+    or grouping the key cannot pin down.
+    """
+    return (bool(signature) and signature.get("kpi") is not None and not signature.get("residual")
+            and len(signature.get("dimensions") or []) <= 1)
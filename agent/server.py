@@ -0,0 +1,282 @@
+"""Minimal asyncio HTTP/JSON service around one warm HybridAgent.
+
+Endpoints:
+    POST /ask       {"question": ..., "format_hint": ..., "id": optional}
+    GET  /metrics   request counts, latency histograms, cache stats
+    GET  /healthz   liveness
+
+``HybridAgent.run`` is synchronous, so requests run on a bounded thread
+pool. Admission control keeps at most ``max_concurrency`` questions
+running and ``max_queue`` waiting; anything beyond that is rejected with
+429 and ``Retry-After`` rather than piling up behind a slow model. A
+request that times out answers 504 but keeps its slot until the worker
+thread actually finishes, so the thread pool is never oversubscribed.
+"""
+import asyncio
+import json
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, Dict, Optional, Tuple
+
+from agent.graph_hybrid import HybridAgent
+
+
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+MAX_BODY_BYTES = 64 * 1024
+
+
+class LatencyHistogram:
+    """Cumulative latency buckets (Prometheus style) plus count and sum."""
+
+    def __init__(self, buckets_ms: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, ms: float):
+        with self._lock:
+            self.counts[bisect_left(self.buckets_ms, ms)] += 1
+            self.count += 1
+            self.sum_ms += ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bucket bound containing the q-quantile (None if empty or above the top bucket)."""
+        with self._lock:
+            if not self.count:
+                return None
+            target, seen = q * self.count, 0
+            for bound, count in zip(self.buckets_ms, self.counts):
+                seen += count
+                if seen >= target:
+                    return bound
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(self.buckets_ms, self.counts):
+                cumulative += count
+                buckets[f"le_{bound:g}"] = cumulative
+            buckets["le_inf"] = self.count
+            count, total = self.count, self.sum_ms
+        return {
+            "count": count,
+            "sum_ms": round(total, 3),
+            "mean_ms": round(total / count, 3) if count else 0.0,
+            "p50_le_ms": self.quantile(0.5),
+            "p95_le_ms": self.quantile(0.95),
+            "buckets": buckets
+        }
+
+
+class AgentServer:
+    """Serve HybridAgent.run over HTTP with admission control."""
+
+    def __init__(self, agent: HybridAgent, host: str = "127.0.0.1", port: int = 8080,
+                 max_concurrency: int = 2, max_queue: int = 8, request_timeout_s: float = 300.0,
+                 stats_sources: Dict[str, Any] = None):
+        self.agent = agent
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.request_timeout_s = request_timeout_s
+        self.stats_sources = stats_sources or {}
+
+        self.started_at = time.time()
+        self.in_flight = 0
+        self.waiting = 0
+        self.status_counts: Dict[int, int] = {}
+        self.latency = LatencyHistogram()
+        self.node_latency: Dict[str, LatencyHistogram] = {}
+
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="agent")
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._server: Optional[asyncio.Server] = None
+
+    async def start(self) -> Tuple[str, int]:
+        """Bind and start serving; returns the bound (host, port)."""
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.host, self.port = self._server.sockets[0].getsockname()[:2]
+        return self.host, self.port
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._executor.shutdown(wait=False)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload, extra = await self._dispatch(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._write_response(writer, status, payload, extra, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader
+                            ) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, path, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            return "BAD", "", {}, b""
+        headers = {}
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # The body cannot be delimited, so the connection cannot be reused.
+            headers["connection"] = "close"
+            return "BAD_LENGTH", path, headers, b""
+        if length > MAX_BODY_BYTES:
+            return "TOO_LARGE", path, headers, b""
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path.split("?", 1)[0], headers, body
+
+    def _write_response(self, writer: asyncio.StreamWriter, status: int, payload: Any,
+                        extra_headers: Dict[str, str], keep_alive: bool):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        reason = HTTPStatus(status).phrase
+        headers = {
+            "Content-Type": "application/json",
+            "Content-Length": str(len(body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+            **extra_headers
+        }
+        head = f"HTTP/1.1 {status} {reason}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+
+    async def _dispatch(self, method: str, path: str, body: bytes
+                        ) -> Tuple[int, Any, Dict[str, str]]:
+        if method == "BAD":
+            return self._count(400, {"error": "malformed request line"})
+        if method == "BAD_LENGTH":
+            return self._count(400, {"error": "malformed Content-Length"})
+        if method == "TOO_LARGE":
+            return self._count(413, {"error": f"body exceeds {MAX_BODY_BYTES} bytes"})
+        if path == "/ask" and method == "POST":
+            return await self._ask(body)
+        if path == "/metrics" and method == "GET":
+            return 200, self.metrics(), {}
+        if path == "/healthz" and method == "GET":
+            return 200, {"status": "ok"}, {}
+        if path in ("/ask", "/metrics", "/healthz"):
+            return self._count(405, {"error": f"{method} not allowed on {path}"})
+        return self._count(404, {"error": f"no route for {path}"})
+
+    def _count(self, status: int, payload: Any, headers: Dict[str, str] = None):
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        return status, payload, headers or {}
+
+    async def _ask(self, body: bytes) -> Tuple[int, Any, Dict[str, str]]:
+        try:
+            request = json.loads(body or b"{}")
+            question = request["question"]
+            format_hint = request["format_hint"]
+        except (ValueError, KeyError, TypeError):
+            return self._count(400, {"error": "body must be JSON with 'question' and 'format_hint'"})
+
+        # Admission control: everything here runs on the event loop thread, so no lock.
+        if self.in_flight + self.waiting >= self.max_concurrency + self.max_queue:
+            return self._count(429, {"error": "server busy"}, {"Retry-After": "1"})
+
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, self.agent.run, question, format_hint)
+        except Exception as e:
+            self._release(None)
+            return self._count(500, {"error": str(e)})
+        # The slot goes back when the thread finishes, not when the request gives up.
+        future.add_done_callback(self._release)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=self.request_timeout_s)
+        except asyncio.TimeoutError:
+            return self._count(504, {"error": f"timed out after {self.request_timeout_s:g}s"})
+        except Exception as e:
+            return self._count(500, {"error": str(e)})
+
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.latency.observe(latency_ms)
+        self._observe_nodes(result.pop("profile", None))
+        result.pop("trace", None)
+        result["id"] = request.get("id")
+        result["latency_ms"] = round(latency_ms, 3)
+        return self._count(200, result)
+
+    def _release(self, future: Optional[asyncio.Future]):
+        if future is not None and not future.cancelled():
+            future.exception()  # retrieved, so an abandoned failure is not logged as unhandled
+        self.in_flight -= 1
+        self._slots.release()
+
+    def _observe_nodes(self, profile: Optional[Dict[str, Any]]):
+        if not profile:
+            return
+        for child in profile.get("children", []):
+            histogram = self.node_latency.get(child["name"])
+            if histogram is None:
+                histogram = self.node_latency.setdefault(child["name"], LatencyHistogram())
+            histogram.observe(child["wall_ms"])
+
+    def metrics(self) -> Dict[str, Any]:
+        """Request counters, latency histograms and cache statistics."""
+        caches = {}
+        for name, source in self.stats_sources.items():
+            if source is not None:
+                caches[name] = source.stats()
+        if self.agent.sql_templates is not None:
+            caches["sql_templates"] = self.agent.sql_templates.stats()
+        if self.agent.sql_rewriter is not None:
+            caches["sql_rewrite"] = self.agent.sql_rewriter.stats()
+        return {
+            "uptime_s": round(time.time() - self.started_at, 3),
+            "in_flight": self.in_flight,
+            "queued": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "responses": {str(k): v for k, v in sorted(self.status_counts.items())},
+            "latency": self.latency.to_dict(),
+            "node_latency": {name: h.to_dict() for name, h in sorted(self.node_latency.items())},
+            "caches": caches,
+            "startup": self.agent.startup_report()
+        }
+
@@ -0,0 +1,118 @@
+"""Self-consistency selection among parallel SQL candidates.
+
+Several NL→SQL samples are executed and grouped by a fingerprint of their
+result. The winning group is the one whose result projects onto the
+format_hint, then the one most candidates agree on, then the one with
+rows; within a group the earliest (lowest temperature) query is kept.
+"""
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from agent.answer_projector import project_result
+
+
+def candidate_temperatures(k: int, max_temperature: float = 0.9) -> List[float]:
+    """Spread k sampling temperatures evenly over [0, max_temperature]."""
+    if k <= 1:
+        return [0.0]
+    return [round(max_temperature * i / (k - 1), 2) for i in range(k)]
+
+
+def _normalize(value: Any, precision: int) -> Any:
+    if isinstance(value, float):
+        return round(value, precision)
+    return value
+
+
+def result_fingerprint(rows: Sequence[Sequence[Any]], ordered: bool = False,
+                       precision: int = 2) -> str:
+    """Hash a result set, ignoring row order unless ordered and rounding floats."""
+    normalized = [[_normalize(v, precision) for v in row] for row in rows]
+    if not ordered:
+        normalized.sort(key=lambda row: json.dumps(row, default=str))
+    payload = json.dumps(normalized, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class SQLCandidate:
+    """One sampled query and its execution outcome."""
+    index: int
+    temperature: float
+    sql: str
+    explanation: str = ""
+    success: bool = False
+    rows: List[tuple] = field(default_factory=list)
+    columns: List[str] = field(default_factory=list)
+    error: str = ""
+    exec_ms: float = 0.0
+    fingerprint: str = ""
+    shape_ok: bool = False
+    votes: int = 0
+    rewrites: List[str] = field(default_factory=list)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "temperature": self.temperature,
+            "success": self.success,
+            "rows": len(self.rows),
+            "exec_ms": round(self.exec_ms, 3),
+            "fingerprint": self.fingerprint,
+            "shape_ok": self.shape_ok,
+            "votes": self.votes,
+            "rewrites": self.rewrites,
+            "error": self.error
+        }
+
+
+def select_candidate(candidates: List[SQLCandidate], format_hint: str) -> Optional[SQLCandidate]:
+    """Vote among executed candidates; None when every candidate failed."""
+    groups: Dict[str, List[SQLCandidate]] = {}
+    for candidate in candidates:
+        if not candidate.success:
+            continue
+        candidate.fingerprint = result_fingerprint(candidate.rows)
+        candidate.shape_ok = (
+            bool(candidate.rows)
+            and project_result(candidate.columns, candidate.rows, format_hint) is not None
+        )
+        groups.setdefault(candidate.fingerprint, []).append(candidate)
+
+    if not groups:
+        return None
+
+    for members in groups.values():
+        for candidate in members:
+            candidate.votes = len(members)
+
+    best = max(
+        groups.values(),
+        key=lambda members: (
+            sum(c.shape_ok for c in members),
+            len(members),
+            bool(members[0].rows),
+            -min(c.index for c in members)
+        )
+    )
+    return min(best, key=lambda c: (not c.shape_ok, c.index))
+
+
+def candidate_errors(candidates: List[SQLCandidate], chosen: SQLCandidate) -> str:
+    """Error message for the repairer when every candidate failed.
+
+    The chosen candidate's error comes first, since its SQL is the one
+    sent for repair; the other candidates' SQL and errors follow.
+    """
+    seen = {(chosen.sql, chosen.error)}
+    others = []
+    for c in candidates:
+        if (c.sql, c.error) not in seen:
+            seen.add((c.sql, c.error))
+            others.append(f"- {c.sql or '(no SQL)'} -> {c.error or 'query failed'}")
+    lines = [chosen.error or "query failed"]
+    if others:
+        lines += ["Other candidate queries also failed:"] + others
+    return "\n".join(lines)
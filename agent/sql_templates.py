@@ -0,0 +1,315 @@
+"""Parameterized SQL templates for recurring KPI questions.
+
+Templates are matched against the deterministic question signature from
+``agent.question_signature``; a confident match yields parameter-bound SQL
+that is executed directly, bypassing the planner and NL→SQL LLM calls.
+The SQL mirrors the formulas in ``docs/kpi_definitions.md`` and the
+patterns in ``optimize_dspy.TRAINING_EXAMPLES``.
+"""
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from agent.format_hints import compile_format_hint
+from agent.question_signature import QuestionNormalizer
+
+
+REVENUE = "SUM(od.UnitPrice * od.Quantity * (1 - od.Discount))"
+MARGIN = "SUM((od.UnitPrice - 0.7 * od.UnitPrice) * od.Quantity * (1 - od.Discount))"
+DATE_FILTER = "DATE(o.OrderDate) BETWEEN ? AND ?"
+
+DEFAULT_MIN_CONFIDENCE = 0.85
+
+
+@dataclass
+class SQLTemplate:
+    """A prepared SQL statement plus the signature conditions it answers."""
+    name: str
+    builder: Callable[[Dict[str, Any]], Optional["TemplateMatch"]]
+    description: str = ""
+
+
+@dataclass
+class TemplateMatch:
+    """A template bound to concrete parameters for one question."""
+    template: str
+    sql: str
+    params: List[Any] = field(default_factory=list)
+    confidence: float = 1.0
+    constraints: Dict[str, Any] = field(default_factory=dict)
+
+
+def render_sql(sql: str, params: List[Any]) -> str:
+    """Inline bound parameters as SQL literals, for display and citations only."""
+    if not params:
+        return sql
+    values = iter(params)
+
+    def literal(_match):
+        value = next(values)
+        if isinstance(value, str):
+            return "'" + value.replace("'", "''") + "'"
+        return str(value)
+
+    return re.sub(r"\?", literal, sql)
+
+
+def output_aliases(sql: str) -> List[str]:
+    """Column aliases of a template's SELECT list."""
+    return [a.lower() for a in re.findall(r"\bAS\s+(\w+)", sql.split("\nFROM", 1)[0], re.IGNORECASE)]
+
+
+def _single_range(sig: Dict[str, Any]):
+    """The one resolved date range, or None if absent/ambiguous."""
+    ranges = sig["date_ranges"]
+    return tuple(ranges[0]) if len(ranges) == 1 else None
+
+
+def _date_clause(sig: Dict[str, Any], params: List[Any]) -> Optional[str]:
+    date_range = _single_range(sig)
+    if date_range is None:
+        return None
+    params.extend(date_range)
+    return DATE_FILTER
+
+
+def _aov(sig: Dict[str, Any]) -> Optional[TemplateMatch]:
+    if sig["kpi"] != "aov" or sig["entities"] or sig["format_hint"] != "float":
+        return None
+    params: List[Any] = []
+    where = _date_clause(sig, params)
+    if sig["date_ranges"] and where is None:
+        return None
+    sql = (
+        f"SELECT {REVENUE} / COUNT(DISTINCT o.OrderID) AS aov\n"
+        "FROM Orders o\n"
+        'JOIN "Order Details" od ON o.OrderID = od.OrderID'
+    )
+    if where:
+        sql += f"\nWHERE {where}"
+    return TemplateMatch("aov", sql + ";", params)
+
+
+def _revenue_total(sig: Dict[str, Any]) -> Optional[TemplateMatch]:
+    if sig["kpi"] != "revenue" or sig["top_n"] or sig["format_hint"] not in ("float", "int"):
+        return None
+    if len(sig["entities"]) > 1 or (sig["dimension"] is not None and not sig["entities"]):
+        return None
+    params: List[Any] = []
+    joins = ['JOIN "Order Details" od ON o.OrderID = od.OrderID']
+    filters = []
+    if sig["entities"]:
+        joins += [
+            "JOIN Products p ON od.ProductID = p.ProductID",
+            "JOIN Categories c ON p.CategoryID = c.CategoryID",
+        ]
+        filters.append("c.CategoryName = ?")
+        params.append(sig["entities"][0])
+    if sig["date_ranges"]:
+        date_range = _single_range(sig)
+        if date_range is None:
+            return None
+        filters.append(DATE_FILTER)
+        params.extend(date_range)
+    sql = f"SELECT {REVENUE} AS revenue\nFROM Orders o\n" + "\n".join(joins)
+    if filters:
+        sql += "\nWHERE " + " AND ".join(filters)
+    name = "revenue_by_category" if sig["entities"] else "revenue_total"
+    return TemplateMatch(name, sql + ";", params)
+
+
+def _top_products_by_revenue(sig: Dict[str, Any]) -> Optional[TemplateMatch]:
+    if sig["kpi"] != "revenue" or sig["dimension"] != "product" or sig["direction"] != "desc":
+        return None
+    if not sig["format_hint"].startswith("list[") and not sig["format_hint"].startswith("{"):
+        return None
+    limit = sig["top_n"] or 1
+    params: List[Any] = []
+    joins = ["JOIN Products p ON od.ProductID = p.ProductID"]
+    filters = []
+    if sig["date_ranges"]:
+        date_range = _single_range(sig)
+        if date_range is None:
+            return None
+        joins.append("JOIN Orders o ON od.OrderID = o.OrderID")
+        filters.append(DATE_FILTER)
+        params.extend(date_range)
+    if sig["entities"]:
+        return None
+    sql = (
+        f"SELECT p.ProductName AS product, {REVENUE} AS revenue\n"
+        'FROM "Order Details" od\n' + "\n".join(joins)
+    )
+    if filters:
+        sql += "\nWHERE " + " AND ".join(filters)
+    sql += "\nGROUP BY p.ProductID, p.ProductName\nORDER BY revenue DESC\nLIMIT ?"
+    params.append(limit)
+    return TemplateMatch("top_products_by_revenue", sql + ";", params)
+
+
+def _top_category_by_quantity(sig: Dict[str, Any]) -> Optional[TemplateMatch]:
+    if sig["kpi"] != "quantity" or sig["dimension"] != "category" or sig["direction"] != "desc":
+        return None
+    if sig["entities"]:
+        return None
+    if not sig["format_hint"].startswith(("{", "list[")):
+        return None
+    params: List[Any] = []
+    sql = (
+        "SELECT c.CategoryName AS category, SUM(od.Quantity) AS quantity\n"
+        'FROM "Order Details" od\n'
+        "JOIN Orders o ON od.OrderID = o.OrderID\n"
+        "JOIN Products p ON od.ProductID = p.ProductID\n"
+        "JOIN Categories c ON p.CategoryID = c.CategoryID"
+    )
+    where = _date_clause(sig, params)
+    if sig["date_ranges"] and where is None:
+        return None
+    if where:
+        sql += f"\nWHERE {where}"
+    sql += "\nGROUP BY c.CategoryName\nORDER BY quantity DESC\nLIMIT ?"
+    params.append(sig["top_n"] or 1)
+    return TemplateMatch("top_category_by_quantity", sql + ";", params)
+
+
+def _top_customer(sig: Dict[str, Any]) -> Optional[TemplateMatch]:
+    if sig["dimension"] != "customer" or sig["direction"] != "desc":
+        return None
+    if sig["kpi"] not in ("gross_margin", "revenue") or sig["entities"]:
+        return None
+    if not sig["format_hint"].startswith(("{", "list[")):
+        return None
+    metric, alias = (MARGIN, "margin") if sig["kpi"] == "gross_margin" else (REVENUE, "revenue")
+    params: List[Any] = []
+    sql = (
+        f"SELECT cu.CompanyName AS customer, {metric} AS {alias}\n"
+        "FROM Customers cu\n"
+        "JOIN Orders o ON cu.CustomerID = o.CustomerID\n"
+        'JOIN "Order Details" od ON o.OrderID = od.OrderID'
+    )
+    where = _date_clause(sig, params)
+    if sig["date_ranges"] and where is None:
+        return None
+    if where:
+        sql += f"\nWHERE {where}"
+    sql += f"\nGROUP BY cu.CustomerID, cu.CompanyName\nORDER BY {alias} DESC\nLIMIT ?"
+    params.append(sig["top_n"] or 1)
+    return TemplateMatch(f"top_customer_by_{alias}", sql + ";", params)
+
+
+def _order_count(sig: Dict[str, Any]) -> Optional[TemplateMatch]:
+    if sig["kpi"] != "order_count" or sig["entities"] or sig["format_hint"] != "int":
+        return None
+    params: List[Any] = []
+    sql = "SELECT COUNT(*) AS order_count\nFROM Orders o"
+    where = _date_clause(sig, params)
+    if sig["date_ranges"] and where is None:
+        return None
+    if where:
+        sql += f"\nWHERE {where}"
+    return TemplateMatch("order_count", sql + ";", params)
+
+
+DEFAULT_TEMPLATES = [
+    SQLTemplate("aov", _aov, "Average order value, optionally in a date range"),
+    SQLTemplate("revenue_total", _revenue_total, "Revenue, optionally for one category and date range"),
+    SQLTemplate("top_products_by_revenue", _top_products_by_revenue, "Top N products by revenue"),
+    SQLTemplate("top_category_by_quantity", _top_category_by_quantity, "Top category by quantity sold"),
+    SQLTemplate("top_customer", _top_customer, "Top customer by revenue or gross margin"),
+    SQLTemplate("order_count", _order_count, "Number of orders, optionally in a date range"),
+]
+
+
+def _confidence(sig: Dict[str, Any], question: str, match: TemplateMatch) -> float:
+    """Score how fully the template accounts for the question's constraints."""
+    score = 1.0
+    text = question.lower()
+    if sig["residual"]:
+        # Words the signature did not consume are filters the template cannot express.
+        score -= 0.5
+    if sig["qualifiers"]:
+        score -= 0.3
+    if len(sig["dimensions"]) > 1:
+        # "Top products ... for customers": the template groups by one dimension only.
+        score -= 0.5
+    if re.search(r"\bper (day|week|month|quarter|year|region|country)\b|\beach\b|"
+                 r"\bby (month|week|quarter|year|region|country)\b|"
+                 r"\b(monthly|weekly|yearly|trend|compare|versus|vs)\b", text):
+        score -= 0.4
+    if match.template == "top_customer_by_margin" and not re.search(r"70\s*%|0\.7\b", text):
+        score -= 0.3
+    return round(max(score, 0.0), 2)
+
+
+class SQLTemplateLibrary:
+    """Match questions to prepared SQL templates and track coverage."""
+
+    def __init__(self, normalizer: QuestionNormalizer,
+                 templates: List[SQLTemplate] = None,
+                 min_confidence: float = DEFAULT_MIN_CONFIDENCE):
+        self.normalizer = normalizer
+        self.templates = list(templates or DEFAULT_TEMPLATES)
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.matches: Dict[str, int] = {}
+        self.latencies: Dict[str, List[float]] = {"template": [], "llm": []}
+
+    def match(self, question: str, format_hint: str) -> Optional[TemplateMatch]:
+        """Return the first confident template match for a question, if any."""
+        sig = self.normalizer.signature(question, format_hint)
+        if sig["route"] == "rag":
+            return self._record(None)
+
+        for template in self.templates:
+            match = template.builder(sig)
+            if match is None:
+                continue
+            match.confidence = _confidence(sig, question, match)
+            if match.confidence < self.min_confidence:
+                continue
+            fields = compile_format_hint(format_hint).fields
+            if fields and {name.lower() for name, _ in fields} != set(output_aliases(match.sql)):
+                # The answer would come out under the wrong keys (e.g. customers as products).
+                continue
+            match.constraints = {
+                "date_ranges": sig["date_ranges"],
+                "entities": sig["entities"],
+                "kpi_formulas": sig["kpi"],
+                "constraints": f"template:{match.template}"
+            }
+            return self._record(match)
+
+        return self._record(None)
+
+    def _record(self, match: Optional[TemplateMatch]) -> Optional[TemplateMatch]:
+        with self._lock:
+            self.lookups += 1
+            if match is not None:
+                self.matches[match.template] = self.matches.get(match.template, 0) + 1
+        return match
+
+    def record_latency(self, path: str, seconds: float):
+        """Record SQL generation+execution latency for the 'template' or 'llm' path."""
+        with self._lock:
+            self.latencies.setdefault(path, []).append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """Coverage and mean latency per path."""
+        with self._lock:
+            matched = sum(self.matches.values())
+            latency = {
+                path: {
+                    "count": len(values),
+                    "mean_ms": 1000 * sum(values) / len(values) if values else 0.0
+                }
+                for path, values in self.latencies.items()
+            }
+            return {
+                "lookups": self.lookups,
+                "matched": matched,
+                "coverage": matched / self.lookups if self.lookups else 0.0,
+                "by_template": dict(self.matches),
+                "latency": latency
+            }
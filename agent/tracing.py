@@ -0,0 +1,202 @@
+"""Optional OpenTelemetry-compatible span emission.
+
+Spans follow the OTLP trace data model and are written by
+``OTLPJsonFileExporter`` as OTLP/JSON ``ExportTraceServiceRequest``
+objects, one per line, so they can be replayed into any collector later
+without running one during batch jobs. When tracing is not configured the
+global tracer hands out a shared no-op span, keeping overhead to a single
+attribute check per instrumented call.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+SERVICE_NAME = "retail-analytics-copilot"
+SCOPE_NAME = "retail_analytics_copilot"
+
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+SPAN_KIND_INTERNAL = 1
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("otel_span", default=None)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class TraceSpan:
+    """One finished-or-running span in OTLP shape."""
+
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_span_id",
+                 "start_ns", "end_ns", "attributes", "status_code", "status_message", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, parent: Optional["TraceSpan"],
+                 attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent.span_id if parent is not None else ""
+        self.attributes = attributes
+        self.status_code = STATUS_UNSET
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_status(self, code: int, message: str = ""):
+        self.status_code = code
+        self.status_message = message
+
+    def __enter__(self) -> "TraceSpan":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc is not None:
+            self.set_status(STATUS_ERROR, f"{exc_type.__name__}: {exc}")
+        elif self.status_code == STATUS_UNSET:
+            self.status_code = STATUS_OK
+        self.end_ns = time.time_ns()
+        _current_span.reset(self._token)
+        self.tracer.exporter.export(self)
+        return False
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()
+            ],
+            "status": {"code": self.status_code}
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+class _NoopSpan:
+    """Shared do-nothing span returned while tracing is disabled."""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_status(self, code: int, message: str = ""):
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class OTLPJsonFileExporter:
+    """Buffer finished spans and append them to a file as OTLP/JSON lines."""
+
+    def __init__(self, path: str, service_name: str = SERVICE_NAME, batch_size: int = 512):
+        self.path = path
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.exported = 0
+        self._buffer: List[TraceSpan] = []
+        self._lock = threading.Lock()
+
+    def export(self, span: TraceSpan):
+        with self._lock:
+            self._buffer.append(span)
+            flush = len(self._buffer) >= self.batch_size or not span.parent_span_id
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """Write buffered spans as one ExportTraceServiceRequest line."""
+        with self._lock:
+            spans, self._buffer = self._buffer, []
+            if not spans:
+                return
+            request = {
+                "resourceSpans": [{
+                    "resource": {"attributes": [
+                        {"key": "service.name", "value": {"stringValue": self.service_name}}
+                    ]},
+                    "scopeSpans": [{
+                        "scope": {"name": SCOPE_NAME},
+                        "spans": [span.to_otlp() for span in spans]
+                    }]
+                }]
+            }
+            with open(self.path, "a") as f:
+                f.write(json.dumps(request, default=str) + "\n")
+            self.exported += len(spans)
+
+    def shutdown(self):
+        self.flush()
+
+
+class Tracer:
+    """Create spans when an exporter is configured, no-ops otherwise."""
+
+    def __init__(self, exporter: Optional[OTLPJsonFileExporter] = None):
+        self.exporter = exporter
+        self.enabled = exporter is not None
+
+    def span(self, name: str, **attributes):
+        """Start a child of the current span (use as a context manager)."""
+        if not self.enabled:
+            return NOOP_SPAN
+        return TraceSpan(self, name, _current_span.get(), attributes)
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """The process-wide tracer (disabled unless configure_tracing was called)."""
+    return _tracer
+
+
+def configure_tracing(exporter: Optional[OTLPJsonFileExporter]) -> Tracer:
+    """Install a process-wide tracer; pass None to disable tracing."""
+    global _tracer
+    _tracer = Tracer(exporter)
+    return _tracer
+
+
+def traced(name: str, fn):
+    """Wrap fn so each call runs inside a span named name while tracing is on."""
+    def wrapped(*args, **kwargs):
+        tracer = _tracer
+        if not tracer.enabled:
+            return fn(*args, **kwargs)
+        with tracer.span(name):
+            return fn(*args, **kwargs)
+    wrapped.__name__ = getattr(fn, "__name__", name)
+    return wrapped
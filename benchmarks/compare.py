@@ -0,0 +1,77 @@
+"""Diff two benchmark result files and flag regressions.
+
+Usage:
+    python -m benchmarks.compare baseline.json current.json --threshold 0.1
+"""
+import json
+from typing import Any, Dict, Iterator, Tuple
+
+import click
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+# Metrics where a larger value is better; everything else is a cost.
+HIGHER_IS_BETTER = ("questions_per_s", "prompts_per_s", "hit_rate", "hits", "agreement", "format_valid")
+COMPARED_SUFFIXES = ("_ms", "_s", "_mb", "questions_per_s", "llm_calls", "hit_rate", "hits",
+                     "_tokens", "agreement", "format_valid")
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Iterator[Tuple[str, float]]:
+    """Yield (dotted.path, value) for every numeric metric."""
+    for key, value in results.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from flatten(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float):
+    """Return rows of (metric, before, after, relative change, regressed)."""
+    before = {k: v for k, v in flatten(baseline) if not k.startswith(("config.", "environment."))}
+    after = dict(flatten(current))
+    rows = []
+    for metric, old in sorted(before.items()):
+        if metric not in after or not metric.endswith(COMPARED_SUFFIXES):
+            continue
+        new = after[metric]
+        change = (new - old) / old if old else 0.0
+        worse = -change if metric.endswith(HIGHER_IS_BETTER) else change
+        rows.append((metric, old, new, change, worse > threshold))
+    return rows
+
+
+@click.command()
+@click.argument('baseline', type=click.Path(exists=True))
+@click.argument('current', type=click.Path(exists=True))
+@click.option('--threshold', default=0.1, help='Relative change counted as a regression')
+@click.option('--only-changed', is_flag=True, help='Hide metrics within the threshold')
+def main(baseline: str, current: str, threshold: float, only_changed: bool):
+    """Compare two benchmark JSON files."""
+    with open(baseline) as f:
+        old = json.load(f)
+    with open(current) as f:
+        new = json.load(f)
+
+    rows = compare(old, new, threshold)
+    table = Table(title=f"{old['environment'].get('commit')} -> {new['environment'].get('commit')}")
+    for column in ["Metric", "Baseline", "Current", "Change"]:
+        table.add_column(column, justify="left" if column == "Metric" else "right")
+
+    regressions = 0
+    for metric, before, after, change, regressed in rows:
+        if only_changed and abs(change) <= threshold:
+            continue
+        style = "red" if regressed else ("green" if abs(change) > threshold else "")
+        table.add_row(metric, f"{before:g}", f"{after:g}", f"{change:+.1%}", style=style)
+        regressions += regressed
+
+    console.print(table)
+    console.print(f"{regressions} regression(s) beyond {threshold:.0%}")
+    raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Local fake model server speaking the Ollama and OpenAI-compatible APIs.
+
+Completions come from ``StubLM``; latency follows a simple CPU-server
+model so batching and throttling effects show up in tests and
+benchmarks. Each request costs ``request_latency_s`` plus
+``per_prompt_latency_s`` per prompt, and only ``parallel`` requests
+compute at once.
+
+    python -m benchmarks.fake_model_server --port 11435 --request-latency-ms 200
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import click
+
+from benchmarks.stub_lm import StubLM
+
+
+class FakeModelServer:
+    """Threaded HTTP/1.1 server answering with StubLM completions."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, request_latency_s: float = 0.0,
+                 per_prompt_latency_s: float = 0.0, parallel: int = 1, lm: StubLM = None):
+        self.lm = lm or StubLM()
+        self.request_latency_s = request_latency_s
+        self.per_prompt_latency_s = per_prompt_latency_s
+        self.requests = 0
+        self.prompts = 0
+        self.connections = 0
+        self.active = 0
+        self.peak_active = 0
+        self.batch_sizes: List[int] = []
+        self._compute = threading.BoundedSemaphore(max(1, parallel))
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeModelServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "FakeModelServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompts": self.prompts,
+                "connections": self.connections,
+                "peak_active": self.peak_active,
+                "max_batch": max(self.batch_sizes, default=0)
+            }
+
+    def complete(self, path: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """Answer one API call, sleeping according to the latency model."""
+        if path in ("/api/chat", "/v1/chat/completions"):
+            inputs = [("messages", body.get("messages", []))]
+        elif path in ("/api/generate", "/v1/completions"):
+            prompts = body.get("prompt", "")
+            prompts = prompts if isinstance(prompts, list) else [prompts]
+            inputs = [("prompt", p) for p in prompts]
+        else:
+            return 404, {"error": f"unknown endpoint {path}"}
+
+        with self._lock:
+            self.requests += 1
+            self.prompts += len(inputs)
+            self.batch_sizes.append(len(inputs))
+        with self._compute:
+            with self._lock:
+                self.active += 1
+                self.peak_active = max(self.peak_active, self.active)
+            try:
+                delay = self.request_latency_s + self.per_prompt_latency_s * len(inputs)
+                if delay > 0:
+                    time.sleep(delay)
+                texts = [self.lm(**{kind: value})[0] for kind, value in inputs]
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+        model = body.get("model", "fake")
+        if path == "/api/generate":
+            return 200, {"model": model, "response": texts[0], "done": True}
+        if path == "/api/chat":
+            return 200, {"model": model, "message": {"role": "assistant", "content": texts[0]},
+                         "done": True}
+        if path == "/v1/chat/completions":
+            return 200, {"model": model, "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": texts[0]}}
+            ]}
+        return 200, {"model": model, "choices": [
+            {"index": i, "text": text} for i, text in enumerate(texts)
+        ]}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0) or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    status, payload = 400, {"error": "invalid JSON"}
+                else:
+                    status, payload = server.complete(self.path, body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=11435)
+@click.option('--request-latency-ms', default=0.0, help='Fixed cost per HTTP request')
+@click.option('--per-prompt-latency-ms', default=0.0, help='Extra cost per prompt in a request')
+@click.option('--parallel', default=1, help='Requests computed concurrently')
+def main(host: str, port: int, request_latency_ms: float, per_prompt_latency_ms: float, parallel: int):
+    """Serve StubLM completions over the Ollama and OpenAI HTTP APIs."""
+    server = FakeModelServer(host, port, request_latency_ms / 1000, per_prompt_latency_ms / 1000, parallel)
+    print(f"Fake model server on {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,575 @@
+"""Benchmark the agent, SQLite tool and retriever without an Ollama server.
+
+Usage:
+    python -m benchmarks.run_benchmarks --out benchmarks/results/current.json
+    python -m benchmarks.compare baseline.json current.json
+"""
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import click
+import dspy
+from rich.console import Console
+
+from agent.answer_cache import AnswerCache
+from agent.dspy_signatures import parse_module_modes
+from agent.format_hints import compile_format_hint
+from agent.graph_hybrid import HybridAgent
+from agent.lm_cache import CachedLM, LMCache
+from agent.lm_cassette import ReplayLM
+from agent.lm_client import HTTPModelLM
+from agent.profiling import Profiler
+from benchmarks.fake_model_server import FakeModelServer
+from benchmarks.stub_lm import StubLM
+from benchmarks.synthetic import build_docs_corpus, build_northwind, build_shards
+from rag.retrieval import TFIDFRetriever
+from tools.columnar_engine import ColumnarSQLiteTool, results_match
+from tools.scale_northwind import NorthwindScaler
+from tools.sharded_sqlite import ShardedSQLiteTool
+from tools.sqlite_tool import SQLiteTool
+
+console = Console()
+
+SQL_QUERIES = {
+    "order_count": "SELECT COUNT(*) AS order_count FROM Orders",
+    "revenue_by_category": """
+        SELECT c.CategoryName, SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) AS revenue
+        FROM "Order Details" od
+        JOIN Products p ON od.ProductID = p.ProductID
+        JOIN Categories c ON p.CategoryID = c.CategoryID
+        GROUP BY c.CategoryName ORDER BY revenue DESC
+    """,
+    "aov_summer_1997": """
+        SELECT SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) / COUNT(DISTINCT o.OrderID) AS aov
+        FROM Orders o JOIN "Order Details" od ON o.OrderID = od.OrderID
+        WHERE DATE(o.OrderDate) BETWEEN '1997-06-01' AND '1997-06-30'
+    """,
+    "top3_products": """
+        SELECT p.ProductName, SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) AS revenue
+        FROM "Order Details" od JOIN Products p ON od.ProductID = p.ProductID
+        GROUP BY p.ProductName ORDER BY revenue DESC LIMIT 3
+    """,
+}
+
+# Parameterized aggregates shaped like the KPI templates' SQL.
+COLUMNAR_QUERIES = {
+    "template_aov": ("""
+        SELECT ROUND(SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) / COUNT(DISTINCT o.OrderID), 2) AS aov
+        FROM Orders o JOIN "Order Details" od ON o.OrderID = od.OrderID
+        WHERE DATE(o.OrderDate) BETWEEN ? AND ?
+    """, ["1997-01-01", "1997-12-31"]),
+    "template_category_revenue": ("""
+        SELECT c.CategoryName, SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) AS revenue
+        FROM Orders o JOIN "Order Details" od ON o.OrderID = od.OrderID
+        JOIN Products p ON od.ProductID = p.ProductID
+        JOIN Categories c ON p.CategoryID = c.CategoryID
+        WHERE DATE(o.OrderDate) BETWEEN ? AND ?
+        GROUP BY c.CategoryName ORDER BY revenue DESC LIMIT ?
+    """, ["1997-06-01", "1997-06-30", 3]),
+    "template_top_customers": ("""
+        SELECT cu.CustomerID, cu.CompanyName, SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) AS revenue
+        FROM Orders o JOIN "Order Details" od ON o.OrderID = od.OrderID
+        JOIN Customers cu ON o.CustomerID = cu.CustomerID
+        WHERE DATE(o.OrderDate) BETWEEN ? AND ?
+        GROUP BY cu.CustomerID, cu.CompanyName ORDER BY revenue DESC LIMIT ?
+    """, ["1997-01-01", "1997-12-31", 5]),
+    "template_category_quantity": ("""
+        SELECT p.ProductID, p.ProductName, SUM(od.Quantity) AS quantity
+        FROM Orders o JOIN "Order Details" od ON o.OrderID = od.OrderID
+        JOIN Products p ON od.ProductID = p.ProductID
+        JOIN Categories c ON p.CategoryID = c.CategoryID
+        WHERE c.CategoryName = ?
+        GROUP BY p.ProductID, p.ProductName ORDER BY quantity DESC LIMIT ?
+    """, ["Beverages", 5]),
+}
+
+# Sharded execution must return exactly what one database returns. Each query
+# exercises a merge path: AVG rebuilt from per-shard SUM/COUNT, COUNT(DISTINCT)
+# across shards, ORDER BY/LIMIT over groups that span shards, joins against
+# replicated tables, and top-k row lists.
+SHARD_QUERIES = {
+    "avg_line_by_category": ("""
+        SELECT c.CategoryName, AVG(od.UnitPrice * od.Quantity) AS avg_line, COUNT(*) AS lines
+        FROM "Order Details" od
+        JOIN Products p ON od.ProductID = p.ProductID
+        JOIN Categories c ON p.CategoryID = c.CategoryID
+        GROUP BY c.CategoryName ORDER BY c.CategoryName
+    """, []),
+    "distinct_customers_by_year": ("""
+        SELECT strftime('%Y', o.OrderDate) AS year, COUNT(DISTINCT o.CustomerID) AS customers
+        FROM Orders o GROUP BY year ORDER BY year
+    """, []),
+    "aov_1997": ("""
+        SELECT SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) / COUNT(DISTINCT o.OrderID) AS aov
+        FROM Orders o JOIN "Order Details" od ON o.OrderID = od.OrderID
+        WHERE o.OrderDate BETWEEN ? AND ?
+    """, ["1997-01-01", "1997-12-31 23:59:59"]),
+    "top_products_by_revenue": ("""
+        SELECT p.ProductName, SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) AS revenue
+        FROM "Order Details" od JOIN Products p ON od.ProductID = p.ProductID
+        GROUP BY p.ProductName ORDER BY revenue DESC, p.ProductName LIMIT ?
+    """, [5]),
+    "top_customer_countries": ("""
+        SELECT cu.Country, COUNT(*) AS orders
+        FROM Orders o JOIN Customers cu ON o.CustomerID = cu.CustomerID
+        GROUP BY cu.Country ORDER BY orders DESC, cu.Country LIMIT 3
+    """, []),
+    "latest_orders": ("""
+        SELECT o.OrderID, o.OrderDate FROM Orders o ORDER BY o.OrderDate DESC, o.OrderID LIMIT 10
+    """, []),
+    "replicated_only": ("SELECT COUNT(*) AS products FROM Products", []),
+}
+
+RETRIEVER_QUERIES = [
+    "return window for beverages",
+    "summer beverages 1997 campaign dates",
+    "average order value definition",
+    "gross margin cost of goods",
+]
+
+
+def timing_stats(samples_ms: List[float]) -> Dict[str, float]:
+    """Mean/p50/p95/min over a list of millisecond samples."""
+    ordered = sorted(samples_ms)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "min_ms": round(ordered[0], 3),
+    }
+
+
+def time_calls(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return timing_stats(samples)
+
+
+def bench_sqlite(db_paths: Dict[str, Path], repeat: int) -> Dict[str, Any]:
+    results = {}
+    for label, db_path in db_paths.items():
+        tool = SQLiteTool(str(db_path))
+        results[label] = {
+            name: time_calls(lambda q=query: tool.execute(q), repeat)
+            for name, query in SQL_QUERIES.items()
+        }
+        results[label]["schema"] = time_calls(tool.get_schema, repeat)
+    return results
+
+
+def bench_date_index(db_paths: Dict[str, Path], repeat: int) -> Dict[str, Any]:
+    """DATE(col) BETWEEN queries with and without the date-range rewrite."""
+    queries = {name: (query, []) for name, query in SQL_QUERIES.items() if "DATE(" in query}
+    queries.update((name, spec) for name, spec in COLUMNAR_QUERIES.items() if "DATE(" in spec[0])
+    results = {}
+    for label, db_path in db_paths.items():
+        plain = SQLiteTool(str(db_path), date_index=False)
+        indexed = SQLiteTool(str(db_path))
+        start = time.perf_counter()
+        indexed.warm_up()
+        results[label] = {"build_ms": round((time.perf_counter() - start) * 1000, 3)}
+        for name, (query, params) in queries.items():
+            expected = plain.execute_readonly(query, params)
+            actual = indexed.execute_readonly(query, params)
+            plain_stats = time_calls(lambda q=query, p=params: plain.execute_readonly(q, p), repeat)
+            indexed_stats = time_calls(lambda q=query, p=params: indexed.execute_readonly(q, p), repeat)
+            results[label][name] = {
+                "function": plain_stats,
+                "rewritten": indexed_stats,
+                "speedup": round(plain_stats["mean_ms"] / indexed_stats["mean_ms"], 2),
+                "match": results_match(actual, expected),
+            }
+        results[label]["rewrites"] = indexed.stats()["date_rewrites"]
+        plain.close()
+        indexed.close()
+    return results
+
+
+def bench_columnar(db_paths: Dict[str, Path], repeat: int) -> Dict[str, Any]:
+    """SQLite vs the columnar engine per query, with a result-equality check."""
+    queries = {name: (query, []) for name, query in SQL_QUERIES.items()}
+    queries.update(COLUMNAR_QUERIES)
+    results = {}
+    for label, db_path in db_paths.items():
+        sqlite_tool = SQLiteTool(str(db_path))
+        columnar = ColumnarSQLiteTool(str(db_path))
+        start = time.perf_counter()
+        columnar.warm_up()
+        results[label] = {"load_ms": round((time.perf_counter() - start) * 1000, 3)}
+        for name, (query, params) in queries.items():
+            expected = sqlite_tool.execute_readonly(query, params)
+            actual = columnar.execute_readonly(query, params)
+            sqlite_stats = time_calls(lambda q=query, p=params: sqlite_tool.execute_readonly(q, p), repeat)
+            columnar_stats = time_calls(lambda q=query, p=params: columnar.execute_readonly(q, p), repeat)
+            results[label][name] = {
+                "sqlite": sqlite_stats,
+                "columnar": columnar_stats,
+                "speedup": round(sqlite_stats["mean_ms"] / columnar_stats["mean_ms"], 2),
+                "match": results_match(actual, expected),
+            }
+        stats = columnar.stats()
+        results[label]["fallbacks"] = stats["fallbacks"]
+        columnar.close()
+        sqlite_tool.close()
+    return results
+
+
+def bench_sharding(db_paths: Dict[str, Path], workdir: Path, repeat: int) -> Dict[str, Any]:
+    """Each SHARD_QUERIES query on one database vs its region shards, with a result-equality check."""
+    results = {}
+    for label, db_path in db_paths.items():
+        shard_paths = build_shards(str(db_path), str(workdir / f"shards_{label}"))
+        single = SQLiteTool(str(db_path))
+        sharded = ShardedSQLiteTool([str(path) for path in shard_paths])
+        results[label] = {"replicated": sharded.replicated_tables}
+        for name, (query, params) in SHARD_QUERIES.items():
+            expected = single.execute_readonly(query, params)
+            actual = sharded.execute_readonly(query, params)
+            single_stats = time_calls(lambda q=query, p=params: single.execute_readonly(q, p), repeat)
+            sharded_stats = time_calls(lambda q=query, p=params: sharded.execute_readonly(q, p), repeat)
+            results[label][name] = {
+                "plan": sharded.plan(query, params).kind,
+                "single": single_stats,
+                "sharded": sharded_stats,
+                "speedup": round(single_stats["mean_ms"] / sharded_stats["mean_ms"], 2),
+                "match": results_match(actual, expected),
+            }
+        sharded.close()
+        single.close()
+    return results
+
+
+def bench_retriever(corpora: Dict[str, Path], repeat: int) -> Dict[str, Any]:
+    results = {}
+    for label, docs_dir in corpora.items():
+        start = time.perf_counter()
+        retriever = TFIDFRetriever(str(docs_dir))
+        fit_ms = (time.perf_counter() - start) * 1000
+        samples = []
+        for _ in range(repeat):
+            for query in RETRIEVER_QUERIES:
+                start = time.perf_counter()
+                retriever.retrieve(query, top_k=3)
+                samples.append((time.perf_counter() - start) * 1000)
+        results[label] = {
+            "chunks": len(retriever.get_all_chunks()),
+            "fit_ms": round(fit_ms, 3),
+            "retrieve": timing_stats(samples),
+        }
+    return results
+
+
+def run_agent_pass(agent: HybridAgent, questions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Run every question once, returning throughput and peak traced memory."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    for q in questions:
+        agent.run(q["question"], q["format_hint"])
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "questions": len(questions),
+        "wall_s": round(elapsed, 4),
+        "questions_per_s": round(len(questions) / elapsed, 3) if elapsed else 0.0,
+        "peak_mem_mb": round(peak / 1e6, 3),
+    }
+
+
+def node_latency(profiler: Profiler) -> Dict[str, Any]:
+    summary = profiler.summary()
+    return {
+        name: {
+            "count": stats["count"],
+            "mean_ms": round(stats["mean_ms"], 3),
+            "p95_ms": round(stats["p95_ms"], 3),
+            "llm_calls": int(stats.get("llm_calls", 0)),
+        }
+        for name, stats in sorted(summary.items())
+    }
+
+
+def bench_agent(db_path: Path, docs_dir: Path, questions: List[Dict[str, Any]],
+                workdir: Path, lm_latency_ms: float) -> Dict[str, Any]:
+    results = {}
+
+    for label, use_templates in (("templates_on", True), ("templates_off", False)):
+        lm = StubLM(latency_s=lm_latency_ms / 1000)
+        profiler = Profiler()
+        agent = HybridAgent(str(db_path), str(docs_dir), lm, use_sql_templates=use_templates,
+                            profiler=profiler)
+        results[label] = run_agent_pass(agent, questions)
+        results[label]["llm_calls"] = sum(lm.calls.values())
+        results[label]["nodes"] = node_latency(profiler)
+
+    lm = StubLM(latency_s=lm_latency_ms / 1000)
+    agent = HybridAgent(str(db_path), str(docs_dir), lm, use_sql_templates=False, sql_candidates=4)
+    results["sql_candidates_4"] = run_agent_pass(agent, questions)
+    results["sql_candidates_4"]["llm_calls"] = sum(lm.calls.values())
+
+    llm_cache = LMCache(str(workdir / "llm_cache.sqlite"))
+    stub = StubLM(latency_s=lm_latency_ms / 1000)
+    agent = HybridAgent(str(db_path), str(docs_dir), CachedLM(stub, llm_cache),
+                        use_sql_templates=False)
+    cold = run_agent_pass(agent, questions)
+    cold_calls = sum(stub.calls.values())
+    warm = run_agent_pass(agent, questions)
+    results["llm_cache"] = {
+        "cold": dict(cold, llm_calls=cold_calls),
+        "warm": dict(warm, llm_calls=sum(stub.calls.values()) - cold_calls),
+        "hit_rate": round(llm_cache.stats()["hit_rate"], 3),
+    }
+    llm_cache.close()
+
+    answer_cache = AnswerCache(str(workdir / "answer_cache.sqlite"))
+    stub = StubLM(latency_s=lm_latency_ms / 1000)
+    agent = HybridAgent(str(db_path), str(docs_dir), stub, answer_cache=answer_cache)
+    cold = run_agent_pass(agent, questions)
+    cold_calls = sum(stub.calls.values())
+    warm = run_agent_pass(agent, questions)
+    results["answer_cache"] = {
+        "cold": dict(cold, llm_calls=cold_calls),
+        "warm": dict(warm, llm_calls=sum(stub.calls.values()) - cold_calls),
+        "hits": answer_cache.stats()["hits"],
+    }
+    answer_cache.close()
+    return results
+
+
+MODE_SETS = {
+    "all_cot": "all=cot",
+    "default": "",
+    "all_predict": "all=predict",
+    "all_short": "all=short",
+}
+
+
+def bench_module_modes(db_path: Path, docs_dir: Path, questions: List[Dict[str, Any]],
+                       lm_latency_ms: float, token_latency_ms: float) -> Dict[str, Any]:
+    """Latency, output tokens and answer agreement with all-CoT, per decoding-mode set."""
+    results, reference = {}, None
+    for label, spec in MODE_SETS.items():
+        lm = StubLM(latency_s=lm_latency_ms / 1000, latency_per_token_s=token_latency_ms / 1000)
+        profiler = Profiler()
+        agent = HybridAgent(str(db_path), str(docs_dir), lm, use_sql_templates=False,
+                            profiler=profiler, module_modes=parse_module_modes(spec))
+        agent.warm_up()
+        start = time.perf_counter()
+        answers = [agent.run(q["question"], q["format_hint"])["final_answer"] for q in questions]
+        elapsed = time.perf_counter() - start
+        if reference is None:
+            reference = answers
+        summary = profiler.summary()
+        results[label] = {
+            "wall_s": round(elapsed, 4),
+            "questions_per_s": round(len(questions) / elapsed, 3) if elapsed else 0.0,
+            "completion_tokens": int(sum(stats.get("completion_tokens", 0)
+                                         for name, stats in summary.items() if name.startswith("dspy."))),
+            "agreement": round(sum(a == r for a, r in zip(answers, reference)) / len(questions), 3),
+            "format_valid": round(sum(
+                compile_format_hint(q["format_hint"]).is_valid(a) for q, a in zip(questions, answers)
+            ) / len(questions), 3),
+            "nodes": node_latency(profiler),
+        }
+    return results
+
+
+# Generated SQL with the usual LLM noise: prose, fences, a trailing remark and strftime().
+NOISY_SQL = (
+    "Here is the SQL query:\n```sql\n"
+    "SELECT c.CategoryName, SUM(od.Quantity) AS quantity\n"
+    "FROM Orders o JOIN \"Order Details\" od ON o.OrderID = od.OrderID\n"
+    "JOIN Products p ON od.ProductID = p.ProductID\n"
+    "JOIN Categories c ON p.CategoryID = c.CategoryID\n"
+    "WHERE strftime('%Y', o.OrderDate) = '1997'\n"
+    "GROUP BY c.CategoryName ORDER BY quantity DESC;\n"
+    "```\nThis query sums the 1997 quantity per category."
+)
+
+
+def bench_sql_rewrite(db_path: Path, docs_dir: Path, questions: List[Dict[str, Any]],
+                      lm_latency_ms: float) -> Dict[str, Any]:
+    """Agent runs on noisy generated SQL with and without the SQL rewrite stage."""
+    results = {}
+    for label, rewrite in (("rewrite_on", True), ("rewrite_off", False)):
+        lm = StubLM({"NLToSQLSignature": {"sql_query": NOISY_SQL, "explanation": "Noisy."}},
+                    latency_s=lm_latency_ms / 1000)
+        agent = HybridAgent(str(db_path), str(docs_dir), lm, use_sql_templates=False,
+                            rewrite_sql=rewrite)
+        results[label] = run_agent_pass(agent, questions)
+        results[label]["llm_calls"] = sum(lm.calls.values())
+        results[label]["repair_calls"] = lm.calls.get("SQLRepairSignature", 0)
+        if agent.sql_rewriter is not None:
+            results[label]["rewrites"] = agent.sql_rewriter.stats()["rewrites"]
+    return results
+
+
+def bench_replay(cassette: str, db_path: str, docs_dir: str,
+                 questions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Replay a recorded real run with no LM latency: wall time is pure agent overhead."""
+    lm = ReplayLM(cassette, fallback=StubLM())
+    profiler = Profiler()
+    agent = HybridAgent(db_path, docs_dir, lm, profiler=profiler)
+    agent.warm_up()
+    results = run_agent_pass(agent, questions)
+    stats = lm.stats()
+    results.update({
+        "overhead_ms_per_question": round(results["wall_s"] * 1000 / len(questions), 3),
+        "recorded_llm_s": round(stats["replayed_latency_ms"] / 1000, 3),
+        "cassette_misses": stats["misses"],
+        "nodes": node_latency(profiler),
+    })
+    return results
+
+
+def bench_lm_client(db_path: Path, docs_dir: Path, questions: List[Dict[str, Any]],
+                    lm_latency_ms: float, callers: int = 4) -> Dict[str, Any]:
+    """Concurrent HybridAgent questions through HTTPModelLM against the fake server.
+
+    The agent's modules call the LM with chat messages, as DSPy's chat
+    adapter does. ``openai`` renders them into batched completions,
+    ``openai_unbatched`` sends one chat request each, and ``ollama`` cannot batch.
+    """
+    configs = {
+        "ollama": {"api": "ollama"},
+        "openai_unbatched": {"api": "openai", "chat_template": None},
+        "openai": {"api": "openai"},
+    }
+    results = {}
+    for label, options in configs.items():
+        with FakeModelServer(request_latency_s=lm_latency_ms / 1000,
+                             per_prompt_latency_s=lm_latency_ms / 20000, parallel=2) as server:
+            lm = HTTPModelLM("fake", server.url, max_in_flight=2, **options)
+            agent = HybridAgent(str(db_path), str(docs_dir), lm, use_sql_templates=False,
+                                sql_candidates=4)
+            agent.warm_up()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=callers) as pool:
+                list(pool.map(lambda q: agent.run(q["question"], q["format_hint"]), questions))
+            elapsed = time.perf_counter() - start
+            stats = lm.stats()
+            lm.close()
+            results[label] = {
+                "total_ms": round(elapsed * 1000, 3),
+                "questions_per_s": round(len(questions) / elapsed, 3) if elapsed else 0.0,
+                "prompts": stats["prompts"],
+                "requests": stats["requests"],
+                "mean_batch_size": round(stats["mean_batch_size"], 3),
+                "connections": server.stats()["connections"],
+            }
+    return results
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "dspy": getattr(dspy, "__version__", "unknown"),
+        "platform": platform.platform(),
+    }
+
+
+@click.command()
+@click.option('--out', default='benchmarks/results/current.json', help='Where to write the JSON results')
+@click.option('--questions', 'questions_path', default='sample_questions_hybrid_eval.jsonl',
+              help='JSONL file with benchmark questions')
+@click.option('--docs', default='docs', help='Base docs directory for the synthetic corpora')
+@click.option('--scales', default='1,100', help='Comma-separated database scale factors')
+@click.option('--source-db', default=None, help='Scale this Northwind database instead of a synthetic one')
+@click.option('--extra-docs', default=200, help='Filler documents in the large corpus')
+@click.option('--repeat', default=20, help='Repetitions for micro-benchmarks')
+@click.option('--lm-latency-ms', default=0.0, help='Injected latency per stub LM call')
+@click.option('--lm-token-latency-ms', default=0.5, help='Injected stub LM latency per output token')
+@click.option('--cassette', default=None, help='Also replay this recorded LM cassette to measure agent overhead')
+@click.option('--cassette-db', default='data/northwind.sqlite', help='Database the cassette was recorded against')
+@click.option('--seed', default=42, help='Seed for synthetic data')
+@click.option('--workdir', default=None, help='Keep generated databases and caches here')
+def main(out: str, questions_path: str, docs: str, scales: str, source_db: str, extra_docs: int,
+         repeat: int, lm_latency_ms: float, lm_token_latency_ms: float, cassette: str,
+         cassette_db: str, seed: int, workdir: str):
+    """Run the benchmark suite and write diffable JSON results."""
+    with open(questions_path) as f:
+        questions = [json.loads(line) for line in f if line.strip()]
+
+    tmp = None
+    if workdir is None:
+        tmp = tempfile.TemporaryDirectory(prefix="rac-bench-")
+        workdir = tmp.name
+    work = Path(workdir)
+    work.mkdir(parents=True, exist_ok=True)
+
+    console.print("[yellow]Building synthetic databases and corpora...[/yellow]")
+    db_paths = {}
+    for scale in scales.split(","):
+        db_path = work / f"northwind_{scale}x.sqlite"
+        if source_db:
+            NorthwindScaler(source_db, str(db_path), docs, seed=seed).scale(int(scale))
+        else:
+            build_northwind(str(db_path), int(scale), seed)
+        db_paths[f"scale_{scale}x"] = db_path
+    corpora = {
+        "base": build_docs_corpus(str(work / "docs_base"), docs),
+        f"extra_{extra_docs}": build_docs_corpus(str(work / "docs_large"), docs, extra_docs, seed=seed),
+    }
+
+    results = {"environment": environment(), "config": {
+        "scales": scales, "source_db": source_db or "synthetic", "extra_docs": extra_docs,
+        "repeat": repeat, "lm_latency_ms": lm_latency_ms,
+        "lm_token_latency_ms": lm_token_latency_ms, "seed": seed, "questions": len(questions)
+    }}
+
+    console.print("[yellow]Benchmarking SQLiteTool...[/yellow]")
+    results["sqlite"] = bench_sqlite(db_paths, repeat)
+    console.print("[yellow]Benchmarking date-range rewrite...[/yellow]")
+    results["date_index"] = bench_date_index(db_paths, repeat)
+    console.print("[yellow]Benchmarking columnar engine...[/yellow]")
+    results["columnar"] = bench_columnar(db_paths, repeat)
+    console.print("[yellow]Benchmarking sharded execution...[/yellow]")
+    results["sharding"] = bench_sharding(db_paths, work, repeat)
+    console.print("[yellow]Benchmarking TFIDFRetriever...[/yellow]")
+    results["retriever"] = bench_retriever(corpora, repeat)
+    console.print("[yellow]Benchmarking HybridAgent...[/yellow]")
+    results["agent"] = bench_agent(next(iter(db_paths.values())), corpora["base"],
+                                   questions, work, lm_latency_ms)
+    console.print("[yellow]Benchmarking module decoding modes...[/yellow]")
+    results["module_modes"] = bench_module_modes(next(iter(db_paths.values())), corpora["base"],
+                                                 questions, lm_latency_ms, lm_token_latency_ms)
+    console.print("[yellow]Benchmarking SQL rewrite stage...[/yellow]")
+    results["sql_rewrite"] = bench_sql_rewrite(next(iter(db_paths.values())), corpora["base"],
+                                               questions, lm_latency_ms)
+    if cassette:
+        console.print(f"[yellow]Replaying {cassette}...[/yellow]")
+        results["replay"] = bench_replay(cassette, cassette_db, docs, questions)
+    console.print("[yellow]Benchmarking HTTP LM client...[/yellow]")
+    results["lm_client"] = bench_lm_client(next(iter(db_paths.values())), corpora["base"],
+                                           questions, lm_latency_ms)
+
+    Path(out).parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+    console.print(f"[bold green]Results written to {out}[/bold green]")
+
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Scripted stand-in for the Ollama LM, for benchmarks and offline runs.
+
+``StubLM`` recognizes which signature a prompt belongs to from its
+instructions and answers with canned field values, formatted for either
+the legacy prompt/completion templates (DSPy 2.4) or the chat adapter
+(``[[ ## field ## ]]`` markers, DSPy >= 2.5). Only the output fields the
+prompt asks for are emitted, so Predict, ChainOfThought and trimmed
+signatures all parse, and ``stop``/``max_tokens`` are honored like a real
+server would. Latency can be injected to model CPU inference on the real
+model; with ``latency_per_token_s`` shorter outputs decode faster.
+"""
+import json
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from agent.dspy_signatures import (
+    RouterSignature, PlannerSignature, NLToSQLSignature,
+    SQLRepairSignature, SynthesizerSignature
+)
+from agent.format_hints import compile_format_hint
+from agent.lm_base import LMBase
+
+
+SIGNATURES = [
+    RouterSignature, PlannerSignature, NLToSQLSignature,
+    SQLRepairSignature, SynthesizerSignature
+]
+
+FieldValues = Dict[str, str]
+Response = Union[FieldValues, Callable[[str], FieldValues]]
+
+
+def extract_input(text: str, name: str) -> str:
+    """Pull the value of an input field out of a rendered prompt."""
+    chat = re.findall(r"\[\[ ## " + re.escape(name) + r" ## \]\]\n(.*?)(?=\n\n\[\[ ## |\Z)", text, re.DOTALL)
+    if chat:
+        return chat[-1].strip()
+    prefix = name.replace("_", " ").title()
+    legacy = re.findall(r"^" + re.escape(prefix) + r":(.*)$", text, re.MULTILINE)
+    return legacy[-1].strip() if legacy else ""
+
+
+def _route(text: str) -> FieldValues:
+    question = extract_input(text, "question").lower()
+    if "policy" in question or "return window" in question:
+        route = "rag"
+    elif re.search(r"calendar|campaign|kpi|definition|margin|aov|summer|winter", question):
+        route = "hybrid"
+    else:
+        route = "sql"
+    return {"route": route, "reasoning": f"Keyword routing chose {route}."}
+
+
+def _plan(text: str) -> FieldValues:
+    return {"date_ranges": "[]", "entities": "", "kpi_formulas": "", "constraints": ""}
+
+
+def _nl_to_sql(text: str) -> FieldValues:
+    return {
+        "sql_query": "SELECT COUNT(*) AS order_count FROM Orders;",
+        "explanation": "Counts all orders."
+    }
+
+
+def _repair(text: str) -> FieldValues:
+    return {
+        "repaired_query": "SELECT COUNT(*) AS order_count FROM Orders;",
+        "changes": "Fell back to a simple count."
+    }
+
+
+def placeholder_answer(format_hint: str) -> Any:
+    """A well-typed dummy answer for a format hint."""
+    spec = compile_format_hint(format_hint)
+    defaults = {"int": 0, "float": 0.0, "str": "n/a"}
+    if spec.kind == "scalar":
+        return defaults[spec.scalar_type]
+    if spec.kind in ("object", "list"):
+        obj = {name: defaults[type_name] for name, type_name in spec.fields}
+        return obj if spec.kind == "object" else [obj]
+    return "n/a"
+
+
+def _synthesize(text: str) -> FieldValues:
+    answer = placeholder_answer(extract_input(text, "format_hint"))
+    return {
+        "final_answer": answer if isinstance(answer, str) else json.dumps(answer),
+        "explanation": "Stub answer.",
+        "confidence": "0.5"
+    }
+
+
+DEFAULT_RESPONSES: Dict[str, Response] = {
+    "RouterSignature": _route,
+    "PlannerSignature": _plan,
+    "NLToSQLSignature": _nl_to_sql,
+    "SQLRepairSignature": _repair,
+    "SynthesizerSignature": _synthesize,
+}
+
+
+def _output_fields(signature) -> Dict[str, str]:
+    """Output field name -> legacy prefix (e.g. 'sql_query' -> 'Sql Query:')."""
+    fields = {}
+    for name, info in signature.output_fields.items():
+        extra = getattr(info, "json_schema_extra", None) or {}
+        fields[name] = extra.get("prefix") or f"{name.replace('_', ' ').title()}:"
+    return fields
+
+
+class StubLM(LMBase):
+    """Deterministic LM answering each signature with canned field values."""
+
+    def __init__(self, responses: Dict[str, Response] = None, latency_s: float = 0.0,
+                 latency_per_token_s: float = 0.0, model: str = "stub/phi3.5"):
+        self.responses = dict(DEFAULT_RESPONSES)
+        self.responses.update(responses or {})
+        self.latency_s = latency_s
+        self.latency_per_token_s = latency_per_token_s
+        self.model = model
+        self.model_type = "chat"
+        self.cache = False
+        self.callbacks = []
+        self.num_retries = 0
+        self.kwargs = {"model": model, "temperature": 0.0, "max_tokens": 1000}
+        self.history: List[Dict[str, Any]] = []
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._instructions = [
+            (sig.__name__, " ".join((sig.__doc__ or "").split()), _output_fields(sig))
+            for sig in SIGNATURES
+        ]
+
+    def _match(self, text: str):
+        flat = " ".join(text.split())
+        for name, instructions, fields in self._instructions:
+            if instructions and instructions in flat:
+                return name, fields
+        return None, {}
+
+    def __call__(self, prompt: Any = None, messages: Any = None, **kwargs) -> List[str]:
+        if messages:
+            text = "\n".join(str(m.get("content", "")) for m in messages)
+        else:
+            text = prompt or ""
+
+        name, fields = self._match(text)
+        response = self.responses.get(name, {})
+        values = response(text) if callable(response) else dict(response)
+
+        # A chat conversation rendered into one prompt (batched completions) keeps the markers.
+        if messages or "[[ ## completed ## ]]" in text:
+            requested = [f for f in ["reasoning"] + [f for f in fields if f != "reasoning"]
+                         if f"[[ ## {f} ## ]]" in text]
+            parts = [f"[[ ## {field} ## ]]\n{values.get(field, 'Stub reasoning.' if field == 'reasoning' else '')}"
+                     for field in requested]
+            parts.append("[[ ## completed ## ]]")
+            completion = "\n\n".join(parts)
+        else:
+            # The legacy template ends the prompt with the first output prefix.
+            parts = [" produce the answer. Stub reasoning."] if "Reasoning: Let's think" in text else []
+            parts += [f"{prefix} {values.get(field, '')}" for field, prefix in fields.items()
+                      if prefix in text]
+            completion = "\n\n".join(parts)
+        completion = self._truncate(completion, kwargs.get("stop"), kwargs.get("max_tokens"))
+
+        delay = self.latency_s + self.latency_per_token_s * len(completion.split())
+        if delay > 0:
+            time.sleep(delay)
+
+        with self._lock:
+            self.calls[name or "unknown"] = self.calls.get(name or "unknown", 0) + 1
+            self.history.append({"signature": name, "prompt_chars": len(text), "kwargs": kwargs})
+        return [completion]
+
+    @staticmethod
+    def _truncate(completion: str, stop: Any, max_tokens: Optional[int]) -> str:
+        """Cut at the first stop sequence, then to max_tokens whitespace tokens."""
+        for sequence in ([stop] if isinstance(stop, str) else stop or []):
+            index = completion.find(sequence)
+            if index != -1:
+                completion = completion[:index]
+        tokens = re.findall(r"\S+\s*", completion)
+        if max_tokens and len(tokens) > max_tokens:
+            completion = "".join(tokens[:max_tokens])
+        return completion
+
+    def copy(self, **kwargs) -> "StubLM":
+        clone = StubLM(self.responses, self.latency_s, self.latency_per_token_s, self.model)
+        clone.kwargs.update(kwargs)
+        return clone
+
+    def inspect_history(self, n: int = 1):
+        return self.history[-n:]
@@ -0,0 +1,165 @@
+"""Synthetic Northwind-shaped databases and document corpora for benchmarks.
+
+The generated data is deterministic for a given seed and keeps the
+shape the agent relies on: the eight Northwind categories, ``Order Details``
+rows referencing real orders and products, and order dates spanning
+1996-07-04 to 1998-05-06 so the 1997 marketing campaigns have data.
+"""
+import random
+import shutil
+import sqlite3
+from datetime import date, timedelta
+from pathlib import Path
+from typing import List
+
+
+CATEGORIES = [
+    ("Beverages", "Soft drinks, coffees, teas, beers, and ales"),
+    ("Condiments", "Sweet and savory sauces, relishes, spreads, and seasonings"),
+    ("Confections", "Desserts, candies, and sweet breads"),
+    ("Dairy Products", "Cheeses"),
+    ("Grains/Cereals", "Breads, crackers, pasta, and cereal"),
+    ("Meat/Poultry", "Prepared meats"),
+    ("Produce", "Dried fruit and bean curd"),
+    ("Seafood", "Seaweed and fish"),
+]
+
+COUNTRIES = ["Germany", "USA", "France", "Brazil", "UK", "Spain", "Sweden", "Italy", "Canada", "Mexico"]
+
+BASE_PRODUCTS = 77
+BASE_CUSTOMERS = 91
+BASE_ORDERS = 830
+FIRST_ORDER = date(1996, 7, 4)
+LAST_ORDER = date(1998, 5, 6)
+
+SCHEMA = """
+CREATE TABLE Categories(CategoryID INTEGER PRIMARY KEY, CategoryName TEXT, Description TEXT);
+CREATE TABLE Products(ProductID INTEGER PRIMARY KEY, ProductName TEXT, SupplierID INTEGER,
+                      CategoryID INTEGER, UnitPrice NUMERIC, Discontinued TEXT);
+CREATE TABLE Customers(CustomerID TEXT PRIMARY KEY, CompanyName TEXT, Country TEXT);
+CREATE TABLE Orders(OrderID INTEGER PRIMARY KEY, CustomerID TEXT, EmployeeID INTEGER,
+                    OrderDate DATETIME, ShipCountry TEXT);
+CREATE TABLE "Order Details"(OrderID INTEGER, ProductID INTEGER, UnitPrice NUMERIC,
+                             Quantity INTEGER, Discount REAL, PRIMARY KEY(OrderID, ProductID));
+"""
+
+
+def build_northwind(path: str, scale: int = 1, seed: int = 42) -> Path:
+    """Write a Northwind-shaped database with ``scale`` times the base order volume."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        path.unlink()
+
+    rng = random.Random(seed)
+    products = [
+        (pid, f"Product {pid:03d}", rng.randint(1, 29), (pid - 1) % len(CATEGORIES) + 1,
+         round(rng.uniform(2.5, 120.0), 2), "0")
+        for pid in range(1, BASE_PRODUCTS + 1)
+    ]
+    customers = [
+        (f"C{cid:04d}", f"Customer {cid:04d}", rng.choice(COUNTRIES))
+        for cid in range(1, BASE_CUSTOMERS * scale + 1)
+    ]
+
+    span_days = (LAST_ORDER - FIRST_ORDER).days
+    orders, details = [], []
+    for offset in range(BASE_ORDERS * scale):
+        order_id = 10248 + offset
+        customer = rng.choice(customers)
+        order_date = FIRST_ORDER + timedelta(days=rng.randint(0, span_days))
+        orders.append((order_id, customer[0], rng.randint(1, 9),
+                       f"{order_date.isoformat()} 00:00:00", customer[2]))
+        for product in rng.sample(products, rng.randint(1, 4)):
+            details.append((order_id, product[0], product[4], rng.randint(1, 60),
+                            rng.choice((0.0, 0.0, 0.05, 0.1, 0.15))))
+
+    conn = sqlite3.connect(str(path))
+    try:
+        conn.executescript(SCHEMA)
+        with conn:
+            conn.executemany(
+                "INSERT INTO Categories VALUES (?, ?, ?)",
+                [(cid, name, desc) for cid, (name, desc) in enumerate(CATEGORIES, 1)]
+            )
+            conn.executemany("INSERT INTO Products VALUES (?, ?, ?, ?, ?, ?)", products)
+            conn.executemany("INSERT INTO Customers VALUES (?, ?, ?)", customers)
+            conn.executemany("INSERT INTO Orders VALUES (?, ?, ?, ?, ?)", orders)
+            conn.executemany('INSERT INTO "Order Details" VALUES (?, ?, ?, ?, ?)', details)
+    finally:
+        conn.close()
+    return path
+
+
+# Orders (with their details) are split by ship country; other tables are copied to every shard.
+SHARD_REGIONS = {
+    "americas": ("USA", "Brazil", "Canada", "Mexico"),
+    "west_eu": ("Germany", "France", "UK", "Spain"),
+    "rest": None,
+}
+
+
+def build_shards(db_path: str, out_dir: str) -> List[Path]:
+    """Split a Northwind-shaped database into one shard per SHARD_REGIONS entry."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    listed = [country for countries in SHARD_REGIONS.values() if countries for country in countries]
+    paths = []
+    for name, countries in SHARD_REGIONS.items():
+        path = out_dir / f"{name}.sqlite"
+        if path.exists():
+            path.unlink()
+        source, conn = sqlite3.connect(str(db_path)), sqlite3.connect(str(path))
+        try:
+            source.backup(conn)
+            # "rest" keeps every order (including NULL countries) no other region lists.
+            params = countries or listed
+            marks = ", ".join("?" * len(params))
+            elsewhere = (f"(ShipCountry IS NULL OR ShipCountry NOT IN ({marks}))" if countries
+                         else f"ShipCountry IN ({marks})")
+            with conn:
+                conn.execute(f'DELETE FROM "Order Details" WHERE OrderID IN '
+                             f'(SELECT OrderID FROM Orders WHERE {elsewhere})', params)
+                conn.execute(f"DELETE FROM Orders WHERE {elsewhere}", params)
+            conn.execute("VACUUM")
+        finally:
+            source.close()
+            conn.close()
+        paths.append(path)
+    return paths
+
+
+_FILLER_TOPICS = [
+    "shipping", "warehouse", "supplier", "loyalty", "pricing", "inventory",
+    "returns", "promotion", "packaging", "forecast", "regional", "staffing",
+]
+
+
+def build_docs_corpus(out_dir: str, base_docs_dir: str = "docs", extra_docs: int = 0,
+                      paragraphs_per_doc: int = 8, seed: int = 42) -> Path:
+    """Copy the real docs and add ``extra_docs`` filler documents to grow the index."""
+    out_dir = Path(out_dir)
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    out_dir.mkdir(parents=True)
+    for doc_path in Path(base_docs_dir).glob("*.md"):
+        shutil.copy(doc_path, out_dir / doc_path.name)
+
+    rng = random.Random(seed)
+    categories = [name for name, _ in CATEGORIES]
+    for idx in range(extra_docs):
+        topic = rng.choice(_FILLER_TOPICS)
+        lines = [f"# {topic.title()} Notes {idx:04d}", ""]
+        for para in range(paragraphs_per_doc):
+            lines.append(f"## Section {para + 1}")
+            lines.append(
+                f"- The {topic} team reviewed {rng.choice(categories)} volumes for "
+                f"{rng.choice(COUNTRIES)} in {rng.choice(('1996', '1997', '1998'))}."
+            )
+            lines.append(
+                f"- Target: {rng.randint(5, 95)}% of {topic} tickets closed within "
+                f"{rng.randint(2, 30)} days."
+            )
+            lines.append("")
+        (out_dir / f"filler_{idx:04d}.md").write_text("\n".join(lines))
+    return out_dir
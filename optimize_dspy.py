@@ -1,8 +1,23 @@
 """DSPy optimizer for NL→SQL module."""
+import click
 import dspy
-from agent.dspy_signatures import NLToSQL, sql_validity
-from tools.sqlite_tool import SQLiteTool
+import functools
 import json
+import sys
+import time
+from typing import Any, Dict, List
+
+from dspy.teleprompt import BootstrapFewShot, LabeledFewShot
+
+from agent.artifacts import ArtifactStore, DEFAULT_ARTIFACTS_DIR
+from agent.dspy_signatures import NLToSQL, DEFAULT_MODULE_MODES, MODULE_MODES, sql_validity
+from agent.evaluation import (
+    CachedSQLExecutor, Checkpoint, DEFAULT_CHECKPOINT_PATH, DEFAULT_GOLD_PATH,
+    GoldResultStore, latency_summary, run_stage
+)
+from agent.lm_cache import CachedLM, LMCache, DEFAULT_CACHE_PATH, lm_model_name
+from agent.lm_cassette import RecordingLM, ReplayLM
+from tools.sqlite_tool import SQLiteTool
 
 
 # Training examples for NL→SQL
@@ -112,30 +127,88 @@ def create_examples(schema: str):
     return examples
 
 
-def evaluate_sql(db_tool: SQLiteTool):
-    """Create evaluation function."""
-    def metric(example, pred, trace=None):
-        # Check if SQL is valid
-        sql = pred.sql_query.strip()
-        
-        # Clean up SQL
-        if sql.startswith("```sql"):
-            sql = sql[6:]
-        if sql.startswith("```"):
-            sql = sql[3:]
-        if sql.endswith("```"):
-            sql = sql[:-3]
-        sql = sql.strip()
-        
-        # Try to execute
-        success, data, cols, err = db_tool.execute_query(sql)
-        
-        return 1.0 if success else 0.0
+def evaluate_sql(executor: CachedSQLExecutor):
+    """Create a metric that scores 1.0 when the predicted SQL executes."""
+    return functools.partial(sql_validity, executor=executor)
+
+
+def execution_accuracy(executor: CachedSQLExecutor, gold_store: GoldResultStore):
+    """Create a metric that scores 1.0 only when the predicted result matches the gold result."""
+    return functools.partial(sql_validity, executor=executor, gold_store=gold_store)
+
+
+def evaluate_module(module: NLToSQL, examples: List[dspy.Example], metric, stage: str,
+                    checkpoint: Checkpoint, workers: int) -> float:
+    """Score module on examples in parallel, printing per-example latency."""
+    def score(ex: dspy.Example) -> Dict[str, Any]:
+        pred = module(
+            question=ex.question,
+            schema=ex.schema,
+            constraints=ex.constraints
+        )
+        return {"score": metric(ex, pred)}
     
-    return metric
+    def report(idx: int, result: Dict[str, Any], resumed: bool):
+        status = '[OK]' if result["score"] > 0 else '[FAIL]'
+        source = "checkpoint" if resumed else f"{result['latency_ms']:.0f}ms"
+        print(f"  {examples[idx].question[:50]:50s} {status:6s} {source}")
+    
+    start = time.perf_counter()
+    results = run_stage(stage, examples, score, checkpoint, workers, on_result=report)
+    correct = sum(r["score"] for r in results)
+    latency = latency_summary(results)
+    print(f"  {len(examples)} examples in {time.perf_counter() - start:.1f}s wall; "
+          f"per example mean {latency['mean_ms']:.0f}ms, p50 {latency['p50_ms']:.0f}ms, "
+          f"p95 {latency['p95_ms']:.0f}ms")
+    return correct / len(examples) if examples else 0.0
+
 
+def bootstrap_demos(module: NLToSQL, trainset: List[dspy.Example], metric,
+                    checkpoint: Checkpoint, workers: int, warm: bool = True,
+                    max_bootstrapped_demos: int = 3, max_labeled_demos: int = 3) -> NLToSQL:
+    """Compile with dspy's BootstrapFewShot after a parallel, resumable warm-up.
 
-def optimize_nl_to_sql(lm: dspy.LM):
+    BootstrapFewShot runs its teacher over the trainset one example at a
+    time. The warm-up issues the same teacher calls (labeled demos sampled
+    as LabeledFewShot does, minus the example itself) on the thread pool
+    and checkpoints each one, so the serial compile that follows is served
+    by the shared LM cache and the SQL result cache. Without an LM cache
+    (warm=False) the warm-up would only duplicate calls and is skipped.
+    """
+    teacher = LabeledFewShot(k=max_labeled_demos).compile(module.reset_copy(), trainset=trainset)
+    
+    def trial(ex: dspy.Example) -> Dict[str, Any]:
+        program = teacher.deepcopy()
+        for _, predictor in program.named_predictors():
+            predictor.demos = [demo for demo in predictor.demos if demo != ex]
+        with dspy.settings.context(trace=[]):
+            pred = program(**ex.inputs())
+            trace = list(dspy.settings.trace)
+        return {"score": float(metric(ex, pred, trace))}
+    
+    def report(idx: int, result: Dict[str, Any], resumed: bool):
+        status = 'pass' if result["score"] else 'fail'
+        source = "checkpoint" if resumed else f"{result['latency_ms']:.0f}ms"
+        print(f"  {trainset[idx].question[:50]:50s} {status:6s} {source}")
+    
+    if warm:
+        run_stage("bootstrap", trainset, trial, checkpoint, workers, on_result=report)
+    
+    optimizer = BootstrapFewShot(metric=metric, max_bootstrapped_demos=max_bootstrapped_demos,
+                                 max_labeled_demos=max_labeled_demos)
+    compiled = optimizer.compile(module, trainset=trainset)
+    demos = [demo for _, predictor in compiled.named_predictors() for demo in predictor.demos]
+    augmented = sum(1 for demo in demos if demo.get("augmented"))
+    print(f"  {augmented} bootstrapped + {len(demos) - augmented} labeled demos")
+    return compiled
+
+
+def optimize_nl_to_sql(lm: dspy.LM, db_path: str = "data/northwind.sqlite", workers: int = 4,
+                       checkpoint_path: str = DEFAULT_CHECKPOINT_PATH, fresh: bool = False,
+                       out: str = None, sql_timeout: float = 10.0,
+                       metric_name: str = "exec", gold_path: str = DEFAULT_GOLD_PATH,
+                       artifacts_dir: str = DEFAULT_ARTIFACTS_DIR,
+                       mode: str = DEFAULT_MODULE_MODES["nl_to_sql"]):
     """Optimize the NL→SQL module."""
     print("Setting up DSPy optimizer for NL→SQL...")
     
@@ -143,8 +216,9 @@ def optimize_nl_to_sql(lm: dspy.LM):
     dspy.settings.configure(lm=lm)
     
     # Get schema
-    db_tool = SQLiteTool("data/northwind.sqlite")
+    db_tool = SQLiteTool(db_path, pool_size=workers)
     schema = db_tool.get_schema()
+    executor = CachedSQLExecutor(db_tool, timeout_s=sql_timeout)
     
     # Create examples
     examples = create_examples(schema)
@@ -154,86 +228,145 @@ def optimize_nl_to_sql(lm: dspy.LM):
     train_examples = examples[:8]
     val_examples = examples[8:]
     
+    checkpoint = Checkpoint(checkpoint_path, {
+        "model": lm_model_name(lm),
+        "data_version": db_tool.get_data_version(),
+        "examples": TRAINING_EXAMPLES,
+        "metric": metric_name,
+        "mode": mode,
+        "max_demos": [3, 3]
+    })
+    if fresh:
+        checkpoint.clear()
+    elif checkpoint.resumed:
+        print(f"Resuming from {checkpoint_path} "
+              + ", ".join(f"{stage}: {len(items)} done" for stage, items in checkpoint.stages.items()))
+    
     # Create module
-    nl_to_sql = NLToSQL()
+    nl_to_sql = NLToSQL(mode)
     
     # Create metric
-    metric = evaluate_sql(db_tool)
+    if metric_name == "exec":
+        gold_store = GoldResultStore(gold_path, executor)
+        failed = gold_store.precompute([ex["sql"] for ex in TRAINING_EXAMPLES])
+        print(f"Gold results: {gold_store.computed} computed, "
+              f"{len(TRAINING_EXAMPLES) - gold_store.computed - failed} loaded from {gold_path}")
+        if failed:
+            print(f"Warning: {failed} gold queries failed to execute and will score 0")
+        metric = execution_accuracy(executor, gold_store)
+    else:
+        metric = evaluate_sql(executor)
     
     # Evaluate before optimization
-    print("\nEvaluating before optimization...")
-    correct = 0
-    for ex in val_examples:
-        pred = nl_to_sql(
-            question=ex.question,
-            schema=ex.schema,
-            constraints=ex.constraints
-        )
-        score = metric(ex, pred)
-        correct += score
-        print(f"  {ex.question[:50]:50s} {'[OK]' if score > 0 else '[FAIL]'}")
+    print(f"\nEvaluating before optimization ({workers} workers)...")
+    before_accuracy = evaluate_module(nl_to_sql, val_examples, metric, "before", checkpoint, workers)
+    print(f"\nBefore: {before_accuracy:.1%} ({int(before_accuracy * len(val_examples))}/{len(val_examples)})")
     
-    before_accuracy = correct / len(val_examples)
-    print(f"\nBefore: {before_accuracy:.1%} ({int(correct)}/{len(val_examples)})")
-    
-    # Optimize with BootstrapFewShot
-    print("\nOptimizing with BootstrapFewShot...")
+    # Bootstrap few-shot demos in parallel
+    print("\nBootstrapping demos...")
     try:
-        from dspy.teleprompt import BootstrapFewShot
-        
-        optimizer = BootstrapFewShot(
-            metric=metric,
-            max_bootstrapped_demos=3,
-            max_labeled_demos=3
-        )
-        
-        optimized_nl_to_sql = optimizer.compile(
-            nl_to_sql,
-            trainset=train_examples
-        )
+        lm_cached = isinstance(lm, (CachedLM, ReplayLM)) or isinstance(getattr(lm, "lm", None), CachedLM)
+        optimized_nl_to_sql = bootstrap_demos(nl_to_sql, train_examples, metric, checkpoint, workers,
+                                              warm=lm_cached)
         
         # Evaluate after optimization
         print("\nEvaluating after optimization...")
-        correct = 0
-        for ex in val_examples:
-            pred = optimized_nl_to_sql(
-                question=ex.question,
-                schema=ex.schema,
-                constraints=ex.constraints
-            )
-            score = metric(ex, pred)
-            correct += score
-            print(f"  {ex.question[:50]:50s} {'[OK]' if score > 0 else '[FAIL]'}")
-        
-        after_accuracy = correct / len(val_examples)
-        print(f"\nAfter: {after_accuracy:.1%} ({int(correct)}/{len(val_examples)})")
+        after_accuracy = evaluate_module(optimized_nl_to_sql, val_examples, metric, "after",
+                                         checkpoint, workers)
+        print(f"\nAfter: {after_accuracy:.1%} ({int(after_accuracy * len(val_examples))}/{len(val_examples)})")
         print(f"Improvement: {(after_accuracy - before_accuracy):.1%}")
         
-        # Save optimized module
-        optimized_nl_to_sql.save("optimized_nl_to_sql.json")
-        print("\nSaved optimized module to optimized_nl_to_sql.json")
+        # Save optimized module as a new artifacts version
+        store = ArtifactStore(artifacts_dir)
+        version = store.save({"nl_to_sql": optimized_nl_to_sql}, metrics={"nl_to_sql": {
+            "metric": metric_name,
+            "before": before_accuracy,
+            "after": after_accuracy,
+            "val_examples": len(val_examples)
+        }})
+        print(f"\nSaved optimized module to {store.root / version}")
+        if out:
+            optimized_nl_to_sql.save(out)
+            print(f"Also saved to {out}")
         
     except Exception as e:
         print(f"Optimization failed: {e}")
         import traceback
         traceback.print_exc()
+    
+    stats = executor.stats()
+    print(f"SQL result cache: {stats['hits']} hits / {stats['misses']} misses")
 
 
-if __name__ == "__main__":
-    print("DSPy NL→SQL Optimizer")
-    print("=" * 60)
-    
-    # Setup LM
+def setup_lm(model: str, no_llm_cache: bool, llm_cache_path: str):
+    """Ollama LM for optimization, behind the shared LLM cache unless disabled."""
     try:
         lm = dspy.OllamaLocal(
-            model="phi3.5:3.8b-mini-instruct-q4_K_M",
+            model=model,
             max_tokens=500,
             temperature=0.1
         )
         print("Language model configured")
+        if not no_llm_cache:
+            # One cache shared by every worker thread
+            llm_cache = LMCache(llm_cache_path)
+            lm = CachedLM(lm, llm_cache)
+            print(f"LLM cache: {llm_cache.path} ({len(llm_cache)} entries)")
     except Exception as e:
         print(f"Error setting up LM: {e}")
         print("Make sure Ollama is running and the model is pulled")
-        exit(1)
+        sys.exit(1)
+    return lm
+
+
+@click.command()
+@click.option('--db', default='data/northwind.sqlite', help='Path to database')
+@click.option('--model', default='phi3.5:3.8b-mini-instruct-q4_K_M', help='Ollama model name')
+@click.option('--workers', default=4, help='Parallel evaluation/bootstrap threads')
+@click.option('--llm-cache', 'llm_cache_path', default=DEFAULT_CACHE_PATH, help='Path to persistent LLM response cache')
+@click.option('--no-llm-cache', is_flag=True, help='Disable the persistent LLM response cache')
+@click.option('--checkpoint', 'checkpoint_path', default=DEFAULT_CHECKPOINT_PATH, help='Optimization progress file')
+@click.option('--fresh', is_flag=True, help='Ignore and overwrite an existing checkpoint')
+@click.option('--sql-timeout', default=10.0, help='Per-query timeout for the metric in seconds')
+@click.option('--metric', 'metric_name', type=click.Choice(['exec', 'valid']), default='exec',
+              help='exec: result matches the gold query; valid: query merely executes')
+@click.option('--gold', 'gold_path', default=DEFAULT_GOLD_PATH, help='Stored gold result fingerprints')
+@click.option('--artifacts', 'artifacts_dir', default=DEFAULT_ARTIFACTS_DIR, help='Versioned artifacts directory')
+@click.option('--out', default=None, help='Also save the optimized module to this single file')
+@click.option('--record', 'record_path', default=None, help='Record every LM call to this cassette file')
+@click.option('--replay', 'replay_path', default=None, help='Answer LM calls from this cassette instead of Ollama')
+@click.option('--mode', type=click.Choice(list(MODULE_MODES)), default=DEFAULT_MODULE_MODES["nl_to_sql"],
+              help='Decoding mode of the NL->SQL module being optimized')
+def main(db: str, model: str, workers: int, llm_cache_path: str, no_llm_cache: bool,
+         checkpoint_path: str, fresh: bool, sql_timeout: float, metric_name: str,
+         gold_path: str, artifacts_dir: str, out: str, record_path: str, replay_path: str,
+         mode: str):
+    """Optimize the NL→SQL module with parallel, cached, resumable evaluation."""
+    print("DSPy NL→SQL Optimizer")
+    print("=" * 60)
+    
+    if record_path and replay_path:
+        raise click.UsageError("--record and --replay are mutually exclusive")
     
-    optimize_nl_to_sql(lm)
+    # Setup LM
+    if replay_path:
+        lm = ReplayLM(replay_path)
+        print(f"Replaying {lm.stats()['requests']} recorded LM calls from {replay_path}")
+    else:
+        lm = setup_lm(model, no_llm_cache, llm_cache_path)
+        if record_path:
+            lm = RecordingLM(lm, record_path)
+    
+    optimize_nl_to_sql(lm, db, workers, checkpoint_path, fresh, out, sql_timeout,
+                       metric_name, gold_path, artifacts_dir, mode)
+    
+    if isinstance(lm, RecordingLM):
+        lm.close()
+        print(f"Recorded {lm.recorded} LM calls to {record_path}")
+    elif isinstance(lm, ReplayLM):
+        stats = lm.stats()
+        print(f"Replay: {stats['hits']} hits / {stats['misses']} misses")
+
+
+if __name__ == "__main__":
+    main()
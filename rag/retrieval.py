@@ -1,10 +1,20 @@
 """RAG retrieval using TF-IDF for document search."""
+import hashlib
 from pathlib import Path
 from typing import List, Dict, Any
 import re
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
+
+from agent.lazy_imports import lazy_import
+from agent.tracing import get_tracer
+
+
+def docs_fingerprint(docs_dir: str) -> str:
+    """Hash of every markdown document's name and contents."""
+    digest = hashlib.sha256()
+    for doc_path in sorted(Path(docs_dir).glob("*.md")):
+        digest.update(doc_path.name.encode("utf-8"))
+        digest.update(doc_path.read_bytes())
+    return digest.hexdigest()
 
 
 class DocumentChunk:
@@ -26,13 +36,16 @@ class TFIDFRetriever:
         self.docs_dir = Path(docs_dir)
         self.chunk_size = chunk_size
         self.chunks: List[DocumentChunk] = []
-        self.vectorizer = TfidfVectorizer(
+        # sklearn is only imported once a retriever is actually built.
+        text = lazy_import("sklearn.feature_extraction.text")
+        self.vectorizer = text.TfidfVectorizer(
             lowercase=True,
             stop_words='english',
             ngram_range=(1, 2),
             max_features=1000
         )
         self.tfidf_matrix = None
+        self.index_hash = ""
         self._load_and_chunk_documents()
     
     def _load_and_chunk_documents(self):
@@ -48,6 +61,8 @@ class TFIDFRetriever:
             chunks = self._chunk_document(content, source)
             self.chunks.extend(chunks)
         
+        self.index_hash = docs_fingerprint(str(self.docs_dir))
+        
         # Build TF-IDF matrix
         if self.chunks:
             corpus = [chunk.content for chunk in self.chunks]
@@ -94,6 +109,14 @@ class TFIDFRetriever:
     
     def retrieve(self, query: str, top_k: int = 3) -> List[DocumentChunk]:
         """Retrieve top-k most relevant chunks for a query."""
+        with get_tracer().span("retriever.retrieve") as span:
+            span.set_attribute("retriever.top_k", top_k)
+            results = self._retrieve(query, top_k)
+            span.set_attribute("retriever.results", len(results))
+            return results
+    
+    def _retrieve(self, query: str, top_k: int) -> List[DocumentChunk]:
+        """Score all chunks against the query and keep the top-k."""
         if not self.chunks or self.tfidf_matrix is None:
             return []
         
@@ -101,10 +124,11 @@ class TFIDFRetriever:
         query_vec = self.vectorizer.transform([query])
         
         # Calculate cosine similarity
-        similarities = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
+        pairwise = lazy_import("sklearn.metrics.pairwise")
+        similarities = pairwise.cosine_similarity(query_vec, self.tfidf_matrix).flatten()
         
         # Get top-k indices
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        top_indices = lazy_import("numpy").argsort(similarities)[::-1][:top_k]
         
         # Create result chunks with scores
         results = []
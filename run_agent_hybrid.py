@@ -1,25 +1,54 @@
 """Main entry point for the retail analytics agent."""
+import time
+_IMPORTS_STARTED = time.perf_counter()
+
 import click
 import json
 import dspy
 from pathlib import Path
 from rich.console import Console
 from rich.progress import track
+from rich.table import Table
 import sys
 
 from agent.graph_hybrid import HybridAgent
+from agent.answer_cache import AnswerCache, DEFAULT_ANSWER_CACHE_PATH
+from agent.artifacts import ArtifactStore, DEFAULT_ARTIFACTS_DIR
+from agent.context_budget import ContextBudgeter, RESULT_FORMATS
+from agent.dspy_signatures import parse_module_modes
+from agent.graph_checkpoint import GraphCheckpointStore, DEFAULT_GRAPH_CHECKPOINT_PATH
+from agent.lm_cache import CachedLM, LMCache, DEFAULT_CACHE_PATH, DEFAULT_MAX_ENTRIES
+from agent.lm_cassette import RecordingLM, ReplayLM
+from agent.lm_client import (
+    HTTPModelLM, CHAT_TEMPLATES, DEFAULT_CHAT_TEMPLATE, DEFAULT_LM_URL, LM_APIS
+)
+from agent.profiling import Profiler
+from agent.tracing import OTLPJsonFileExporter, configure_tracing
+from tools.sharded_sqlite import ShardedSQLiteTool, SHARD_EXECUTORS
+from tools.sqlite_tool import SQL_ENGINES, SQLiteTool
 
+CLI_IMPORT_MS = (time.perf_counter() - _IMPORTS_STARTED) * 1000
 console = Console()
 
 
-def setup_ollama_lm(model: str = "phi3.5:3.8b-mini-instruct-q4_K_M"):
-    """Setup Ollama language model."""
+def setup_ollama_lm(model: str = "phi3.5:3.8b-mini-instruct-q4_K_M",
+                    cache: LMCache = None, http_options: dict = None):
+    """Setup Ollama language model, optionally behind a persistent cache.
+
+    With http_options, the pooled/batching ``HTTPModelLM`` client is used
+    instead of ``dspy.OllamaLocal``.
+    """
     try:
-        lm = dspy.OllamaLocal(
-            model=model,
-            max_tokens=1000,
-            temperature=0.1
-        )
+        if http_options is not None:
+            lm = HTTPModelLM(model, max_tokens=1000, temperature=0.1, **http_options)
+        else:
+            lm = dspy.OllamaLocal(
+                model=model,
+                max_tokens=1000,
+                temperature=0.1
+            )
+        if cache is not None:
+            lm = CachedLM(lm, cache)
         return lm
     except Exception as e:
         console.print(f"[red]Error setting up Ollama: {e}[/red]")
@@ -28,27 +57,175 @@ def setup_ollama_lm(model: str = "phi3.5:3.8b-mini-instruct-q4_K_M"):
         sys.exit(1)
 
 
+def print_startup_profile(agent: HybridAgent, first_answer_ms: float = None):
+    """Print CLI import, agent init, deferred init and lazy import timings."""
+    report = agent.startup_report()
+    table = Table(title="Startup profile")
+    table.add_column("Phase")
+    table.add_column("ms", justify="right")
+    table.add_row("import (CLI modules)", f"{CLI_IMPORT_MS:.1f}")
+    for phase, ms in report["startup_ms"].items():
+        table.add_row(f"init.{phase}", f"{ms:.1f}")
+    for name, ms in report["import_ms"].items():
+        table.add_row(f"lazy import {name}", f"{ms:.1f}")
+    for name, ms in report["lazy_init_ms"].items():
+        table.add_row(f"lazy init {name}", f"{ms:.1f}")
+    if first_answer_ms is not None:
+        table.add_row("process start -> first answer", f"{first_answer_ms:.1f}")
+    console.print(table)
+
+
+def print_profile_summary(profiler: Profiler):
+    """Print per-span latency percentiles and LLM usage."""
+    summary = profiler.summary()
+    if not summary:
+        return
+    
+    table = Table(title="Profile (per span)")
+    for column in ["Span", "Count", "Mean ms", "p50 ms", "p95 ms", "CPU ms",
+                   "LLM calls", "Prompt tok", "Completion tok", "Cache hits"]:
+        table.add_column(column, justify="left" if column == "Span" else "right")
+    
+    for name, stats in sorted(summary.items(), key=lambda item: -item[1]["mean_ms"] * item[1]["count"]):
+        table.add_row(
+            name,
+            str(stats["count"]),
+            f"{stats['mean_ms']:.1f}",
+            f"{stats['p50_ms']:.1f}",
+            f"{stats['p95_ms']:.1f}",
+            f"{stats['cpu_mean_ms']:.1f}",
+            str(int(stats.get("llm_calls", 0))),
+            str(int(stats.get("prompt_tokens", 0))),
+            str(int(stats.get("completion_tokens", 0))),
+            str(int(stats.get("llm_cache_hits", 0)))
+        )
+    
+    console.print(table)
+
+
 @click.command()
 @click.option('--batch', required=True, help='Path to JSONL file with questions')
 @click.option('--out', required=True, help='Path to output JSONL file')
 @click.option('--db', default='data/northwind.sqlite', help='Path to database')
+@click.option('--shard', 'shards', multiple=True,
+              help='Query this database shard (path or name=path; repeat per shard) instead of --db')
+@click.option('--shard-executor', type=click.Choice(list(SHARD_EXECUTORS)), default='process',
+              help='Run per-shard queries in worker processes or threads')
+@click.option('--sql-engine', type=click.Choice(list(SQL_ENGINES)), default='sqlite',
+              help='Answer supported aggregate queries from in-memory columnar arrays '
+                   '(cross-check: also verify each answer against SQLite)')
 @click.option('--docs', default='docs', help='Path to docs directory')
 @click.option('--model', default='phi3.5:3.8b-mini-instruct-q4_K_M', help='Ollama model name')
-def main(batch: str, out: str, db: str, docs: str, model: str):
+@click.option('--lm-client', type=click.Choice(['dspy', 'http']), default='dspy',
+              help='dspy.OllamaLocal, or the pooled HTTP client with in-flight limits and batching')
+@click.option('--lm-url', default=DEFAULT_LM_URL, help='Model server URL (http client)')
+@click.option('--lm-api', type=click.Choice(list(LM_APIS)), default='ollama',
+              help='Model server API; openai-compatible servers get batched completions')
+@click.option('--max-in-flight', default=2, help='Concurrent requests to the model server (http client)')
+@click.option('--batch-window-ms', default=5.0, help='How long to wait for prompts to batch together')
+@click.option('--chat-template', type=click.Choice(list(CHAT_TEMPLATES) + ['none']),
+              default=DEFAULT_CHAT_TEMPLATE,
+              help='Prompt format for batching chat requests (openai api); none sends them unbatched')
+@click.option('--llm-cache', 'llm_cache_path', default=DEFAULT_CACHE_PATH, help='Path to persistent LLM response cache')
+@click.option('--llm-cache-size', default=DEFAULT_MAX_ENTRIES, help='Max cached LLM responses before LRU eviction')
+@click.option('--no-llm-cache', is_flag=True, help='Disable the persistent LLM response cache')
+@click.option('--answer-cache/--no-answer-cache', default=False,
+              help='Answer repeated questions from the semantic answer cache (off by default)')
+@click.option('--answer-cache-path', default=DEFAULT_ANSWER_CACHE_PATH, help='Path to semantic answer cache')
+@click.option('--no-sql-templates', is_flag=True, help='Always generate SQL with the LLM instead of KPI templates')
+@click.option('--no-sql-rewrite', is_flag=True, help='Execute generated SQL as-is, without fence/prose stripping, LIMIT injection or date-predicate rewrites')
+@click.option('--artifacts', 'artifacts_dir', default=DEFAULT_ARTIFACTS_DIR, help='Versioned directory of optimized DSPy programs')
+@click.option('--artifacts-version', default=None, help='Artifacts version to load (default: latest)')
+@click.option('--no-artifacts', is_flag=True, help='Use unoptimized DSPy modules')
+@click.option('--module-modes', default='',
+              help='Per-module decoding mode overrides, e.g. "router=short,synthesizer=predict" or "all=cot"')
+@click.option('--context-tokens', default=1200, help='Token budget for SQL results plus document context in prompts')
+@click.option('--result-format', type=click.Choice(list(RESULT_FORMATS)), default='csv',
+              help='How SQL results are rendered into prompts')
+@click.option('--sql-candidates', default=1, help='Sample this many SQL queries in parallel and vote on their results')
+@click.option('--sql-timeout', default=5.0, help='Per-candidate SQL execution timeout in seconds')
+@click.option('--profile-out', default=None, help='Write per-question profiling spans to this JSONL file')
+@click.option('--trace-out', default=None, help='Append OTLP/JSON trace spans to this file')
+@click.option('--trace-level', type=click.Choice(['off', 'summary', 'full']), default='summary',
+              help='How much payload the per-question agent trace keeps')
+@click.option('--resume', 'resume_path', default=None, is_flag=False, flag_value=DEFAULT_GRAPH_CHECKPOINT_PATH,
+              help='Checkpoint every graph node per question id to this SQLite file and resume from it')
+@click.option('--record', 'record_path', default=None, help='Record every LM call to this cassette file')
+@click.option('--replay', 'replay_path', default=None, help='Answer LM calls from this cassette instead of Ollama')
+@click.option('--replay-latency', is_flag=True, help='Sleep for each replayed call\'s recorded latency')
+@click.option('--profile-startup', is_flag=True, help='Print import and initialization timings')
+def main(batch: str, out: str, db: str, shards: tuple, shard_executor: str, sql_engine: str,
+         docs: str, model: str,
+         lm_client: str, lm_url: str, lm_api: str, max_in_flight: int, batch_window_ms: float,
+         chat_template: str,
+         llm_cache_path: str, llm_cache_size: int, no_llm_cache: bool,
+         answer_cache: bool, answer_cache_path: str, no_sql_templates: bool, no_sql_rewrite: bool,
+         artifacts_dir: str, artifacts_version: str, no_artifacts: bool,
+         module_modes: str, context_tokens: int, result_format: str,
+         sql_candidates: int, sql_timeout: float,
+         profile_out: str, trace_out: str, trace_level: str, resume_path: str,
+         record_path: str, replay_path: str,
+         replay_latency: bool, profile_startup: bool):
     """Run the retail analytics agent on a batch of questions."""
     
     console.print("[bold blue]Retail Analytics Copilot[/bold blue]")
-    console.print(f"Database: {db}")
+    console.print(f"Database: {', '.join(shards) if shards else db}")
     console.print(f"Docs: {docs}")
     console.print(f"Model: {model}\n")
     
+    try:
+        modes = parse_module_modes(module_modes)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--module-modes")
+    if record_path and replay_path:
+        raise click.UsageError("--record and --replay are mutually exclusive")
+    if shards and sql_engine != 'sqlite':
+        raise click.UsageError("--sql-engine columnar does not support --shard")
+    
+    exporter = None
+    if trace_out:
+        exporter = OTLPJsonFileExporter(trace_out)
+        configure_tracing(exporter)
+    
     # Setup language model
     console.print("[yellow]Setting up language model...[/yellow]")
-    lm = setup_ollama_lm(model)
+    llm_cache = None
+    if replay_path:
+        # Replays never touch the model or the LLM cache.
+        lm = ReplayLM(replay_path, simulate_latency=replay_latency)
+        console.print(f"Replaying {lm.stats()['requests']} recorded LM calls from {replay_path}")
+    else:
+        llm_cache = None if no_llm_cache else LMCache(llm_cache_path, max_entries=llm_cache_size)
+        http_options = None
+        if lm_client == 'http':
+            http_options = {"url": lm_url, "api": lm_api, "max_in_flight": max_in_flight,
+                            "batch_window_ms": batch_window_ms,
+                            "chat_template": None if chat_template == 'none' else chat_template}
+        lm = setup_ollama_lm(model, cache=llm_cache, http_options=http_options)
+        if record_path:
+            lm = RecordingLM(lm, record_path)
     
     # Initialize agent
     console.print("[yellow]Initializing agent...[/yellow]")
-    agent = HybridAgent(db_path=db, docs_dir=docs, lm=lm)
+    answer_cache = AnswerCache(answer_cache_path) if answer_cache else None
+    profiler = Profiler()
+    checkpoints = GraphCheckpointStore(resume_path) if resume_path else None
+    if checkpoints is not None:
+        stats = checkpoints.stats()
+        console.print(f"Graph checkpoints: {stats['completed']} completed, "
+                      f"{stats['in_progress']} in progress in {resume_path}")
+    artifacts = None if no_artifacts else ArtifactStore(artifacts_dir, artifacts_version)
+    agent = HybridAgent(db_path=db, docs_dir=docs, lm=lm, answer_cache=answer_cache,
+                        use_sql_templates=not no_sql_templates, rewrite_sql=not no_sql_rewrite, profiler=profiler,
+                        trace_level=trace_level, sql_candidates=sql_candidates,
+                        sql_timeout_s=sql_timeout, artifacts=artifacts,
+                        context_budget=ContextBudgeter(context_tokens, result_format=result_format),
+                        module_modes=modes, checkpoints=checkpoints,
+                        shards=list(shards), shard_executor=shard_executor, sql_engine=sql_engine)
+    console.print(
+        "Startup: " + ", ".join(f"{phase} {ms:.0f}ms" for phase, ms in agent.startup_ms.items())
+        + (f"; artifacts {artifacts.version or 'none'} from {artifacts.root}" if artifacts else "")
+    )
     
     # Load questions
     console.print(f"[yellow]Loading questions from {batch}...[/yellow]")
@@ -61,6 +238,8 @@ def main(batch: str, out: str, db: str, docs: str, model: str):
     
     # Process questions
     results = []
+    context_totals = {}
+    first_answer_ms = None
     for q in track(questions, description="Processing questions..."):
         console.print(f"\n[cyan]Question: {q['id']}[/cyan]")
         console.print(f"  {q['question']}")
@@ -68,7 +247,8 @@ def main(batch: str, out: str, db: str, docs: str, model: str):
         try:
             result = agent.run(
                 question=q['question'],
-                format_hint=q['format_hint']
+                format_hint=q['format_hint'],
+                question_id=q['id']
             )
             
             output = {
@@ -80,6 +260,12 @@ def main(batch: str, out: str, db: str, docs: str, model: str):
                 "citations": result.get('citations', [])
             }
             
+            if first_answer_ms is None:
+                first_answer_ms = (time.perf_counter() - _IMPORTS_STARTED) * 1000
+            
+            for key, value in result.get('context_tokens', {}).items():
+                context_totals[key] = context_totals.get(key, 0) + value
+            
             console.print(f"[green]  Answer: {output['final_answer']}[/green]")
             console.print(f"  Confidence: {output['confidence']:.2f}")
             
@@ -107,6 +293,131 @@ def main(batch: str, out: str, db: str, docs: str, model: str):
             f.write(json.dumps(result) + '\n')
     
     console.print(f"[bold green]Done! Results written to {out}[/bold green]")
+    
+    print_profile_summary(profiler)
+    
+    if profile_startup:
+        print_startup_profile(agent, first_answer_ms)
+    
+    if context_totals:
+        console.print(
+            "Prompt context tokens (pre -> post budgeting): " + ", ".join(
+                f"{part} {context_totals.get(f'{part}_pre_tokens', 0)} -> "
+                f"{context_totals.get(f'{part}_post_tokens', 0)}"
+                for part in ("rag", "sql") if f"{part}_pre_tokens" in context_totals
+            )
+        )
+    
+    report = agent.startup_report()
+    for name, info in sorted(report["modules"].items()):
+        console.print(
+            f"Module {name}: {info['status']} ({info['mode']}, {info['demos']} demos, "
+            f"version {info['version']}, {info['load_ms']:.0f}ms lazy load)"
+        )
+    if profile_out:
+        profiler.export_jsonl(profile_out)
+        console.print(f"Profiling spans written to {profile_out}")
+    
+    if exporter is not None:
+        exporter.shutdown()
+        console.print(f"Exported {exporter.exported} trace spans to {trace_out}")
+    
+    if agent.sql_templates is not None:
+        stats = agent.sql_templates.stats()
+        console.print(
+            f"SQL templates: {stats['matched']}/{stats['lookups']} matched "
+            f"({stats['coverage']:.0%} coverage); "
+            + ", ".join(
+                f"{path} {lat['mean_ms']:.0f}ms avg over {lat['count']}"
+                for path, lat in stats['latency'].items()
+            )
+        )
+    
+    if agent.sql_rewriter is not None and agent.sql_rewriter.queries:
+        stats = agent.sql_rewriter.stats()
+        console.print(
+            f"SQL rewrites: {stats['rewritten']}/{stats['queries']} queries rewritten, "
+            f"{stats['rejected']} rejected"
+            + ("; " + ", ".join(f"{name} {count}" for name, count in sorted(stats['rewrites'].items()))
+               if stats['rewrites'] else "")
+            + (f"; warnings: {stats['warnings']}" if stats['warnings'] else "")
+        )
+    
+    if isinstance(agent.db_tool, ShardedSQLiteTool):
+        stats = agent.db_tool.stats()
+        console.print(
+            f"Shards: {len(stats['shards'])} ({stats['executor']} pool), plans "
+            + ", ".join(f"{kind} {count}" for kind, count in sorted(stats['plans'].items()))
+            + (f"; union fallbacks: {stats['fallback_reasons']}" if stats['fallback_reasons'] else "")
+        )
+        agent.db_tool.close()
+    
+    if isinstance(agent.db_tool, SQLiteTool) and agent.db_tool.date_rewrites:
+        stats = agent.db_tool.stats()
+        console.print(
+            "Date-range rewrites: "
+            + ", ".join(f"{kind} {count}" for kind, count in sorted(stats['date_rewrites'].items()))
+            + "; indexes " + ", ".join(
+                f"{name} ({index['rows']} rows, {index['build_ms']:.0f}ms)"
+                for name, index in stats['date_indexes'].items()
+            )
+        )
+    
+    if sql_engine != 'sqlite':
+        stats = agent.db_tool.stats()
+        console.print(
+            f"Columnar engine: {stats['columnar']} queries ({stats['coverage']:.0%} coverage), "
+            f"{stats['columnar_ms']:.0f}ms total, tables loaded in {stats['load_ms']:.0f}ms"
+            + (f"; {stats['cross_checked']} cross-checked, {stats['mismatches']} mismatches"
+               if sql_engine == 'cross-check' else "")
+            + (f"; SQLite fallbacks: {stats['fallbacks']}" if stats['fallbacks'] else "")
+        )
+    
+    if checkpoints is not None:
+        stats = checkpoints.stats()
+        console.print(
+            f"Graph checkpoints: {stats['completed_hits']} questions already done, "
+            f"{stats['resumed_questions']} resumed mid-graph ({stats['resumed_steps']} nodes skipped)"
+        )
+        checkpoints.close()
+    
+    if isinstance(lm, RecordingLM):
+        lm.close()
+        console.print(f"Recorded {lm.recorded} LM calls to {record_path}")
+        lm = lm.lm
+    if isinstance(lm, ReplayLM):
+        stats = lm.stats()
+        console.print(
+            f"Replay: {stats['hits']} hits / {stats['misses']} misses, "
+            f"{stats['replayed_latency_ms'] / 1000:.1f}s of recorded LM latency "
+            + ("simulated" if replay_latency else "skipped")
+        )
+    
+    http_lm = getattr(lm, "lm", lm)  # CachedLM keeps the underlying client on .lm
+    if isinstance(http_lm, HTTPModelLM):
+        stats = http_lm.stats()
+        console.print(
+            f"LM client: {stats['prompts']} prompts in {stats['requests']} requests "
+            f"(mean batch {stats['mean_batch_size']:.1f}), peak {stats['peak_in_flight']}/"
+            f"{stats['max_in_flight']} in flight, {stats['connections_created']} connections"
+        )
+    
+    if llm_cache is not None:
+        stats = llm_cache.stats()
+        console.print(
+            f"LLM cache: {stats['hits']} hits / {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%}), {stats['entries']} entries, "
+            f"{stats['evictions']} evicted"
+        )
+        llm_cache.close()
+    
+    if answer_cache is not None:
+        stats = answer_cache.stats()
+        console.print(
+            f"Answer cache: {stats['hits']} hits / {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%}), {stats['invalidations']} invalidated"
+        )
+        answer_cache.close()
 
 
 if __name__ == '__main__':
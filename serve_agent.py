@@ -0,0 +1,125 @@
+"""Long-running HTTP service keeping one warm agent in memory."""
+import asyncio
+import click
+from rich.console import Console
+
+from agent.answer_cache import AnswerCache, DEFAULT_ANSWER_CACHE_PATH
+from agent.artifacts import ArtifactStore, DEFAULT_ARTIFACTS_DIR
+from agent.dspy_signatures import parse_module_modes
+from agent.graph_hybrid import HybridAgent
+from agent.lm_cache import CachedLM, LMCache, DEFAULT_CACHE_PATH, DEFAULT_MAX_ENTRIES
+from agent.lm_client import (
+    HTTPModelLM, CHAT_TEMPLATES, DEFAULT_CHAT_TEMPLATE, DEFAULT_LM_URL, LM_APIS
+)
+from agent.profiling import Profiler
+from agent.server import AgentServer
+from tools.sharded_sqlite import SHARD_EXECUTORS
+from tools.sqlite_tool import SQL_ENGINES
+from run_agent_hybrid import setup_ollama_lm
+
+console = Console()
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', help='Interface to bind')
+@click.option('--port', default=8080, help='Port to bind (0 picks a free port)')
+@click.option('--db', default='data/northwind.sqlite', help='Path to database')
+@click.option('--shard', 'shards', multiple=True,
+              help='Query this database shard (path or name=path; repeat per shard) instead of --db')
+@click.option('--shard-executor', type=click.Choice(list(SHARD_EXECUTORS)), default='process',
+              help='Run per-shard queries in worker processes or threads')
+@click.option('--sql-engine', type=click.Choice(list(SQL_ENGINES)), default='sqlite',
+              help='Answer supported aggregate queries from in-memory columnar arrays '
+                   '(cross-check: also verify each answer against SQLite)')
+@click.option('--docs', default='docs', help='Path to docs directory')
+@click.option('--model', default='phi3.5:3.8b-mini-instruct-q4_K_M', help='Ollama model name')
+@click.option('--lm-client', type=click.Choice(['dspy', 'http']), default='http',
+              help='dspy.OllamaLocal, or the pooled HTTP client with in-flight limits and batching')
+@click.option('--lm-url', default=DEFAULT_LM_URL, help='Model server URL (http client)')
+@click.option('--lm-api', type=click.Choice(list(LM_APIS)), default='ollama',
+              help='Model server API; openai-compatible servers get batched completions')
+@click.option('--max-in-flight', default=2, help='Concurrent requests to the model server (http client)')
+@click.option('--batch-window-ms', default=5.0, help='How long to wait for prompts to batch together')
+@click.option('--chat-template', type=click.Choice(list(CHAT_TEMPLATES) + ['none']),
+              default=DEFAULT_CHAT_TEMPLATE,
+              help='Prompt format for batching chat requests (openai api); none sends them unbatched')
+@click.option('--max-concurrency', default=2, help='Questions answered at the same time')
+@click.option('--max-queue', default=8, help='Requests allowed to wait before returning 429')
+@click.option('--request-timeout', default=300.0, help='Seconds before a question returns 504')
+@click.option('--llm-cache', 'llm_cache_path', default=DEFAULT_CACHE_PATH, help='Path to persistent LLM response cache')
+@click.option('--llm-cache-size', default=DEFAULT_MAX_ENTRIES, help='Max cached LLM responses before LRU eviction')
+@click.option('--no-llm-cache', is_flag=True, help='Disable the persistent LLM response cache')
+@click.option('--answer-cache/--no-answer-cache', default=False,
+              help='Answer repeated questions from the semantic answer cache (off by default)')
+@click.option('--answer-cache-path', default=DEFAULT_ANSWER_CACHE_PATH, help='Path to semantic answer cache')
+@click.option('--no-sql-templates', is_flag=True, help='Always generate SQL with the LLM instead of KPI templates')
+@click.option('--no-sql-rewrite', is_flag=True, help='Execute generated SQL as-is, without fence/prose stripping, LIMIT injection or date-predicate rewrites')
+@click.option('--artifacts', 'artifacts_dir', default=DEFAULT_ARTIFACTS_DIR, help='Versioned directory of optimized DSPy programs')
+@click.option('--no-artifacts', is_flag=True, help='Use unoptimized DSPy modules')
+@click.option('--module-modes', default='',
+              help='Per-module decoding mode overrides, e.g. "router=short,synthesizer=predict" or "all=cot"')
+@click.option('--sql-candidates', default=1, help='Sample this many SQL queries in parallel and vote on their results')
+@click.option('--stub-lm', is_flag=True, help='Answer with the deterministic benchmark stub instead of Ollama')
+@click.option('--stub-latency-ms', default=0.0, help='Injected latency per stub LM call')
+def main(host: str, port: int, db: str, shards: tuple, shard_executor: str, sql_engine: str,
+         docs: str, model: str, lm_client: str, lm_url: str,
+         lm_api: str, max_in_flight: int, batch_window_ms: float,
+         chat_template: str, max_concurrency: int,
+         max_queue: int, request_timeout: float, llm_cache_path: str, llm_cache_size: int,
+         no_llm_cache: bool, answer_cache: bool, answer_cache_path: str,
+         no_sql_templates: bool, no_sql_rewrite: bool, artifacts_dir: str, no_artifacts: bool, module_modes: str,
+         sql_candidates: int, stub_lm: bool, stub_latency_ms: float):
+    """Serve POST /ask, GET /metrics and GET /healthz."""
+    try:
+        modes = parse_module_modes(module_modes)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--module-modes")
+    if shards and sql_engine != 'sqlite':
+        raise click.UsageError("--sql-engine columnar does not support --shard")
+    llm_cache = None if no_llm_cache else LMCache(llm_cache_path, max_entries=llm_cache_size)
+    if stub_lm:
+        from benchmarks.stub_lm import StubLM
+        lm = StubLM(latency_s=stub_latency_ms / 1000)
+        if llm_cache is not None:
+            lm = CachedLM(lm, llm_cache)
+    else:
+        http_options = None
+        if lm_client == 'http':
+            http_options = {"url": lm_url, "api": lm_api, "max_in_flight": max_in_flight,
+                            "batch_window_ms": batch_window_ms,
+                            "chat_template": None if chat_template == 'none' else chat_template}
+        lm = setup_ollama_lm(model, cache=llm_cache, http_options=http_options)
+    
+    answer_cache = AnswerCache(answer_cache_path) if answer_cache else None
+    agent = HybridAgent(db_path=db, docs_dir=docs, lm=lm, answer_cache=answer_cache,
+                        use_sql_templates=not no_sql_templates, rewrite_sql=not no_sql_rewrite,
+                        profiler=Profiler(max_questions=256), trace_level="off",
+                        sql_candidates=sql_candidates, module_modes=modes,
+                        shards=list(shards), shard_executor=shard_executor, sql_engine=sql_engine,
+                        artifacts=None if no_artifacts else ArtifactStore(artifacts_dir))
+    agent.warm_up()
+    phases = {**agent.startup_ms, **agent.lazy_init_ms}
+    console.print("Agent ready: " + ", ".join(f"{phase} {ms:.0f}ms" for phase, ms in phases.items()))
+    
+    # CachedLM keeps the underlying client on .lm
+    http_lm = getattr(lm, "lm", lm)
+    http_lm = http_lm if isinstance(http_lm, HTTPModelLM) else None
+    server = AgentServer(agent, host, port, max_concurrency, max_queue, request_timeout,
+                         stats_sources={"llm_cache": llm_cache, "answer_cache": answer_cache,
+                                        "lm_client": http_lm,
+                                        "shards": agent.db_tool if shards else None,
+                                        "columnar": agent.db_tool if sql_engine != 'sqlite' else None})
+    
+    async def run():
+        bound_host, bound_port = await server.start()
+        console.print(f"[bold green]Listening on http://{bound_host}:{bound_port}[/bold green]")
+        await server.serve_forever()
+    
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        console.print("Shutting down")
+
+
+if __name__ == "__main__":
+    main()
@@ -52,7 +52,97 @@ except Exception as e:
 
 print()
 
-print("4. Checking evaluation file...")
+print("4. Testing SQL templates...")
+try:
+    import json
+    from agent.question_signature import QuestionNormalizer
+    from agent.sql_templates import SQLTemplateLibrary
+    library = SQLTemplateLibrary(QuestionNormalizer("docs"))
+    with open("sample_questions_hybrid_eval.jsonl") as f:
+        for line in f:
+            q = json.loads(line)
+            match = library.match(q["question"], q["format_hint"])
+            print(f"      - {q['id']}: {match.template if match else 'LLM'}")
+    stats = library.stats()
+    print(f"   [OK] Template coverage: {stats['matched']}/{stats['lookups']}")
+
+    # Filters no template can express must fall back to the LLM.
+    unsupported = [
+        ("Total revenue from Chai in 1997", "float"),
+        ("Average revenue per order in 1997", "float"),
+        ("Revenue from orders shipped to Germany in 1997", "float"),
+        ("Revenue lost to discounts in 1997", "float"),
+        ("Top 3 products by revenue excluding discontinued. Return list[{product:str, revenue:float}].",
+         "list[{product:str, revenue:float}]"),
+        ("How many orders shipped late in 1997?", "int"),
+        ("Top 3 products by revenue for customers in 1997", "list[{product:str, revenue:float}]"),
+        ("Top 3 customers by revenue in 1997", "list[{product:str, revenue:float}]"),
+    ]
+    wrong = [q for q, hint in unsupported if library.match(q, hint) is not None]
+    if wrong:
+        print(f"   [ERROR] Templates matched questions they cannot answer: {wrong}")
+    else:
+        print(f"   [OK] {len(unsupported)} unsupported filters fall back to the LLM")
+except Exception as e:
+    print(f"   [ERROR] {e}")
+    import traceback
+    traceback.print_exc()
+
+print()
+
+print("5. Testing server admission control...")
+try:
+    import asyncio
+    from agent.graph_hybrid import HybridAgent
+    from agent.server import AgentServer
+    from benchmarks.stub_lm import StubLM
+
+    async def send(port, head, body=b""):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        writer.close()
+        return status
+
+    async def ask(port):
+        body = json.dumps({"question": "How many orders are there?", "format_hint": "int"}).encode()
+        head = f"POST /ask HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n"
+        return await send(port, head, body)
+
+    async def check_server():
+        # Every question makes several 0.2s LM calls, well past the 0.3s timeout.
+        agent = HybridAgent("data/northwind.sqlite", "docs", StubLM(latency_s=0.2))
+        server = AgentServer(agent, port=0, max_concurrency=1, max_queue=0, request_timeout_s=0.3)
+        _, port = await server.start()
+        try:
+            first = asyncio.create_task(ask(port))
+            await asyncio.sleep(0.05)
+            overflow = await ask(port)
+            timed_out = await first
+            # The timed-out question is still running, so its slot is still taken.
+            still_busy = await ask(port)
+            bad_length = await send(port, "POST /ask HTTP/1.1\r\nContent-Length: abc\r\n")
+            while server.in_flight:
+                await asyncio.sleep(0.05)
+        finally:
+            await server.stop()
+        return overflow, timed_out, still_busy, bad_length
+
+    overflow, timed_out, still_busy, bad_length = asyncio.run(check_server())
+    checks = [("overflow", overflow, 429), ("timeout", timed_out, 504),
+              ("slot held after timeout", still_busy, 429), ("bad Content-Length", bad_length, 400)]
+    for name, got, want in checks:
+        status = "[OK]" if got == want else "[ERROR]"
+        print(f"   {status} {name}: {got} (expected {want})")
+except Exception as e:
+    print(f"   [ERROR] {e}")
+    import traceback
+    traceback.print_exc()
+
+print()
+
+print("6. Checking evaluation file...")
 try:
     import json
     with open("sample_questions_hybrid_eval.jsonl") as f:
@@ -0,0 +1,1191 @@
+"""Columnar in-memory execution of aggregate SELECTs over the core tables.
+
+``ColumnarEngine`` loads each table once into NumPy arrays:
+
+- numeric columns as int32/int64 or float64 arrays plus a NULL mask;
+- text columns dictionary-encoded as int32 codes into a sorted array of
+  distinct values, so code order is string order (BINARY collation);
+- ``Orders`` pre-sorted by ``OrderDate``, so a date filter selects a
+  contiguous row slice found by binary search.
+
+A query is split by the shard planner (``plan_query``) into a partial
+query (group keys plus SUM/TOTAL/COUNT/MIN/MAX per group) and a merge
+query. The partial query is evaluated here with vectorized FK joins,
+filters and ``bincount`` aggregation. The merge (AVG, ROUND, HAVING,
+ORDER BY, LIMIT) runs in SQLite over one row per group, so it follows
+SQLite's semantics exactly. Scalar functions and single-column
+predicates (``DATE(o.OrderDate) BETWEEN ? AND ?``, ``c.CategoryName = ?``)
+are evaluated by SQLite over the column's distinct values and mapped back
+through the codes.
+
+Anything outside that subset raises ``Unsupported`` so the caller can fall
+back to SQLite.
+"""
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from tools.sharded_sqlite import QueryResult, merge_aggregate, output_names, plan_query
+from tools.sql_parsing import (
+    EXPRESSION_KEYWORDS, Token, aggregate_calls, parse_select, split_top_level, unquote
+)
+from tools.sqlite_tool import SQLiteTool
+
+
+CORE_TABLES = ("Orders", "Order Details", "Products", "Categories", "Customers")
+# Table -> column its rows are stored sorted by.
+SORT_KEYS = {"orders": "orderdate"}
+DISTINCT_LIMIT = 200000
+DISTINCT_CACHE_SIZE = 256
+# Key spaces up to this size are grouped by counting rather than sorting.
+DENSE_GROUP_LIMIT = 1 << 20
+JOIN_END = ("JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL", "ON", "USING")
+COMPARISONS = ("=", "==", "!=", "<>", "<", "<=", ">", ">=")
+
+
+class Unsupported(Exception):
+    """The query is outside the columnar subset; carries the reason."""
+
+
+@dataclass
+class Column:
+    """One loaded column: numeric values with a NULL mask, or dictionary codes."""
+    name: str
+    values: np.ndarray
+    null: Optional[np.ndarray] = None
+    dictionary: Optional[np.ndarray] = None
+    is_int: bool = False
+    # Declared type, so expressions over distinct values see the same affinity.
+    decltype: str = ""
+
+    @property
+    def is_text(self) -> bool:
+        return self.dictionary is not None
+
+
+@dataclass
+class Vec:
+    """Column or expression values for the rows of a frame."""
+    values: np.ndarray
+    null: Optional[np.ndarray] = None
+    dictionary: Optional[np.ndarray] = None
+    is_int: bool = False
+
+    @property
+    def is_text(self) -> bool:
+        return self.dictionary is not None
+
+    def valid(self) -> np.ndarray:
+        if self.is_text:
+            return self.values >= 0
+        return np.ones(len(self.values), dtype=bool) if self.null is None else ~self.null
+
+
+class ColumnarTable:
+    def __init__(self, name: str, columns: Dict[str, Optional[Column]], n_rows: int,
+                 sorted_by: Optional[str] = None):
+        self.name = name
+        self.columns = columns
+        self.n_rows = n_rows
+        self.sorted_by = sorted_by
+
+    def column(self, key: str) -> Column:
+        column = self.columns.get(key)
+        if column is None:
+            reason = "mixed-type" if key in self.columns else "unknown"
+            raise Unsupported(f"{reason} column {self.name}.{key}")
+        return column
+
+
+def _encode(name: str, values: Sequence[Any]) -> Optional[Column]:
+    """Column arrays for one SQLite column; None when its values mix types."""
+    types = {type(v) for v in values if v is not None}
+    has_null = any(v is None for v in values)
+    if not types - {int}:
+        array = np.array([0 if v is None else v for v in values], dtype=np.int64)
+        if len(array) and array.min() >= -2**31 and array.max() < 2**31:
+            array = array.astype(np.int32)
+        null = np.array([v is None for v in values], dtype=bool) if has_null else None
+        return Column(name, array, null, is_int=True)
+    if not types - {int, float}:
+        array = np.array([math.nan if v is None else float(v) for v in values], dtype=np.float64)
+        null = np.array([v is None for v in values], dtype=bool) if has_null else None
+        return Column(name, array, null)
+    if types == {str}:
+        dictionary = np.array(sorted({v for v in values if v is not None}), dtype=object)
+        index = {value: code for code, value in enumerate(dictionary)}
+        codes = np.fromiter((index.get(v, -1) if v is not None else -1 for v in values),
+                            dtype=np.int32, count=len(values))
+        return Column(name, codes, dictionary=dictionary)
+    return None
+
+
+def _vec_from_values(values: List[Any]) -> Vec:
+    """Vec for Python values as SQLite returned them."""
+    column = _encode("", values)
+    if column is None:
+        raise Unsupported("expression returns mixed types")
+    return Vec(column.values, column.null, column.dictionary, column.is_int)
+
+
+def _gather(vec: Vec, rows: np.ndarray) -> Vec:
+    return Vec(vec.values[rows], None if vec.null is None else vec.null[rows], vec.dictionary, vec.is_int)
+
+
+def _is_ident(token: Token) -> bool:
+    return token.kind == "qident" or (token.kind == "ident" and token.upper not in EXPRESSION_KEYWORDS)
+
+
+@dataclass
+class ColumnRef:
+    alias: Optional[str]
+    column: str
+    start: int
+    end: int
+
+
+def column_refs(tokens: List[Token]) -> List[ColumnRef]:
+    """Qualified (alias.column) and bare column references with their text spans."""
+    refs = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if i + 2 < len(tokens) and tokens[i + 1].is_punct(".") and token.kind in ("ident", "qident") \
+                and tokens[i + 2].kind in ("ident", "qident"):
+            refs.append(ColumnRef(unquote(token).lower(), unquote(tokens[i + 2]).lower(),
+                                  token.start, tokens[i + 2].end))
+            i += 3
+            continue
+        follows_paren = i + 1 < len(tokens) and tokens[i + 1].is_punct("(")
+        after_collate = i > 0 and tokens[i - 1].upper == "COLLATE"
+        if _is_ident(token) and not follows_paren and not after_collate:
+            refs.append(ColumnRef(None, unquote(token).lower(), token.start, token.end))
+        i += 1
+    return refs
+
+
+class _Expr:
+    """Parsed row-level expression: a node tree over token spans."""
+
+    __slots__ = ("kind", "op", "args", "value", "ref", "start", "end", "negated")
+
+    def __init__(self, kind: str, start: int, end: int, op: str = "", args: List["_Expr"] = None,
+                 value: Any = None, ref: Tuple[str, str] = None, negated: bool = False):
+        self.kind = kind
+        self.op = op
+        self.args = args or []
+        self.value = value
+        self.ref = ref
+        self.start = start
+        self.end = end
+        self.negated = negated
+
+
+class _Parser:
+    """Recursive-descent parser for arithmetic and boolean expressions."""
+
+    def __init__(self, tokens: List[Token], params: Dict[int, Any], resolve):
+        self.tokens = tokens
+        self.params = params
+        self.resolve = resolve
+        self.i = 0
+
+    def parse(self) -> _Expr:
+        node = self.or_()
+        if self.i != len(self.tokens):
+            raise Unsupported(f"unexpected {self.tokens[self.i].text!r}")
+        return node
+
+    def peek(self, offset: int = 0) -> Optional[Token]:
+        j = self.i + offset
+        return self.tokens[j] if j < len(self.tokens) else None
+
+    def take(self) -> Token:
+        token = self.peek()
+        if token is None:
+            raise Unsupported("truncated expression")
+        self.i += 1
+        return token
+
+    def keyword(self, word: str) -> bool:
+        token = self.peek()
+        if token is not None and token.upper == word:
+            self.i += 1
+            return True
+        return False
+
+    def or_(self) -> _Expr:
+        node = self.and_()
+        while self.keyword("OR"):
+            right = self.and_()
+            node = _Expr("or", node.start, right.end, args=[node, right])
+        return node
+
+    def and_(self) -> _Expr:
+        node = self.not_()
+        while self.keyword("AND"):
+            right = self.not_()
+            node = _Expr("and", node.start, right.end, args=[node, right])
+        return node
+
+    def not_(self) -> _Expr:
+        token = self.peek()
+        if token is not None and token.upper == "NOT":
+            self.i += 1
+            inner = self.not_()
+            return _Expr("not", token.start, inner.end, args=[inner])
+        return self.comparison()
+
+    def comparison(self) -> _Expr:
+        left = self.additive()
+        token = self.peek()
+        if token is None:
+            return left
+        negated = False
+        if token.upper == "NOT" and self.peek(1) is not None and self.peek(1).upper in ("BETWEEN", "IN"):
+            negated = True
+            self.i += 1
+            token = self.peek()
+        if token.kind == "op" and token.text in COMPARISONS:
+            self.i += 1
+            right = self.additive()
+            return _Expr("cmp", left.start, right.end, op=token.text, args=[left, right])
+        if token.upper == "BETWEEN":
+            self.i += 1
+            low = self.additive()
+            if not self.keyword("AND"):
+                raise Unsupported("BETWEEN without AND")
+            high = self.additive()
+            return _Expr("between", left.start, high.end, args=[left, low, high], negated=negated)
+        if token.upper == "IN":
+            self.i += 1
+            if not (self.peek() and self.peek().is_punct("(")):
+                raise Unsupported("IN without a list")
+            self.i += 1
+            items = [self.additive()]
+            while self.peek() is not None and self.peek().is_punct(","):
+                self.i += 1
+                items.append(self.additive())
+            close = self.take()
+            if not close.is_punct(")"):
+                raise Unsupported("unterminated IN list")
+            return _Expr("in", left.start, close.end, args=[left] + items, negated=negated)
+        if token.upper == "IS":
+            self.i += 1
+            negated = self.keyword("NOT")
+            null = self.take()
+            if null.upper != "NULL":
+                raise Unsupported("IS other than IS [NOT] NULL")
+            return _Expr("isnull", left.start, null.end, args=[left], negated=negated)
+        return left
+
+    def additive(self) -> _Expr:
+        node = self.multiplicative()
+        while self.peek() is not None and self.peek().kind == "op" and self.peek().text in ("+", "-"):
+            op = self.take().text
+            right = self.multiplicative()
+            node = _Expr("bin", node.start, right.end, op=op, args=[node, right])
+        return node
+
+    def multiplicative(self) -> _Expr:
+        node = self.unary()
+        while self.peek() is not None and self.peek().kind == "op" and self.peek().text in ("*", "/", "%"):
+            op = self.take().text
+            right = self.unary()
+            node = _Expr("bin", node.start, right.end, op=op, args=[node, right])
+        return node
+
+    def unary(self) -> _Expr:
+        token = self.peek()
+        if token is not None and token.kind == "op" and token.text in ("-", "+"):
+            self.i += 1
+            inner = self.unary()
+            return inner if token.text == "+" else _Expr("neg", token.start, inner.end, args=[inner])
+        return self.primary()
+
+    def primary(self) -> _Expr:
+        token = self.take()
+        if token.kind == "number":
+            text = token.text
+            value = int(text, 16) if text.lower().startswith("0x") else (
+                int(text) if text.isdigit() else float(text))
+            return _Expr("lit", token.start, token.end, value=value)
+        if token.kind == "string":
+            return _Expr("lit", token.start, token.end, value=token.text[1:-1].replace("''", "'"))
+        if token.kind == "param":
+            if token.start not in self.params:
+                raise Unsupported("unbound parameter")
+            return _Expr("lit", token.start, token.end, value=self.params[token.start])
+        if token.upper == "NULL":
+            return _Expr("lit", token.start, token.end, value=None)
+        if token.is_punct("("):
+            node = self.or_()
+            close = self.take()
+            if not close.is_punct(")"):
+                raise Unsupported("unbalanced parentheses")
+            return _Expr(node.kind, token.start, close.end, node.op, node.args, node.value,
+                         node.ref, node.negated)
+        if token.kind in ("ident", "qident") and self.peek() is not None and self.peek().is_punct("("):
+            # Scalar function or CAST: kept as a span, evaluated by SQLite on distinct values.
+            depth, end = 0, None
+            while self.i < len(self.tokens):
+                t = self.take()
+                depth += t.is_punct("(") - t.is_punct(")")
+                if depth == 0:
+                    end = t.end
+                    break
+            if end is None:
+                raise Unsupported("unbalanced parentheses")
+            return _Expr("func", token.start, end, op=token.upper)
+        if token.kind in ("ident", "qident"):
+            if self.peek() is not None and self.peek().is_punct("."):
+                self.i += 1
+                column = self.take()
+                return _Expr("col", token.start, column.end,
+                             ref=self.resolve(unquote(token).lower(), unquote(column).lower()))
+            return _Expr("col", token.start, token.end, ref=self.resolve(None, unquote(token).lower()))
+        raise Unsupported(f"unsupported syntax {token.text!r}")
+
+
+def _split_conjuncts(tokens: List[Token]) -> List[List[Token]]:
+    """Split a WHERE clause on top-level AND (not the AND of BETWEEN)."""
+    parts, current, depth, case_depth, pending_between = [], [], 0, 0, 0
+    for token in tokens:
+        if token.is_punct("("):
+            depth += 1
+        elif token.is_punct(")"):
+            depth -= 1
+        elif token.upper == "CASE":
+            case_depth += 1
+        elif token.upper == "END":
+            case_depth -= 1
+        elif depth == 0 and token.upper == "BETWEEN":
+            pending_between += 1
+        elif depth == 0 and case_depth == 0 and token.upper == "AND":
+            if pending_between:
+                pending_between -= 1
+            else:
+                parts.append(current)
+                current = []
+                continue
+        current.append(token)
+    parts.append(current)
+    return [part for part in parts if part]
+
+
+class _Query:
+    """A partial-aggregate query bound to the loaded tables."""
+
+    def __init__(self, engine: "ColumnarEngine", sql: str, params: Sequence[Any]):
+        self.engine = engine
+        query = parse_select(sql)
+        if query is None or query.has_subquery or query.has_window or query.having \
+                or query.order_by or query.limit or query.distinct:
+            raise Unsupported("not a partial-aggregate query")
+        self.query = query
+        self.sql = query.sql
+        placeholders = [t for t in query.tokens if t.kind == "param"]
+        if len(placeholders) != len(params):
+            raise Unsupported("parameter count mismatch")
+        self.param_tokens = placeholders
+        self.params = {t.start: value for t, value in zip(placeholders, params)}
+        self.aliases: Dict[str, ColumnarTable] = {}
+        self.base, self.joins = self._parse_from(query.from_tokens[1:])
+
+    # -- scope -----------------------------------------------------------------
+
+    def _table(self, name: str) -> ColumnarTable:
+        table = self.engine.tables.get(name.lower())
+        if table is None:
+            raise Unsupported(f"table {name} not loaded")
+        return table
+
+    def _table_ref(self, tokens: List[Token], i: int) -> Tuple[str, int]:
+        if i >= len(tokens) or tokens[i].kind not in ("ident", "qident"):
+            raise Unsupported("expected a table name")
+        if i + 1 < len(tokens) and tokens[i + 1].is_punct("."):
+            raise Unsupported("schema-qualified table")
+        table = self._table(unquote(tokens[i]))
+        alias = unquote(tokens[i]).lower()
+        i += 1
+        if i < len(tokens) and tokens[i].upper == "AS":
+            i += 1
+        if i < len(tokens) and tokens[i].kind in ("ident", "qident") and tokens[i].upper not in JOIN_END \
+                and tokens[i].upper != "WHERE":
+            alias = unquote(tokens[i]).lower()
+            i += 1
+        if alias in self.aliases:
+            raise Unsupported(f"duplicate alias {alias}")
+        self.aliases[alias] = table
+        return alias, i
+
+    def _parse_from(self, tokens: List[Token]):
+        base, i = self._table_ref(tokens, 0)
+        joins = []
+        while i < len(tokens):
+            if tokens[i].upper == "INNER":
+                i += 1
+            if i >= len(tokens) or tokens[i].upper != "JOIN":
+                raise Unsupported(f"join type {tokens[i].text if i < len(tokens) else ''}".strip())
+            alias, i = self._table_ref(tokens, i + 1)
+            if i >= len(tokens) or tokens[i].upper != "ON":
+                raise Unsupported("join without ON")
+            start = i = i + 1
+            while i < len(tokens) and tokens[i].upper not in JOIN_END:
+                i += 1
+            joins.append((alias, tokens[start:i]))
+        return base, joins
+
+    def resolve(self, alias: Optional[str], column: str) -> Tuple[str, str]:
+        if alias is not None:
+            if alias not in self.aliases:
+                raise Unsupported(f"unknown alias {alias}")
+            self.aliases[alias].column(column)
+            return alias, column
+        owners = [a for a, table in self.aliases.items() if column in table.columns]
+        if len(owners) != 1:
+            raise Unsupported(f"{'ambiguous' if owners else 'unknown'} column {column}")
+        self.aliases[owners[0]].column(column)
+        return owners[0], column
+
+    def refs(self, tokens: List[Token]) -> Set[Tuple[str, str]]:
+        return {self.resolve(ref.alias, ref.column) for ref in column_refs(tokens)}
+
+    def parse(self, tokens: List[Token]) -> _Expr:
+        return _Parser(tokens, self.params, self.resolve).parse()
+
+    # -- evaluation ----------------------------------------------------------
+
+    def column_vec(self, ref: Tuple[str, str], frame: Dict[str, np.ndarray]) -> Vec:
+        column = self.aliases[ref[0]].column(ref[1])
+        return _gather(Vec(column.values, column.null, column.dictionary, column.is_int), frame[ref[0]])
+
+    def substitute(self, start: int, end: int) -> Tuple[str, List[Any]]:
+        """SQL text of a span with column references replaced by ``v``, and its parameters."""
+        spans = [(ref.start, ref.end, "v", None) for ref in column_refs(self._tokens_in(start, end))]
+        spans += [(t.start, t.end, "?", self.params[t.start])
+                  for t in self.param_tokens if start <= t.start < end]
+        pieces, params, cursor = [], [], start
+        for s, e, text, value in sorted(spans, key=lambda span: span[0]):
+            pieces.append(self.sql[cursor:s])
+            pieces.append(text)
+            if text == "?":
+                params.append(value)
+            cursor = e
+        pieces.append(self.sql[cursor:end])
+        return "".join(pieces), params
+
+    def distinct_slots(self, start: int, end: int, ref: Tuple[str, str]) -> Vec:
+        expr, params = self.substitute(start, end)
+        return self.engine.distinct_results(self.aliases[ref[0]], ref[1], expr, params)
+
+    def distinct_eval(self, start: int, end: int, ref: Tuple[str, str], frame: Dict[str, np.ndarray]) -> Vec:
+        """Evaluate an expression of one column via SQLite on its distinct values."""
+        table = self.aliases[ref[0]]
+        column = table.column(ref[1])
+        slots = self.distinct_slots(start, end, ref)
+        if column.is_text:
+            # Code -1 (NULL) picks the last slot, which holds the NULL result.
+            return _gather(slots, column.values[frame[ref[0]]])
+        inverse = self.engine.distinct_inverse(table, ref[1])
+        return _gather(slots, inverse[frame[ref[0]]])
+
+    def _tokens_in(self, start: int, end: int) -> List[Token]:
+        return [t for t in self.query.tokens if t.start >= start and t.end <= end]
+
+    def evaluate(self, node: _Expr, frame: Dict[str, np.ndarray], n: int) -> Any:
+        """Vec (numbers/text), a (true, null) mask pair, or a Python constant."""
+        kind = node.kind
+        if kind == "lit":
+            return node.value
+        if kind == "col":
+            return self.column_vec(node.ref, frame)
+        refs = self.refs(self._tokens_in(node.start, node.end))
+        if kind == "func" or (len(refs) == 1 and self._is_text(next(iter(refs)))):
+            if not refs:
+                return self.engine.constant(*self.substitute(node.start, node.end))
+            if len(refs) != 1:
+                raise Unsupported("function of several columns")
+            result = self.distinct_eval(node.start, node.end, next(iter(refs)), frame)
+            if kind in ("cmp", "between", "in", "isnull", "not", "and", "or"):
+                return _truth(result)
+            return result
+        if kind == "neg":
+            value = self.evaluate(node.args[0], frame, n)
+            return _arith("-", 0, value)
+        if kind == "bin":
+            return _arith(node.op, self.evaluate(node.args[0], frame, n),
+                          self.evaluate(node.args[1], frame, n))
+        if kind == "cmp":
+            return _compare(node.op, self.evaluate(node.args[0], frame, n),
+                            self.evaluate(node.args[1], frame, n), n)
+        if kind == "between":
+            value = self.evaluate(node.args[0], frame, n)
+            low = _compare(">=", value, self.evaluate(node.args[1], frame, n), n)
+            high = _compare("<=", value, self.evaluate(node.args[2], frame, n), n)
+            result = _and(low, high)
+            return _not(result) if node.negated else result
+        if kind == "in":
+            value = self.evaluate(node.args[0], frame, n)
+            result = (np.zeros(n, dtype=bool), np.zeros(n, dtype=bool))
+            for item in node.args[1:]:
+                result = _or(result, _compare("=", value, self.evaluate(item, frame, n), n))
+            return _not(result) if node.negated else result
+        if kind == "isnull":
+            value = self.evaluate(node.args[0], frame, n)
+            if not isinstance(value, Vec):
+                raise Unsupported("IS NULL on a constant")
+            result = (~value.valid(), np.zeros(n, dtype=bool))
+            return _not(result) if node.negated else result
+        if kind in ("and", "or"):
+            combine = _and if kind == "and" else _or
+            return combine(_as_mask(self.evaluate(node.args[0], frame, n), n),
+                           _as_mask(self.evaluate(node.args[1], frame, n), n))
+        if kind == "not":
+            return _not(_as_mask(self.evaluate(node.args[0], frame, n), n))
+        raise Unsupported(f"expression {kind}")
+
+    def _is_text(self, ref: Tuple[str, str]) -> bool:
+        return self.aliases[ref[0]].column(ref[1]).is_text
+
+    def predicate(self, tokens: List[Token], frame: Dict[str, np.ndarray], n: int) -> np.ndarray:
+        refs = self.refs(tokens)
+        if len(refs) == 1:
+            ref = next(iter(refs))
+            result = _truth(self.distinct_eval(tokens[0].start, tokens[-1].end, ref, frame)) \
+                if self._is_text(ref) else _as_mask(self.evaluate(self.parse(tokens), frame, n), n)
+        else:
+            result = _as_mask(self.evaluate(self.parse(tokens), frame, n), n)
+        return result[0]
+
+    def value(self, tokens: List[Token], frame: Dict[str, np.ndarray], n: int) -> Vec:
+        result = self.evaluate(self.parse(tokens), frame, n)
+        if isinstance(result, tuple):
+            raise Unsupported("boolean expression as a value")
+        if not isinstance(result, Vec):
+            return _vec_from_values([result] * n)
+        return result
+
+    # -- scan, join, aggregate ---------------------------------------------------
+
+    def base_rows(self, alias: str, conjuncts: List[List[Token]]) -> np.ndarray:
+        """Rows of one table passing its pushed-down filters."""
+        table = self.aliases[alias]
+        rows = np.arange(table.n_rows)
+        for tokens in conjuncts:
+            refs = self.refs(tokens)
+            sort_ref = (alias, table.sorted_by)
+            if refs == {sort_ref} and table.column(table.sorted_by).is_text:
+                rows = self._sorted_range(alias, tokens, rows)
+                continue
+            rows = rows[self.predicate(tokens, {alias: rows}, len(rows))]
+        return rows
+
+    def _sorted_range(self, alias: str, tokens: List[Token], rows: np.ndarray) -> np.ndarray:
+        """A filter on the sort column: contiguous true codes become a binary-searched row slice."""
+        table = self.aliases[alias]
+        column = table.column(table.sorted_by)
+        truth = _truth(self.distinct_slots(tokens[0].start, tokens[-1].end, (alias, table.sorted_by)))[0]
+        true_codes = np.flatnonzero(truth[:-1])
+        contiguous = len(true_codes) == 0 or true_codes[-1] - true_codes[0] + 1 == len(true_codes)
+        if truth[-1] or not contiguous:
+            return rows[truth[column.values[rows]]]
+        if not len(true_codes):
+            return rows[:0]
+        start = np.searchsorted(column.values, true_codes[0], side="left")
+        stop = np.searchsorted(column.values, true_codes[-1], side="right")
+        if len(rows) == table.n_rows:
+            return rows[start:stop]
+        return rows[(rows >= start) & (rows < stop)]
+
+    def join_keys(self, ref: Tuple[str, str], rows: np.ndarray
+                  ) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """(keys, non-NULL mask, dictionary) of a join column for the given rows."""
+        column = self.aliases[ref[0]].column(ref[1])
+        if column.is_text:
+            codes = column.values[rows]
+            return codes.astype(np.int64), codes >= 0, column.dictionary
+        if not column.is_int:
+            raise Unsupported("join on a non-integer column")
+        valid = np.ones(len(rows), dtype=bool) if column.null is None else ~column.null[rows]
+        return column.values[rows].astype(np.int64), valid, None
+
+    def join(self, frame: Dict[str, np.ndarray], alias: str, on: List[Token],
+             rows: np.ndarray) -> Dict[str, np.ndarray]:
+        """Inner equi-join of the frame with the new table's rows (no many-to-many)."""
+        refs = column_refs(on)
+        rest = [t for t in on if not any(r.start <= t.start < r.end for r in refs)]
+        if len(refs) != 2 or len(rest) != 1 or rest[0].text not in ("=", "=="):
+            raise Unsupported("join condition other than a = b")
+        a, b = (self.resolve(r.alias, r.column) for r in refs)
+        if a[0] == alias:
+            a, b = b, a
+        if b[0] != alias or a[0] not in frame:
+            raise Unsupported("join condition does not link the new table")
+
+        # NULL keys never match: drop them from both sides first.
+        left, valid, left_dict = self.join_keys(a, frame[a[0]])
+        frame = {k: v[valid] for k, v in frame.items()}
+        left = left[valid]
+        right, valid, right_dict = self.join_keys(b, rows)
+        rows, right = rows[valid], right[valid]
+        if (left_dict is None) != (right_dict is None):
+            raise Unsupported("join between text and numeric keys")
+        if left_dict is not None and len(right_dict):
+            # Translate the frame's codes into the new table's dictionary (-1: absent).
+            position = np.minimum(np.searchsorted(right_dict, left_dict), len(right_dict) - 1)
+            left = np.where(right_dict[position] == left_dict, position, -1)[left]
+        elif left_dict is not None:
+            left = np.full(len(left), -1, dtype=np.int64)
+
+        order = np.argsort(right, kind="stable")
+        sorted_right = right[order]
+        if not len(sorted_right):
+            return {k: v[:0] for k, v in {**frame, alias: rows}.items()}
+        if np.all(sorted_right[1:] != sorted_right[:-1]):
+            # Many-to-one: each frame row finds at most one new row.
+            position = np.minimum(np.searchsorted(sorted_right, left), len(sorted_right) - 1)
+            match = sorted_right[position] == left
+            joined = {k: v[match] for k, v in frame.items()}
+            joined[alias] = rows[order[position[match]]]
+            return joined
+
+        left_order = np.argsort(left, kind="stable")
+        sorted_left = left[left_order]
+        if not len(sorted_left):
+            return {k: v[:0] for k, v in {**frame, alias: rows}.items()}
+        if np.any(sorted_left[1:] == sorted_left[:-1]):
+            raise Unsupported("many-to-many join")
+        # One-to-many: each new row finds at most one frame row.
+        position = np.minimum(np.searchsorted(sorted_left, right), len(sorted_left) - 1)
+        match = sorted_left[position] == right
+        frame_rows = left_order[position[match]]
+        joined = {k: v[frame_rows] for k, v in frame.items()}
+        joined[alias] = rows[match]
+        return joined
+
+    def run(self) -> Tuple[List[str], List[tuple]]:
+        conjuncts = _split_conjuncts(self.query.where_tokens[1:])
+        pushed: Dict[str, List[List[Token]]] = {alias: [] for alias in self.aliases}
+        remaining, always_false = [], False
+        for tokens in conjuncts:
+            refs = self.refs(tokens)
+            aliases = {alias for alias, _ in refs}
+            if not refs:
+                always_false |= not self.engine.constant(*self.substitute(tokens[0].start, tokens[-1].end))
+            elif len(aliases) == 1:
+                pushed[aliases.pop()].append(tokens)
+            else:
+                remaining.append(tokens)
+
+        frame = {self.base: self.base_rows(self.base, pushed[self.base])}
+        if always_false:
+            frame[self.base] = frame[self.base][:0]
+        for alias, on in self.joins:
+            frame = self.join(frame, alias, on, self.base_rows(alias, pushed[alias]))
+        n = len(frame[self.base])
+        for tokens in remaining:
+            mask = self.predicate(tokens, frame, n)
+            frame = {k: v[mask] for k, v in frame.items()}
+            n = int(mask.sum())
+        return self.aggregate(frame, n)
+
+    def aggregate(self, frame: Dict[str, np.ndarray], n: int) -> Tuple[List[str], List[tuple]]:
+        items = self.query.items
+        names = [item.alias for item in items]
+        keys = [item for item in items if item.alias.startswith("__g")]
+        partials = [item for item in items if item.alias.startswith("__p")]
+
+        if keys and not n:
+            return names, []
+        if keys:
+            key_vecs = [self.value(item.tokens, frame, n) for item in keys]
+            gid, groups = _group_ids([_group_codes(vec) for vec in key_vecs])
+            # Any row of a group carries its key values.
+            first = np.empty(groups, dtype=np.int64)
+            first[gid] = np.arange(n)
+            key_columns = [_decode(_gather(vec, first)) for vec in key_vecs]
+        else:
+            gid = np.zeros(n, dtype=np.int64)
+            groups = 1
+            key_columns = []
+
+        partial_columns = []
+        for item in partials:
+            calls = aggregate_calls(item.tokens)
+            if len(calls) != 1 or calls[0].start != 0 or calls[0].end != len(item.tokens) - 1:
+                raise Unsupported("partial is not a single aggregate")
+            partial_columns.append(self.aggregate_call(calls[0], frame, n, gid, groups))
+
+        columns = key_columns + partial_columns
+        rows = list(zip(*columns)) if columns else []
+        return names, rows
+
+    def aggregate_call(self, call, frame, n, gid, groups) -> List[Any]:
+        if call.filtered:
+            raise Unsupported("aggregate FILTER clause")
+        args = call.args[1:] if call.distinct else call.args
+        if call.func == "COUNT" and len(args) == 1 and args[0].kind == "op" and args[0].text == "*":
+            return np.bincount(gid, minlength=groups).tolist()
+        if len(split_top_level(args)) != 1:
+            raise Unsupported(f"{call.func} with several arguments")
+        vec = self.value(args, frame, n)
+        valid = vec.valid()
+        group = gid[valid]
+        if call.distinct:
+            if call.func != "COUNT":
+                raise Unsupported(f"{call.func}(DISTINCT ...)")
+            pair_ids, pairs = _group_ids([group, _group_codes(vec)[valid]])
+            pair_group = np.empty(pairs, dtype=np.int64)
+            pair_group[pair_ids] = group
+            return np.bincount(pair_group, minlength=groups).tolist()
+        counts = np.bincount(group, minlength=groups)
+        if call.func == "COUNT":
+            return counts.tolist()
+        if call.func in ("MIN", "MAX"):
+            return _min_max(call.func, vec, valid, group, groups, counts)
+        if vec.is_text:
+            raise Unsupported(f"{call.func} over text")
+        values = vec.values[valid]
+        if vec.is_int:
+            totals = np.zeros(groups, dtype=np.int64)
+            np.add.at(totals, group, values.astype(np.int64))
+        else:
+            totals = np.bincount(group, weights=values.astype(np.float64), minlength=groups)
+        if call.func == "TOTAL":
+            return [float(t) for t in totals]
+        if call.func != "SUM":
+            raise Unsupported(f"{call.func} is not a partial aggregate")
+        cast = int if vec.is_int else float
+        return [cast(t) if c else None for t, c in zip(totals, counts)]
+
+
+def _group_codes(vec: Vec) -> np.ndarray:
+    """Codes >= -1 with equal values equal and NULLs as -1."""
+    if vec.is_text:
+        return vec.values.astype(np.int64)
+    valid = vec.valid()
+    if not valid.any():
+        return np.full(len(vec.values), -1, dtype=np.int64)
+    if vec.is_int:
+        values = vec.values.astype(np.int64)
+        low = values[valid].min()
+        if values[valid].max() - low < DENSE_GROUP_LIMIT:
+            return np.where(valid, values - low, -1)
+    _, inverse = np.unique(vec.values, return_inverse=True)
+    inverse = inverse.reshape(-1).astype(np.int64)
+    if vec.null is not None:
+        inverse = np.where(vec.null, -1, inverse)
+    return inverse
+
+
+def _group_ids(codes: List[np.ndarray]) -> Tuple[np.ndarray, int]:
+    """Dense group id per row for combinations of key codes, and the group count."""
+    key = np.zeros(len(codes[0]), dtype=np.int64)
+    span = 1
+    for column in codes:
+        column = column + 1
+        size = int(column.max()) + 1 if len(column) else 1
+        if span * size >= 2**62:
+            _, gid = np.unique(np.stack(codes, axis=1), axis=0, return_inverse=True)
+            gid = gid.reshape(-1)
+            return gid, int(gid.max()) + 1 if len(gid) else 0
+        key = key * size + column
+        span *= size
+    if span <= max(DENSE_GROUP_LIMIT, 4 * len(key)):
+        # Small key space: counting instead of sorting.
+        present = np.bincount(key, minlength=span) > 0
+        dense = np.cumsum(present) - 1
+        return dense[key], int(present.sum())
+    unique, gid = np.unique(key, return_inverse=True)
+    return gid.reshape(-1), len(unique)
+
+
+def _decode(vec: Vec) -> List[Any]:
+    if vec.is_text:
+        return [None if code < 0 else vec.dictionary[code] for code in vec.values]
+    cast = int if vec.is_int else float
+    null = vec.null if vec.null is not None else np.zeros(len(vec.values), dtype=bool)
+    return [None if is_null else cast(value) for value, is_null in zip(vec.values, null)]
+
+
+def _min_max(func: str, vec: Vec, valid: np.ndarray, group: np.ndarray, groups: int,
+             counts: np.ndarray) -> List[Any]:
+    values = vec.values[valid]
+    if vec.is_text or vec.is_int:
+        values = values.astype(np.int64)
+        fill = np.iinfo(np.int64).max if func == "MIN" else np.iinfo(np.int64).min
+        result = np.full(groups, fill, dtype=np.int64)
+    else:
+        result = np.full(groups, math.inf if func == "MIN" else -math.inf)
+    (np.minimum if func == "MIN" else np.maximum).at(result, group, values)
+    if vec.is_text:
+        return [vec.dictionary[r] if c else None for r, c in zip(result, counts)]
+    cast = int if vec.is_int else float
+    return [cast(r) if c else None for r, c in zip(result, counts)]
+
+
+def _numeric(value: Any, n: int) -> Tuple[np.ndarray, np.ndarray, bool]:
+    """(values, null mask, is_int) for a numeric Vec or constant."""
+    if isinstance(value, Vec):
+        if value.is_text:
+            raise Unsupported("arithmetic on text")
+        null = value.null if value.null is not None else np.zeros(len(value.values), dtype=bool)
+        return value.values, null, value.is_int
+    if value is None:
+        return np.zeros(n), np.ones(n, dtype=bool), False
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise Unsupported("arithmetic on a non-numeric constant")
+    return np.full(n, value), np.zeros(n, dtype=bool), isinstance(value, int)
+
+
+def _arith(op: str, left: Any, right: Any) -> Any:
+    if not isinstance(left, Vec) and not isinstance(right, Vec):
+        raise Unsupported("constant arithmetic")
+    n = len(left.values) if isinstance(left, Vec) else len(right.values)
+    a, a_null, a_int = _numeric(left, n)
+    b, b_null, b_int = _numeric(right, n)
+    null = a_null | b_null
+    both_int = a_int and b_int
+    if both_int:
+        a, b = a.astype(np.int64), b.astype(np.int64)
+    else:
+        a, b = a.astype(np.float64), b.astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if op == "+":
+            values = a + b
+        elif op == "-":
+            values = a - b
+        elif op == "*":
+            values = a * b
+        elif op == "/":
+            zero = b == 0
+            null = null | zero
+            safe = np.where(zero, 1, b)
+            if both_int:
+                # SQLite integer division truncates toward zero.
+                values = np.abs(a) // np.abs(safe) * np.sign(a) * np.sign(safe)
+            else:
+                values = a / safe
+        elif op == "%" and both_int:
+            zero = b == 0
+            null = null | zero
+            values = np.fmod(a, np.where(zero, 1, b))
+        else:
+            raise Unsupported(f"operator {op}")
+    return Vec(values, null if null.any() else None, is_int=both_int)
+
+
+def _compare(op: str, left: Any, right: Any, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    if isinstance(left, Vec) and left.is_text or isinstance(right, Vec) and right.is_text:
+        raise Unsupported("text comparison across columns")
+    a, a_null, _ = _numeric(left, n)
+    b, b_null, _ = _numeric(right, n)
+    if op in ("=", "=="):
+        result = a == b
+    elif op in ("!=", "<>"):
+        result = a != b
+    elif op == "<":
+        result = a < b
+    elif op == "<=":
+        result = a <= b
+    elif op == ">":
+        result = a > b
+    else:
+        result = a >= b
+    null = a_null | b_null
+    return result & ~null, null
+
+
+def _truth(vec: Vec) -> Tuple[np.ndarray, np.ndarray]:
+    """SQLite truthiness of a value vector as (true, null) masks."""
+    if vec.is_text:
+        raise Unsupported("text used as a condition")
+    null = vec.null if vec.null is not None else np.zeros(len(vec.values), dtype=bool)
+    return (vec.values != 0) & ~null, null
+
+
+def _as_mask(value: Any, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    if isinstance(value, tuple):
+        return value
+    if isinstance(value, Vec):
+        return _truth(value)
+    if value is None:
+        return np.zeros(n, dtype=bool), np.ones(n, dtype=bool)
+    return np.full(n, bool(value)), np.zeros(n, dtype=bool)
+
+
+def _and(a, b):
+    true = a[0] & b[0]
+    false = (~a[0] & ~a[1]) | (~b[0] & ~b[1])
+    return true, ~true & ~false
+
+
+def _or(a, b):
+    true = a[0] | b[0]
+    false = (~a[0] & ~a[1]) & (~b[0] & ~b[1])
+    return true, ~true & ~false
+
+
+def _not(a):
+    return ~a[0] & ~a[1], a[1]
+
+
+class ColumnarEngine:
+    """Tables of one SQLite database loaded into columnar arrays."""
+
+    def __init__(self, db_path: str, tables: Sequence[str] = CORE_TABLES):
+        self.db_path = db_path
+        self.table_names = tuple(tables)
+        self.tables: Dict[str, ColumnarTable] = {}
+        self.load_ms = 0.0
+        self.version: Optional[str] = None
+        self._lock = threading.Lock()
+        self._distinct_conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self._distinct_tables: Dict[Tuple[str, str], str] = {}
+        self._inverse: Dict[Tuple[str, str], np.ndarray] = {}
+        self._distinct_cache: "OrderedDict[Tuple[Any, ...], Vec]" = OrderedDict()
+
+    def load(self, version: str = None):
+        """(Re)load every table; Orders ends up sorted by OrderDate."""
+        started = time.perf_counter()
+        conn = sqlite3.connect(Path(self.db_path).resolve().as_uri() + "?mode=ro", uri=True)
+        try:
+            existing = {row[0].lower(): row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")}
+            tables = {}
+            for name in self.table_names:
+                if name.lower() not in existing:
+                    continue
+                name = existing[name.lower()]
+                quoted = name.replace('"', '""')
+                decltypes = {row[1].lower(): row[2] for row in conn.execute(f'PRAGMA table_info("{quoted}")')}
+                cursor = conn.execute(f'SELECT * FROM "{quoted}"')
+                headers = [d[0] for d in cursor.description]
+                rows = cursor.fetchall()
+                values = list(zip(*rows)) if rows else [()] * len(headers)
+                columns = {h.lower(): _encode(h, v) for h, v in zip(headers, values)}
+                for key, column in columns.items():
+                    if column is not None:
+                        column.decltype = decltypes.get(key, "")
+                table = ColumnarTable(name, columns, len(rows))
+                sort_key = SORT_KEYS.get(name.lower())
+                if sort_key and columns.get(sort_key) is not None:
+                    order = np.argsort(columns[sort_key].values, kind="stable")
+                    for column in columns.values():
+                        if column is not None:
+                            column.values = column.values[order]
+                            if column.null is not None:
+                                column.null = column.null[order]
+                    table.sorted_by = sort_key
+                tables[name.lower()] = table
+        finally:
+            conn.close()
+        with self._lock:
+            self.tables = tables
+            self.version = version
+            for name in self._distinct_tables.values():
+                self._distinct_conn.execute(f"DROP TABLE IF EXISTS {name}")
+            self._distinct_tables.clear()
+            self._inverse.clear()
+            self._distinct_cache.clear()
+        self.load_ms = (time.perf_counter() - started) * 1000
+
+    def _distinct_values(self, table: ColumnarTable, key: str) -> List[Any]:
+        """Distinct values of a column in slot order (NULL is the last slot; first for text)."""
+        column = table.column(key)
+        if column.is_text:
+            return [None] + list(column.dictionary)
+        valid = column.values if column.null is None else column.values[~column.null]
+        distinct = np.unique(valid)
+        if len(distinct) > DISTINCT_LIMIT:
+            raise Unsupported(f"{table.name}.{key} has too many distinct values")
+        cast = int if column.is_int else float
+        return [cast(v) for v in distinct] + [None]
+
+    def distinct_inverse(self, table: ColumnarTable, key: str) -> np.ndarray:
+        """Per row, the slot of its value in the numeric column's distinct values."""
+        with self._lock:
+            inverse = self._inverse.get((table.name, key))
+        if inverse is None:
+            column = table.column(key)
+            distinct = np.unique(column.values if column.null is None else column.values[~column.null])
+            inverse = np.searchsorted(distinct, column.values)
+            if column.null is not None:
+                inverse = np.where(column.null, len(distinct), inverse)
+            with self._lock:
+                self._inverse[(table.name, key)] = inverse
+        return inverse
+
+    def distinct_results(self, table: ColumnarTable, key: str, expr: str, params: List[Any]) -> Vec:
+        """SQLite's value of expr (over column ``v``) for each distinct value slot.
+
+        Text slots are shifted by one so code -1 (NULL) indexes slot 0.
+        """
+        cache_key = (table.name, key, expr, tuple(params))
+        with self._lock:
+            cached = self._distinct_cache.get(cache_key)
+            if cached is not None:
+                self._distinct_cache.move_to_end(cache_key)
+                return cached
+            name = self._distinct_tables.get((table.name, key))
+            try:
+                if name is None:
+                    name = f"d{len(self._distinct_tables)}"
+                    decltype = "".join(c for c in table.column(key).decltype if c.isalnum() or c in " (),")
+                    self._distinct_conn.execute(f"CREATE TABLE {name} (v {decltype})")
+                    self._distinct_conn.executemany(f"INSERT INTO {name} (v) VALUES (?)",
+                                                    [(v,) for v in self._distinct_values(table, key)])
+                    self._distinct_tables[(table.name, key)] = name
+                values = [row[0] for row in self._distinct_conn.execute(
+                    f"SELECT {expr} FROM {name} ORDER BY rowid", params)]
+            except sqlite3.Error as e:
+                raise Unsupported(f"cannot evaluate {expr!r}: {e}")
+        vec = _vec_from_values(values)
+        if table.column(key).is_text:
+            # Slot 0 holds NULL; rotate so index -1 (code for NULL) reaches it.
+            order = np.roll(np.arange(len(values)), -1)
+            vec = _gather(vec, order)
+        with self._lock:
+            self._distinct_cache[cache_key] = vec
+            while len(self._distinct_cache) > DISTINCT_CACHE_SIZE:
+                self._distinct_cache.popitem(last=False)
+        return vec
+
+    def constant(self, expr: str, params: List[Any]) -> Any:
+        with self._lock:
+            try:
+                return self._distinct_conn.execute(f"SELECT {expr}", params).fetchone()[0]
+            except sqlite3.Error as e:
+                raise Unsupported(f"cannot evaluate {expr!r}: {e}")
+
+    def partials(self, sql: str, params: Sequence[Any]) -> Tuple[List[str], List[tuple]]:
+        """Evaluate a partial-aggregate query (group keys + simple aggregates)."""
+        return _Query(self, sql, list(params or ())).run()
+
+
+class ColumnarSQLiteTool(SQLiteTool):
+    """SQLiteTool answering supported aggregate queries from columnar arrays.
+
+    Unsupported queries fall back to SQLite. With ``cross_check`` every
+    columnar answer is compared with SQLite's; on a mismatch SQLite's
+    result is returned and the query is recorded in ``mismatches``.
+    """
+
+    def __init__(self, db_path: str, pool_size: int = 4, cross_check: bool = False,
+                 tables: Sequence[str] = CORE_TABLES):
+        super().__init__(db_path, pool_size)
+        self.engine = ColumnarEngine(db_path, tables)
+        self.cross_check = cross_check
+        self.columnar_queries = 0
+        self.fallbacks: Counter = Counter()
+        self.mismatches: List[Dict[str, Any]] = []
+        self.checked = 0
+        self.columnar_ms = 0.0
+        self._stats_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def warm_up(self):
+        """Load the tables (and date indexes) now instead of on the first query."""
+        super().warm_up()
+        self._ensure_loaded()
+
+    def _ensure_loaded(self):
+        version = self.get_data_version()
+        if self.engine.version != version:
+            with self._load_lock:
+                if self.engine.version != version:
+                    self.engine.load(version)
+
+    def execute_columnar(self, query: str, params: Optional[Sequence[Any]] = None
+                         ) -> Optional[QueryResult]:
+        """The columnar result, or None (reason counted) when unsupported."""
+        plan = plan_query(query, params, single_source=True)
+        if plan.kind != "aggregate":
+            self._fallback(plan.reason or "not an aggregate query")
+            return None
+        started = time.perf_counter()
+        try:
+            self._ensure_loaded()
+            columns, rows = self.engine.partials(plan.shard_sql, plan.shard_params)
+        except Unsupported as e:
+            self._fallback(str(e))
+            return None
+        names = plan.names
+        if any(name is None for name in names):
+            names = output_names(super(), query, params, names)
+        result = merge_aggregate(plan, [(True, rows, columns, "")], names)
+        with self._stats_lock:
+            self.columnar_queries += 1
+            self.columnar_ms += (time.perf_counter() - started) * 1000
+        return result
+
+    def _fallback(self, reason: str):
+        with self._stats_lock:
+            self.fallbacks[reason] += 1
+
+    def _checked(self, query: str, params, result: QueryResult, expected: QueryResult) -> QueryResult:
+        with self._stats_lock:
+            self.checked += 1
+        if results_match(result, expected):
+            return result
+        with self._stats_lock:
+            self.mismatches.append({"sql": query, "params": list(params or ()),
+                                    "columnar": result[1][:5], "sqlite": expected[1][:5]})
+            del self.mismatches[:-50]
+        return expected
+
+    def execute_readonly(self, query: str, params: Optional[Sequence[Any]] = None,
+                         timeout_s: Optional[float] = None) -> QueryResult:
+        result = self.execute_columnar(query, params)
+        if result is None:
+            return super().execute_readonly(query, params, timeout_s)
+        if self.cross_check:
+            return self._checked(query, params, result, super().execute_readonly(query, params, timeout_s))
+        return result
+
+    def execute_query(self, query: str, params: Optional[Sequence[Any]] = None) -> QueryResult:
+        result = self.execute_columnar(query, params)
+        if result is None:
+            return super().execute_query(query, params)
+        if self.cross_check:
+            return self._checked(query, params, result, super().execute_query(query, params))
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._stats_lock:
+            lookups = self.columnar_queries + sum(self.fallbacks.values())
+            return {
+                **stats,
+                "columnar": self.columnar_queries,
+                "fallbacks": dict(self.fallbacks),
+                "coverage": self.columnar_queries / lookups if lookups else 0.0,
+                "columnar_ms": round(self.columnar_ms, 3),
+                "load_ms": round(self.engine.load_ms, 3),
+                "cross_checked": self.checked,
+                "mismatches": len(self.mismatches)
+            }
+
+
+def results_match(a: QueryResult, b: QueryResult, rel_tol: float = 1e-9) -> bool:
+    """Same success, columns and rows, with floats compared approximately."""
+    if a[0] != b[0] or a[2] != b[2] or len(a[1]) != len(b[1]):
+        return False
+    for row_a, row_b in zip(a[1], b[1]):
+        if len(row_a) != len(row_b):
+            return False
+        for x, y in zip(row_a, row_b):
+            if isinstance(x, float) or isinstance(y, float):
+                if x is None or y is None or not math.isclose(x, y, rel_tol=rel_tol, abs_tol=1e-9):
+                    return False
+            elif x != y:
+                return False
+    return True
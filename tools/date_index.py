@@ -0,0 +1,310 @@
+"""Sorted date -> primary key indexes that make ``DATE(col) BETWEEN`` sargable.
+
+Wrapping a column in DATE() stops SQLite from using any index on it, and
+the KPI templates filter every campaign window that way. A
+``DateRangeIndex`` keeps one column's DATE() values sorted together with
+the table's INTEGER PRIMARY KEY, so a date range is two binary searches
+away from its keys. ``rewrite_date_ranges`` replaces top-level
+``DATE(col) BETWEEN a AND b`` conjuncts of WHERE and ON with:
+
+- ``key BETWEEN first AND last`` when the matching keys are contiguous;
+- ``key IN (SELECT value FROM json_each('[...]'))`` when they are a small
+  part of the table, so SQLite probes the primary key instead of scanning;
+- ``col >= a AND col < b + 1 day`` when every value is ISO-8601 text, so
+  an index on the raw column applies;
+
+and leaves the predicate alone otherwise. Every form selects exactly the
+rows the original predicate did.
+"""
+import json
+import re
+import sqlite3
+import time
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from tools.sql_parsing import Token, tokenize, unquote
+
+
+# Key lists are inlined only up to this many keys and this share of the table.
+MAX_KEY_LIST = 100000
+MAX_KEY_FRACTION = 0.25
+# Tokens that may follow a rewritable conjunct at depth 0.
+FOLLOWERS = frozenset((
+    "AND", "OR", "GROUP", "ORDER", "LIMIT", "HAVING", "WINDOW", "WHERE", "JOIN", "INNER", "LEFT",
+    "RIGHT", "FULL", "CROSS", "NATURAL", "UNION", "INTERSECT", "EXCEPT"
+))
+CLAUSES = frozenset(("SELECT", "FROM", "JOIN", "ON", "USING", "WHERE", "GROUP", "HAVING",
+                     "WINDOW", "ORDER", "LIMIT"))
+NOT_ALIASES = FOLLOWERS | CLAUSES | {"AS", "INDEXED", "NOT"}
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_PLAIN_IDENT = re.compile(r"[A-Za-z_]\w*")
+
+
+def _ident(name: str) -> str:
+    return name if _PLAIN_IDENT.fullmatch(name) else '"' + name.replace('"', '""') + '"'
+
+
+def _iso_date(text: str) -> Optional[date]:
+    if not _ISO_DATE.fullmatch(text):
+        return None
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        return None
+
+
+@dataclass
+class DateRangeIndex:
+    """One column's DATE() values in sorted order, with the matching primary keys."""
+    table: str
+    column: str
+    key: Optional[str]
+    dates: List[str]
+    keys: List[int]
+    all_keys: List[int]
+    iso_text: bool
+    json_each: bool = True
+    build_ms: float = 0.0
+
+    @classmethod
+    def build(cls, conn, table: str, column: str) -> Optional["DateRangeIndex"]:
+        """Index table.column, or None when the table or column does not exist."""
+        started = time.perf_counter()
+        info = conn.execute(f"PRAGMA table_info({_ident(table)})").fetchall()
+        names = {row[1].lower(): row[1] for row in info}
+        if column.lower() not in names:
+            return None
+        column = names[column.lower()]
+        primary = [row for row in info if row[5]]
+        key = primary[0][1] if len(primary) == 1 and primary[0][2].upper() == "INTEGER" else None
+
+        source, value = _ident(table), _ident(column)
+        key_expr = _ident(key) if key else "NULL"
+        rows = conn.execute(
+            f"SELECT DATE({value}) AS d, {key_expr} FROM {source} WHERE d IS NOT NULL ORDER BY 1, 2"
+        ).fetchall()
+        all_keys = [r[0] for r in conn.execute(f"SELECT {key_expr} FROM {source} ORDER BY 1")] if key else []
+        non_iso = conn.execute(
+            f"SELECT COUNT(*) FROM {source} WHERE {value} IS NOT NULL AND NOT ("
+            f"typeof({value}) = 'text' AND DATE({value}) IS NOT NULL AND DATE({value}) = substr({value}, 1, 10))"
+        ).fetchone()[0]
+        try:
+            conn.execute("SELECT value FROM json_each('[1]')").fetchall()
+            json_each = True
+        except sqlite3.OperationalError:
+            json_each = False
+        return cls(table, column, key, [r[0] for r in rows], [r[1] for r in rows], all_keys,
+                   non_iso == 0, json_each, round((time.perf_counter() - started) * 1000, 3))
+
+    def keys_between(self, low: str, high: str) -> List[int]:
+        return self.keys[bisect_left(self.dates, low):bisect_right(self.dates, high)]
+
+    def predicate(self, column_ref: str, key_ref: str, low: Any, high: Any) -> Tuple[Optional[str], str]:
+        """(kind, SQL) equivalent to DATE(column_ref) BETWEEN low AND high, or (None, "")."""
+        if not isinstance(low, str) or not isinstance(high, str):
+            return None, ""
+        if self.key is not None:
+            keys = self.keys_between(low, high)
+            if not keys:
+                return "empty", "0"
+            first, last = min(keys), max(keys)
+            if bisect_right(self.all_keys, last) - bisect_left(self.all_keys, first) == len(keys):
+                return "key_range", f"{key_ref} BETWEEN {first} AND {last}"
+            if self.json_each and len(keys) <= min(MAX_KEY_LIST, MAX_KEY_FRACTION * len(self.all_keys)):
+                listed = json.dumps(sorted(keys), separators=(",", ":"))
+                return "key_list", f"{key_ref} IN (SELECT value FROM json_each('{listed}'))"
+        low_date, high_date = _iso_date(low), _iso_date(high)
+        if self.iso_text and low_date and high_date and high_date < date.max:
+            # DATE(col) is col's first 10 characters, so comparing the raw text is equivalent.
+            after = (high_date + timedelta(days=1)).isoformat()
+            return "column_range", f"{column_ref} >= '{low}' AND {column_ref} < '{after}'"
+        return None, ""
+
+    def stats(self) -> Dict[str, Any]:
+        return {"rows": len(self.dates), "key": self.key, "iso_text": self.iso_text,
+                "build_ms": self.build_ms}
+
+
+def cte_names(tokens: List[Token]) -> Set[str]:
+    """Lower-cased names a leading WITH clause defines."""
+    names: Set[str] = set()
+    if not tokens or tokens[0].upper != "WITH":
+        return names
+    depth = 0
+    for i, token in enumerate(tokens[1:], 1):
+        if token.is_punct("("):
+            depth += 1
+        elif token.is_punct(")"):
+            depth -= 1
+        elif depth == 0 and token.upper in CLAUSES:
+            break
+        elif depth == 0 and token.kind in ("ident", "qident") and \
+                (tokens[i - 1].upper in ("WITH", "RECURSIVE") or tokens[i - 1].is_punct(",")):
+            names.add(unquote(token).lower())
+    return names
+
+
+def table_aliases(tokens: List[Token]) -> Dict[str, Optional[str]]:
+    """Qualifier (lower-cased) -> table for table references at depth 0; None if ambiguous.
+
+    A reference to a WITH-clause table maps to None as well: its rows are
+    not the base table's, so the base table's index does not apply.
+    """
+    aliases: Dict[str, Optional[str]] = {}
+    ctes = cte_names(tokens)
+    depth, clause = 0, ""
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.is_punct("("):
+            depth += 1
+        elif token.is_punct(")"):
+            depth -= 1
+        elif depth == 0 and token.upper in CLAUSES:
+            clause = token.upper
+        starts_ref = depth == 0 and (token.upper in ("FROM", "JOIN") or (token.is_punct(",") and clause == "FROM"))
+        i += 1
+        if not starts_ref or i >= len(tokens) or tokens[i].kind not in ("ident", "qident"):
+            continue
+        qualified = i + 2 < len(tokens) and tokens[i + 1].is_punct(".")
+        if qualified:
+            i += 2
+        table = unquote(tokens[i])
+        names = [table]
+        i += 1
+        if i < len(tokens) and tokens[i].upper == "AS":
+            i += 1
+        if i < len(tokens) and tokens[i].kind in ("ident", "qident") and tokens[i].upper not in NOT_ALIASES:
+            names = [unquote(tokens[i])]
+            i += 1
+        if not qualified and table.lower() in ctes:
+            table = None
+        for name in names:
+            previous = aliases.get(name.lower(), table)
+            aliases[name.lower()] = table if previous == table else None
+    return aliases
+
+
+def rewrite_date_ranges(sql: str, params: Optional[Sequence[Any]],
+                        index_for: Callable[[str, str], Optional[DateRangeIndex]]
+                        ) -> Tuple[str, Optional[Sequence[Any]], List[str]]:
+    """Rewrite ``DATE(col) BETWEEN a AND b`` conjuncts; returns (sql, params, rewrite kinds).
+
+    Only conjuncts at parenthesis depth 0 of a WHERE or ON clause are
+    rewritten, where a NULL and a false predicate filter alike. Bounds may
+    be string literals or ``?`` parameters; the rewritten predicates inline
+    their values and the consumed parameters are dropped.
+    """
+    if "DATE" not in sql.upper() or isinstance(params, dict):
+        return sql, params, []
+    tokens = tokenize(sql)
+    placeholders = [i for i, t in enumerate(tokens) if t.kind == "param"]
+    if any(tokens[i].text != "?" for i in placeholders) or len(placeholders) != len(params or ()):
+        return sql, params, []
+    position = {token_index: n for n, token_index in enumerate(placeholders)}
+    aliases = table_aliases(tokens)
+    table_refs = {table for table in aliases.values() if table}
+
+    def bound(j: int) -> Tuple[bool, Any]:
+        if tokens[j].kind == "string":
+            return True, tokens[j].text[1:-1].replace("''", "'")
+        if tokens[j].kind == "param":
+            return True, params[position[j]]
+        return False, None
+
+    edits, consumed, kinds = [], set(), []
+    depth, clause = 0, ""
+    for i, token in enumerate(tokens):
+        if token.is_punct("(") or token.is_punct(")"):
+            depth += 1 if token.text == "(" else -1
+            continue
+        if depth:
+            continue
+        if token.upper in CLAUSES:
+            clause = token.upper
+            continue
+        if token.upper != "DATE" or clause not in ("WHERE", "ON"):
+            continue
+        previous = tokens[i - 1] if i else None
+        if previous is None or previous.upper not in ("WHERE", "AND", "OR", "ON"):
+            continue
+        if previous.upper == "AND" and _closes_between(tokens, i - 1):
+            continue
+        match = _match_date_between(tokens, i)
+        if match is None:
+            continue
+        qualifier, column, column_start, column_end, low_index, high_index = match
+        following = tokens[high_index + 1] if high_index + 1 < len(tokens) else None
+        if following is not None and following.upper not in FOLLOWERS and not following.is_punct(";"):
+            continue
+        if qualifier is not None:
+            table = aliases.get(unquote(qualifier).lower())
+        else:
+            table = next(iter(table_refs)) if len(table_refs) == 1 and len(aliases) == 1 else None
+        (low_ok, low), (high_ok, high) = bound(low_index), bound(high_index)
+        if not (table and low_ok and high_ok):
+            continue
+        index = index_for(table, column)
+        if index is None:
+            continue
+        key_name = _ident(index.key or "")
+        key_ref = f"{qualifier.text}.{key_name}" if qualifier is not None else key_name
+        kind, replacement = index.predicate(sql[column_start:column_end], key_ref, low, high)
+        if kind is None:
+            continue
+        edits.append((token.start, tokens[high_index].end, f"({replacement})"))
+        consumed.update(position[j] for j in (low_index, high_index) if j in position)
+        kinds.append(kind)
+
+    if not edits:
+        return sql, params, []
+    pieces, cursor = [], 0
+    for start, stop, text in edits:
+        pieces.append(sql[cursor:start])
+        pieces.append(text)
+        cursor = stop
+    pieces.append(sql[cursor:])
+    kept = [value for n, value in enumerate(params or ()) if n not in consumed]
+    return "".join(pieces), kept if params is not None else None, kinds
+
+
+def _closes_between(tokens: List[Token], and_index: int) -> bool:
+    """Whether the AND at and_index is the second half of a BETWEEN at the same depth."""
+    depth = 0
+    for j in range(and_index - 1, -1, -1):
+        token = tokens[j]
+        if token.is_punct(")"):
+            depth += 1
+        elif token.is_punct("("):
+            if depth == 0:
+                return False
+            depth -= 1
+        elif depth == 0 and token.upper in ("AND", "OR", "WHERE", "ON"):
+            return False
+        elif depth == 0 and token.upper == "BETWEEN":
+            return True
+    return False
+
+
+def _match_date_between(tokens: List[Token], i: int):
+    """DATE ( [q .] col ) BETWEEN low AND high starting at i, or None."""
+    j = i + 1
+    if j >= len(tokens) or not tokens[j].is_punct("("):
+        return None
+    j += 1
+    qualifier = None
+    if j + 2 < len(tokens) and tokens[j].kind in ("ident", "qident") and tokens[j + 1].is_punct("."):
+        qualifier = tokens[j]
+        j += 2
+    if j >= len(tokens) or tokens[j].kind not in ("ident", "qident"):
+        return None
+    column_token = tokens[j]
+    j += 1
+    if j + 4 >= len(tokens) or not (tokens[j].is_punct(")") and tokens[j + 1].upper == "BETWEEN"
+                                    and tokens[j + 3].upper == "AND"):
+        return None
+    return (qualifier, unquote(column_token), (qualifier or column_token).start, column_token.end,
+            j + 2, j + 4)
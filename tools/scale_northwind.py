@@ -0,0 +1,265 @@
+"""Scale a Northwind database by replicating customers, products and orders.
+
+Each replica ``k`` (1 .. factor-1) copies every Customer, Product, Order
+and Order Details row with remapped keys, so foreign keys stay inside the
+replica and category mix and per-customer behaviour are unchanged. Order
+dates keep their original values unless ``--jitter-days`` is given, in
+which case each order moves by a random offset clamped to its segment of
+the marketing calendar: orders inside a campaign window stay inside it
+and orders outside never drift into one.
+
+Usage:
+    python -m tools.scale_northwind --src data/northwind.sqlite \\
+        --out data/northwind_x100.sqlite --factor 100
+"""
+import random
+import shutil
+import sqlite3
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import click
+from rich.console import Console
+
+from agent.question_signature import QuestionNormalizer
+
+console = Console()
+
+SCALED_TABLES = ("Customers", "Products", "Orders", "Order Details")
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+
+def _id_mapper(values: Sequence[Any]) -> Callable[[Any, int], Any]:
+    """Map an original key to its replica-k key (integer offset or text suffix)."""
+    numeric = [v for v in values if isinstance(v, int)]
+    if values and len(numeric) == len(values):
+        stride = max(numeric)
+        return lambda value, k: value + k * stride
+    return lambda value, k: value if value is None else f"{value}-{k}"
+
+
+def date_segments(windows: Sequence[Tuple[str, str]], first: date, last: date) -> List[Tuple[date, date]]:
+    """Split [first, last] into campaign windows and the gaps between them."""
+    bounds = sorted((date.fromisoformat(s), date.fromisoformat(e)) for s, e in windows)
+    segments, cursor = [], first
+    for start, end in bounds:
+        if end < first or start > last:
+            continue
+        if start > cursor:
+            segments.append((cursor, start - timedelta(days=1)))
+        segments.append((max(start, first), min(end, last)))
+        cursor = end + timedelta(days=1)
+    if cursor <= last:
+        segments.append((cursor, last))
+    return segments
+
+
+def _segment_for(segments: List[Tuple[date, date]], day: date) -> Tuple[date, date]:
+    for start, end in segments:
+        if start <= day <= end:
+            return start, end
+    return day, day
+
+
+def _shift(value: Any, delta: timedelta) -> Any:
+    """Shift an ISO date/datetime string by delta, keeping any time suffix."""
+    if not delta or not isinstance(value, str) or len(value) < 10:
+        return value
+    try:
+        day = date.fromisoformat(value[:10])
+    except ValueError:
+        return value
+    return (day + delta).isoformat() + value[10:]
+
+
+class NorthwindScaler:
+    """Stream replicated rows from a source database into a copy of it."""
+
+    def __init__(self, src: str, out: str, docs_dir: str = "docs", jitter_days: int = 0,
+                 seed: int = 42, batch_size: int = 50000):
+        self.src = Path(src)
+        self.out = Path(out)
+        self.docs_dir = docs_dir
+        self.jitter_days = jitter_days
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+
+    def scale(self, factor: int) -> Dict[str, int]:
+        """Write ``out`` with factor times the rows of each scaled table."""
+        if factor < 1:
+            raise ValueError("factor must be >= 1")
+        self.out.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(self.src, self.out)
+
+        conn = sqlite3.connect(str(self.out), isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=MEMORY")
+            conn.execute("PRAGMA synchronous=OFF")
+            source = {
+                table: (_columns(conn, table), conn.execute(f'SELECT * FROM "{table}"').fetchall())
+                for table in SCALED_TABLES
+            }
+            indexes = conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+                f"AND tbl_name IN ({','.join('?' * len(SCALED_TABLES))})",
+                SCALED_TABLES
+            ).fetchall()
+
+            conn.execute("BEGIN")
+            for name, _ in indexes:
+                conn.execute(f'DROP INDEX "{name}"')
+            for table, rows in self._replicas(source, factor, conn):
+                columns = source[table][0]
+                placeholders = ", ".join("?" * len(columns))
+                conn.executemany(f'INSERT INTO "{table}" VALUES ({placeholders})', rows)
+            for _, sql in indexes:
+                conn.execute(sql)
+            conn.execute("COMMIT")
+
+            return {
+                table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                for table in SCALED_TABLES
+            }
+        finally:
+            conn.close()
+
+    def _replicas(self, source: Dict[str, Tuple[List[str], List[tuple]]], factor: int,
+                  conn: sqlite3.Connection) -> Iterator[Tuple[str, Iterator[tuple]]]:
+        cust_cols, customers = source["Customers"]
+        prod_cols, products = source["Products"]
+        order_cols, orders = source["Orders"]
+        detail_cols, details = source["Order Details"]
+
+        cust_id = _id_mapper([row[0] for row in customers])
+        prod_id = _id_mapper([row[0] for row in products])
+        order_id = _id_mapper([row[0] for row in orders])
+
+        cust_key = cust_cols.index("CustomerID")
+        prod_key = prod_cols.index("ProductID")
+        order_key = order_cols.index("OrderID")
+        order_cust = order_cols.index("CustomerID")
+        detail_order = detail_cols.index("OrderID")
+        detail_prod = detail_cols.index("ProductID")
+        date_cols = [i for i, name in enumerate(order_cols) if name.endswith("Date")]
+        name_cols = {i for i, name in enumerate(cust_cols) if name == "CompanyName"}
+        prod_name_cols = {i for i, name in enumerate(prod_cols) if name == "ProductName"}
+
+        offsets = self._date_offsets(conn, orders, order_cols, factor)
+
+        def remap(rows, key_updates, suffix_cols, k):
+            for row in rows:
+                row = list(row)
+                for idx, mapper in key_updates:
+                    row[idx] = mapper(row[idx], k)
+                for idx in suffix_cols:
+                    if isinstance(row[idx], str):
+                        row[idx] = f"{row[idx]} #{k}"
+                yield tuple(row)
+
+        def replicated_orders():
+            for k in range(1, factor):
+                for pos, row in enumerate(orders):
+                    row = list(row)
+                    row[order_key] = order_id(row[order_key], k)
+                    row[order_cust] = cust_id(row[order_cust], k)
+                    delta = offsets[k][pos] if offsets else None
+                    for idx in date_cols:
+                        row[idx] = _shift(row[idx], delta)
+                    yield tuple(row)
+
+        yield "Customers", (row for k in range(1, factor)
+                            for row in remap(customers, [(cust_key, cust_id)], name_cols, k))
+        yield "Products", (row for k in range(1, factor)
+                           for row in remap(products, [(prod_key, prod_id)], prod_name_cols, k))
+        yield "Orders", replicated_orders()
+        yield "Order Details", (row for k in range(1, factor)
+                                for row in remap(details, [(detail_order, order_id),
+                                                           (detail_prod, prod_id)], (), k))
+
+    def _date_offsets(self, conn: sqlite3.Connection, orders: List[tuple], order_cols: List[str],
+                      factor: int) -> Optional[Dict[int, List[timedelta]]]:
+        """Per-replica date shifts, clamped to each order's calendar segment."""
+        if not self.jitter_days or "OrderDate" not in order_cols:
+            return None
+        date_idx = order_cols.index("OrderDate")
+        first, last = conn.execute("SELECT MIN(DATE(OrderDate)), MAX(DATE(OrderDate)) FROM Orders").fetchone()
+        windows = QuestionNormalizer(self.docs_dir).campaigns.values()
+        segments = date_segments(list(windows), date.fromisoformat(first), date.fromisoformat(last))
+
+        days = [date.fromisoformat(str(row[date_idx])[:10]) if row[date_idx] else None for row in orders]
+        bounds = [_segment_for(segments, day) if day else None for day in days]
+        offsets = {}
+        for k in range(1, factor):
+            shifts = []
+            for day, bound in zip(days, bounds):
+                if day is None:
+                    shifts.append(None)
+                    continue
+                lo = max(-self.jitter_days, (bound[0] - day).days)
+                hi = min(self.jitter_days, (bound[1] - day).days)
+                shifts.append(timedelta(days=self.rng.randint(lo, hi)))
+            offsets[k] = shifts
+        return offsets
+
+
+def integrity_report(db_path: str) -> Dict[str, Any]:
+    """Orphaned foreign keys and line-item category mix."""
+    conn = sqlite3.connect(db_path)
+    try:
+        orphans = {
+            "orders_without_customer": conn.execute(
+                "SELECT COUNT(*) FROM Orders o LEFT JOIN Customers c ON o.CustomerID = c.CustomerID "
+                "WHERE c.CustomerID IS NULL").fetchone()[0],
+            "details_without_order": conn.execute(
+                'SELECT COUNT(*) FROM "Order Details" od LEFT JOIN Orders o ON od.OrderID = o.OrderID '
+                "WHERE o.OrderID IS NULL").fetchone()[0],
+            "details_without_product": conn.execute(
+                'SELECT COUNT(*) FROM "Order Details" od LEFT JOIN Products p ON od.ProductID = p.ProductID '
+                "WHERE p.ProductID IS NULL").fetchone()[0],
+        }
+        total = conn.execute('SELECT COUNT(*) FROM "Order Details"').fetchone()[0] or 1
+        mix = {
+            name: round(count / total, 4)
+            for name, count in conn.execute(
+                'SELECT c.CategoryName, COUNT(*) FROM "Order Details" od '
+                "JOIN Products p ON od.ProductID = p.ProductID "
+                "JOIN Categories c ON p.CategoryID = c.CategoryID GROUP BY c.CategoryName"
+            )
+        }
+    finally:
+        conn.close()
+    return {"orphans": orphans, "category_mix": mix}
+
+
+@click.command()
+@click.option('--src', default='data/northwind.sqlite', help='Source Northwind database')
+@click.option('--out', required=True, help='Path for the scaled database')
+@click.option('--factor', default=10, help='Multiply Customers/Products/Orders/Order Details by this')
+@click.option('--docs', default='docs', help='Docs directory with marketing_calendar.md')
+@click.option('--jitter-days', default=0, help='Randomly shift replica order dates within their calendar segment')
+@click.option('--seed', default=42, help='Random seed for date jitter')
+@click.option('--check/--no-check', default=True, help='Report orphaned keys and category mix afterwards')
+def main(src: str, out: str, factor: int, docs: str, jitter_days: int, seed: int, check: bool):
+    """Generate a scaled copy of a Northwind database for load testing."""
+    console.print(f"[yellow]Scaling {src} x{factor} into {out}...[/yellow]")
+    start = time.perf_counter()
+    counts = NorthwindScaler(src, out, docs, jitter_days, seed).scale(factor)
+    elapsed = time.perf_counter() - start
+    for table, count in counts.items():
+        console.print(f"  {table}: {count:,} rows")
+    console.print(f"[green]Done in {elapsed:.1f}s[/green]")
+
+    if check:
+        before, after = integrity_report(src), integrity_report(out)
+        console.print(f"Orphaned keys: {after['orphans']}")
+        for name, share in after["category_mix"].items():
+            console.print(f"  {name}: {share:.2%} (source {before['category_mix'].get(name, 0):.2%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,652 @@
+"""Query several SQLite shards with identical schema as one database.
+
+Each shard is a Northwind-shaped database (e.g. one per region). A query
+is planned once and then:
+
+- ``aggregate``: decomposable aggregates (SUM, TOTAL, COUNT, MIN, MAX, and
+  AVG as SUM/COUNT) run on every shard in parallel as per-group partials,
+  which are merged per group before HAVING, ORDER BY and LIMIT apply;
+- ``rows``: plain row queries run on every shard with ORDER BY ... LIMIT
+  pushed down, and the per-shard top-k lists are merged;
+- ``single``: queries touching only tables replicated on every shard
+  (same rows everywhere) run on the first shard;
+- ``union``: anything else (DISTINCT, COUNT(DISTINCT), subqueries, window
+  functions, outer joins, ...) runs once against every shard ATTACHed
+  to an in-memory database, with UNION ALL views over partitioned tables.
+
+Decomposition assumes rows that join together live on the same shard,
+e.g. an order and its order details are in the same region's database.
+"""
+import hashlib
+import multiprocessing
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from agent.tracing import get_tracer, STATUS_ERROR
+from tools.sql_parsing import (
+    SelectQuery, Token, aggregate_calls, column_references, normalize, parse_select, tokenize, unquote
+)
+from tools.sqlite_tool import PROGRESS_OPCODES, SQLiteTool
+
+
+SHARD_EXECUTORS = ("process", "thread")
+# Tables up to this size are compared across shards to detect replicas.
+REPLICA_CHECK_ROWS = 50000
+OUTER_JOINS = ("LEFT", "RIGHT", "FULL")
+
+QueryResult = Tuple[bool, List[tuple], List[str], str]
+
+_worker_tools: Dict[str, SQLiteTool] = {}
+
+
+def query_shard(path: str, sql: str, params: Sequence[Any], timeout_s: Optional[float]) -> QueryResult:
+    """Run one read-only query on a shard; executed in pool workers."""
+    tool = _worker_tools.get(path)
+    if tool is None:
+        tool = _worker_tools[path] = SQLiteTool(path, pool_size=1)
+    return tool.execute_readonly(sql, params, timeout_s=timeout_s)
+
+
+def parse_shard_spec(spec: str) -> Tuple[str, str]:
+    """"name=path" or just "path" (named after the file stem)."""
+    name, sep, path = spec.partition("=")
+    if sep and name and not Path(spec).exists():
+        return name, path
+    return Path(spec).stem, spec
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+@dataclass
+class Shard:
+    name: str
+    path: str
+    tool: SQLiteTool
+
+
+@dataclass
+class ShardPlan:
+    """How one query is executed across shards."""
+    kind: str
+    reason: str = ""
+    shard_sql: str = ""
+    shard_params: List[Any] = field(default_factory=list)
+    # aggregate: merged select expressions, output names (None = same as the
+    # original query's column) and the rest of the merge query.
+    merge_items: List[str] = field(default_factory=list)
+    names: List[Optional[str]] = field(default_factory=list)
+    merge_tail: str = ""
+    # rows: ORDER BY as (column index, or -1 - hidden index, suffix).
+    order: List[Tuple[int, str]] = field(default_factory=list)
+    hidden: int = 0
+    limit: Optional[int] = None
+    offset: int = 0
+
+
+class _Unsupported(Exception):
+    """The query cannot be decomposed; carries the reason."""
+
+
+def _int_value(value: Any) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise _Unsupported("non-integer LIMIT/OFFSET")
+
+
+def _limit_and_params(query: SelectQuery, params: Sequence[Any]) -> Tuple[Optional[int], int, List[Any]]:
+    """Resolve LIMIT/OFFSET to ints; trailing ``?`` placeholders are taken out of params."""
+    placeholders = [t for t in query.tokens if t.kind == "param"]
+    if any(t.text != "?" for t in placeholders):
+        raise _Unsupported("numbered or named parameters")
+    params = list(params or ())
+    if len(params) != len(placeholders):
+        raise _Unsupported("parameter count mismatch")
+    index = {t.start: i for i, t in enumerate(placeholders)}
+    taken = []
+
+    def value(tokens: List[Token]) -> Optional[int]:
+        if not tokens:
+            return None
+        if len(tokens) == 2 and tokens[0].kind == "op" and tokens[0].text == "-" and tokens[1].kind == "number":
+            return -_int_value(tokens[1].text)
+        if len(tokens) != 1:
+            raise _Unsupported("LIMIT/OFFSET expression")
+        if tokens[0].kind == "number":
+            return _int_value(tokens[0].text)
+        if tokens[0].kind == "param":
+            taken.append(index[tokens[0].start])
+            return _int_value(params[index[tokens[0].start]])
+        raise _Unsupported("LIMIT/OFFSET expression")
+
+    limit = value(query.limit)
+    offset = value(query.offset) or 0
+    if sorted(taken) != list(range(len(params) - len(taken), len(params))):
+        raise _Unsupported("LIMIT/OFFSET parameters are not the last ones")
+    if limit is not None and limit < 0:
+        limit = None
+    return limit, max(offset, 0), params[:len(params) - len(taken)]
+
+
+def _check_shape(query: SelectQuery):
+    if query.has_subquery:
+        raise _Unsupported("subquery")
+    if query.has_window or query.window:
+        raise _Unsupported("window function")
+    if query.distinct:
+        raise _Unsupported("SELECT DISTINCT")
+    if not query.from_tokens:
+        raise _Unsupported("no FROM clause")
+    if any(t.upper in OUTER_JOINS for t in query.from_tokens):
+        raise _Unsupported("outer join")
+    outside = [t for item in query.items for t in item.tokens] + query.having \
+        + [t for term in query.order_by for t in term.tokens] + [t for g in query.group_by for t in g]
+    if any(t.kind == "param" for t in outside):
+        raise _Unsupported("parameter outside FROM/WHERE/LIMIT")
+
+
+def _item_for(query: SelectQuery, tokens: List[Token]) -> Optional[int]:
+    """Index of the select item a GROUP BY/ORDER BY term refers to by position or alias."""
+    if len(tokens) != 1:
+        return None
+    token = tokens[0]
+    if token.kind == "number" and token.text.isdigit():
+        position = int(token.text)
+        if not 1 <= position <= len(query.items):
+            raise _Unsupported("term position out of range")
+        return position - 1
+    if token.kind in ("ident", "qident"):
+        name = unquote(token).lower()
+        for i, item in enumerate(query.items):
+            if item.alias is not None and item.alias.lower() == name:
+                return i
+    return None
+
+
+def _plan_aggregate(query: SelectQuery, limit: Optional[int], offset: int,
+                    params: List[Any], single_source: bool = False) -> ShardPlan:
+    sql = query.sql
+    group_exprs = []
+    for term in query.group_by:
+        i = _item_for(query, term)
+        expr = query.items[i].tokens if i is not None else term
+        if aggregate_calls(expr):
+            raise _Unsupported("aggregate in GROUP BY")
+        group_exprs.append(expr)
+    keys = {normalize(expr): i for i, expr in enumerate(group_exprs)}
+    partials: List[str] = []
+
+    def partial(expr: str) -> str:
+        if expr not in partials:
+            partials.append(expr)
+        return f"__p{partials.index(expr)}"
+
+    def merged(call) -> str:
+        if call.distinct and not single_source:
+            raise _Unsupported(f"{call.func}(DISTINCT ...)")
+        if call.filtered:
+            raise _Unsupported("aggregate FILTER clause")
+        args = sql[call.args[0].start:call.args[-1].end] if call.args else ""
+        if call.func in ("SUM", "TOTAL", "MIN", "MAX"):
+            return f"{call.func}({partial(f'{call.func}({args})')})"
+        if call.func == "COUNT":
+            return f"SUM({partial(f'COUNT({args})')})"
+        if call.func == "AVG":
+            total, count = partial(f"SUM({args})"), partial(f"COUNT({args})")
+            return f"(CAST(SUM({total}) AS REAL) / SUM({count}))"
+        raise _Unsupported(f"{call.func} is not decomposable")
+
+    def rewrite(tokens: List[Token]) -> str:
+        """Expression over merged partials and group keys."""
+        key = keys.get(normalize(tokens))
+        if key is not None:
+            return f"__g{key}"
+        pieces, outside, cursor, position = [], [], tokens[0].start, 0
+        for call in aggregate_calls(tokens):
+            outside.extend(tokens[position:call.start])
+            pieces.append(sql[cursor:tokens[call.start].start])
+            pieces.append(merged(call))
+            cursor, position = tokens[call.end].end, call.end + 1
+        outside.extend(tokens[position:])
+        if column_references(outside):
+            raise _Unsupported("column outside aggregates and GROUP BY")
+        pieces.append(sql[cursor:tokens[-1].end])
+        return "".join(pieces)
+
+    merge_items, names = [], []
+    for item in query.items:
+        if item.is_star:
+            raise _Unsupported("* with aggregates")
+        merge_items.append(rewrite(item.tokens))
+        names.append(item.alias)
+
+    item_norms = [normalize(item.tokens) for item in query.items]
+    order = []
+    for term in query.order_by:
+        i = _item_for(query, term.tokens)
+        if i is None and normalize(term.tokens) in item_norms:
+            i = item_norms.index(normalize(term.tokens))
+        expr = str(i + 1) if i is not None else rewrite(term.tokens)
+        order.append(f"{expr} {term.suffix}".strip())
+
+    shard_columns = [f"{query.text(expr)} AS __g{i}" for i, expr in enumerate(group_exprs)]
+    shard_columns += [f"{expr} AS __p{i}" for i, expr in enumerate(partials)]
+    shard_sql = f"SELECT {', '.join(shard_columns)}\n{query.source_text}"
+    tail = "FROM partials"
+    if group_exprs:
+        shard_sql += "\nGROUP BY " + ", ".join(query.text(expr) for expr in group_exprs)
+        tail += " GROUP BY " + ", ".join(f"__g{i}" for i in range(len(group_exprs)))
+    if query.having:
+        tail += f" HAVING {rewrite(query.having)}"
+    if order:
+        tail += " ORDER BY " + ", ".join(order)
+    if limit is not None:
+        tail += f" LIMIT {limit} OFFSET {offset}"
+    elif offset:
+        tail += f" LIMIT -1 OFFSET {offset}"
+    return ShardPlan("aggregate", shard_sql=shard_sql, shard_params=params,
+                     merge_items=merge_items, names=names, merge_tail=tail,
+                     limit=limit, offset=offset)
+
+
+def _plan_rows(query: SelectQuery, limit: Optional[int], offset: int, params: List[Any]) -> ShardPlan:
+    has_star = any(item.is_star for item in query.items)
+    hidden, order = [], []
+    for term in query.order_by:
+        i = _item_for(query, term.tokens)
+        if i is not None and not has_star:
+            order.append((i, term.suffix))
+            continue
+        # Evaluate the sort key on the shard as an extra, hidden column.
+        expr = query.items[i].tokens if i is not None else term.tokens
+        hidden.append(f"{query.text(expr)} AS __o{len(hidden)}")
+        order.append((-len(hidden), term.suffix))
+
+    select = query.sql[query.items[0].tokens[0].start:query.from_tokens[0].start].strip()
+    shard_sql = f"SELECT {', '.join([select] + hidden)}\n{query.source_text}"
+    if query.order_by:
+        shard_sql += "\nORDER BY " + ", ".join(
+            f"{query.text(term.tokens)} {term.suffix}".strip() for term in query.order_by
+        )
+    if limit is not None:
+        # Each shard's top limit+offset rows contain the global top-k.
+        shard_sql += f"\nLIMIT {limit + offset}"
+    return ShardPlan("rows", shard_sql=shard_sql, shard_params=params, order=order,
+                     hidden=len(hidden), limit=limit, offset=offset)
+
+
+def plan_query(sql: str, params: Sequence[Any] = None, single_source: bool = False) -> ShardPlan:
+    """Decide how to run sql across shards (ignoring table placement).
+
+    With ``single_source`` the partials come from one place, so DISTINCT
+    aggregates are allowed.
+    """
+    query = parse_select(sql)
+    if query is None:
+        return ShardPlan("union", reason="not a single plain SELECT")
+    try:
+        _check_shape(query)
+        limit, offset, shard_params = _limit_and_params(query, params)
+        has_aggregates = any(aggregate_calls(item.tokens) for item in query.items) \
+            or bool(aggregate_calls(query.having)) \
+            or any(aggregate_calls(term.tokens) for term in query.order_by)
+        if has_aggregates or query.group_by:
+            return _plan_aggregate(query, limit, offset, shard_params, single_source)
+        if query.having:
+            raise _Unsupported("HAVING without GROUP BY")
+        return _plan_rows(query, limit, offset, shard_params)
+    except _Unsupported as e:
+        return ShardPlan("union", reason=str(e))
+
+
+def output_names(tool: SQLiteTool, query: str, params: Optional[Sequence[Any]],
+                 names: List[Optional[str]]) -> List[str]:
+    """Fill unaliased output names with the columns the query returns (probed without reading rows)."""
+    success, _, columns, _ = tool.execute_readonly(
+        f"SELECT * FROM ({query.strip().rstrip(';')}) LIMIT 0", params
+    )
+    if not success or len(columns) != len(names):
+        return [name or f"column{i + 1}" for i, name in enumerate(names)]
+    return [name or column for name, column in zip(names, columns)]
+
+
+def merge_aggregate(plan: ShardPlan, results: List[QueryResult], names: List[str]) -> QueryResult:
+    """Merge per-source partial aggregate rows with the plan's merge query."""
+    columns = results[0][2]
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.execute(f"CREATE TABLE partials ({', '.join(_quote(c) for c in columns)})")
+        placeholders = ", ".join("?" for _ in columns)
+        for _, rows, _, _ in results:
+            conn.executemany(f"INSERT INTO partials VALUES ({placeholders})", rows)
+        select = ", ".join(f"{expr} AS {_quote(name)}" for expr, name in zip(plan.merge_items, names))
+        cursor = conn.execute(f"SELECT {select} {plan.merge_tail}")
+        return True, cursor.fetchall(), [d[0] for d in cursor.description], ""
+    finally:
+        conn.close()
+
+
+class ShardedSQLiteTool:
+    """SQLiteTool-compatible executor fanning queries out over shards.
+
+    Per-shard queries run in a process pool by default (``executor="thread"``
+    uses threads, which is cheaper for small shards). Tables are treated as
+    replicated when every shard holds the same rows; pass
+    ``replicated_tables`` to skip the detection.
+    """
+
+    def __init__(self, shards: Sequence[str], executor: str = "process",
+                 max_workers: Optional[int] = None, replicated_tables: Sequence[str] = None,
+                 pool_size: int = 4):
+        if not shards:
+            raise ValueError("at least one shard is required")
+        if executor not in SHARD_EXECUTORS:
+            raise ValueError(f"executor must be one of {SHARD_EXECUTORS}, got {executor!r}")
+        self.shards: List[Shard] = []
+        for spec in shards:
+            name, path = parse_shard_spec(spec)
+            if any(s.name == name for s in self.shards):
+                name = f"{name}_{len(self.shards)}"
+            if not Path(path).exists():
+                raise FileNotFoundError(f"shard {name}: {path} does not exist")
+            self.shards.append(Shard(name, path, SQLiteTool(path, pool_size=pool_size)))
+
+        self.schema_cache = self.shards[0].tool.get_schema()
+        for shard in self.shards[1:]:
+            if shard.tool.get_schema() != self.schema_cache:
+                raise ValueError(f"shard {shard.name} ({shard.path}) has a different schema "
+                                 f"from {self.shards[0].name}")
+        self.table_names = self.shards[0].tool.get_table_names()
+
+        self.executor = executor
+        self.max_workers = max_workers or len(self.shards)
+        self.pool_size = pool_size
+        self._replicated = (
+            {t.lower() for t in replicated_tables} if replicated_tables is not None else None
+        )
+        self._pool = None
+        self._lock = threading.Lock()
+        self._union_pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=pool_size)
+        self.plan_counts: Counter = Counter()
+        self.fallback_reasons: Counter = Counter()
+        self.shard_queries = 0
+        self.merge_ms = 0.0
+
+    @property
+    def db_path(self) -> str:
+        return self.shards[0].path
+
+    def get_schema(self) -> str:
+        return self.schema_cache
+
+    def get_data_version(self) -> str:
+        return ";".join(f"{s.name}={s.tool.get_data_version()}" for s in self.shards)
+
+    def get_table_names(self) -> List[str]:
+        return list(self.table_names)
+
+    # -- table placement -------------------------------------------------
+
+    @property
+    def replicated_tables(self) -> List[str]:
+        """Tables holding identical rows on every shard (detected once)."""
+        if self._replicated is None:
+            with self._lock:
+                if self._replicated is None:
+                    self._replicated = self._detect_replicated()
+        return sorted(t for t in self.table_names if t.lower() in self._replicated)
+
+    def _detect_replicated(self) -> set:
+        if len(self.shards) == 1:
+            return {t.lower() for t in self.table_names}
+        replicated = set()
+        for table in self.table_names:
+            digests = {self._table_digest(shard.path, table) for shard in self.shards}
+            if len(digests) == 1 and None not in digests:
+                replicated.add(table.lower())
+        return replicated
+
+    @staticmethod
+    def _table_digest(path: str, table: str) -> Optional[str]:
+        conn = sqlite3.connect(Path(path).resolve().as_uri() + "?mode=ro", uri=True)
+        try:
+            count = conn.execute(f"SELECT COUNT(*) FROM {_quote(table)}").fetchone()[0]
+            if count > REPLICA_CHECK_ROWS:
+                return None
+            digest = hashlib.sha1(str(count).encode())
+            for row in conn.execute(f"SELECT * FROM {_quote(table)} ORDER BY 1"):
+                digest.update(repr(row).encode("utf-8"))
+            return digest.hexdigest()
+        finally:
+            conn.close()
+
+    def tables_in(self, query: str) -> List[str]:
+        """Known tables mentioned in a query."""
+        names = {t.lower(): t for t in self.table_names}
+        found = []
+        for token in tokenize(query):
+            if token.kind in ("ident", "qident"):
+                table = names.get(unquote(token).lower())
+                if table is not None and table not in found:
+                    found.append(table)
+        return found
+
+    def shards_for(self, query: str) -> List[str]:
+        """Names of the shards a query reads."""
+        tables = self.tables_in(query)
+        replicated = set(self.replicated_tables)
+        if tables and all(t in replicated for t in tables):
+            return [self.shards[0].name]
+        return [s.name for s in self.shards]
+
+    def plan(self, query: str, params: Sequence[Any] = None) -> ShardPlan:
+        if len(self.shards) == 1:
+            return ShardPlan("single", reason="one shard")
+        tables = self.tables_in(query)
+        replicated = set(self.replicated_tables)
+        if tables and all(t in replicated for t in tables):
+            return ShardPlan("single", reason="replicated tables only")
+        return plan_query(query, params)
+
+    # -- execution ---------------------------------------------------------
+
+    def execute_query(self, query: str, params: Optional[Sequence[Any]] = None) -> QueryResult:
+        """Execute a query across shards, returning (success, rows, columns, error)."""
+        return self.execute_readonly(query, params)
+
+    def execute_readonly(self, query: str, params: Optional[Sequence[Any]] = None,
+                         timeout_s: Optional[float] = None) -> QueryResult:
+        """Plan, fan out, and merge one read-only query; never raises."""
+        with get_tracer().span("sqlite.sharded") as span:
+            span.set_attribute("db.system", "sqlite")
+            span.set_attribute("db.statement", query[:2000])
+            span.set_attribute("db.shards", len(self.shards))
+            plan = self.plan(query, params)
+            span.set_attribute("db.shard_plan", plan.kind)
+            with self._lock:
+                self.plan_counts[plan.kind] += 1
+                if plan.kind == "union":
+                    self.fallback_reasons[plan.reason] += 1
+
+            if plan.kind == "single":
+                result = self.shards[0].tool.execute_readonly(query, params, timeout_s=timeout_s)
+            elif plan.kind == "union":
+                result = self._execute_union(query, params, timeout_s)
+            else:
+                result = self._execute_fanout(plan, query, params, timeout_s)
+            if not result[0]:
+                span.set_status(STATUS_ERROR, result[3])
+            else:
+                span.set_attribute("db.rows", len(result[1]))
+            return result
+
+    def validate(self, query: str, params: Optional[Sequence[Any]] = None) -> str:
+        """Compile query against the first shard; every shard has the same schema."""
+        return self.shards[0].tool.validate(query, params)
+
+    def _executor(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    if self.executor == "process":
+                        # spawn: forking a process that runs threads can deadlock.
+                        self._pool = ProcessPoolExecutor(
+                            max_workers=self.max_workers,
+                            mp_context=multiprocessing.get_context("spawn")
+                        )
+                    else:
+                        self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix="shard")
+        return self._pool
+
+    def _fan_out(self, sql: str, params: Sequence[Any], timeout_s: Optional[float]
+                 ) -> List[QueryResult]:
+        pool = self._executor()
+        if self.executor == "process":
+            futures = [pool.submit(query_shard, s.path, sql, list(params), timeout_s) for s in self.shards]
+        else:
+            futures = [pool.submit(s.tool.execute_readonly, sql, params, timeout_s) for s in self.shards]
+        with self._lock:
+            self.shard_queries += len(futures)
+        results = []
+        for shard, future in zip(self.shards, futures):
+            try:
+                results.append(future.result())
+            except BrokenProcessPool as e:
+                with self._lock:
+                    self._pool = None
+                results.append((False, [], [], f"shard worker died: {e}"))
+        return results
+
+    def _execute_fanout(self, plan: ShardPlan, query: str, params: Optional[Sequence[Any]],
+                        timeout_s: Optional[float]) -> QueryResult:
+        results = self._fan_out(plan.shard_sql, plan.shard_params, timeout_s)
+        for shard, (success, _, _, error) in zip(self.shards, results):
+            if not success:
+                return False, [], [], f"shard {shard.name}: {error}"
+        started = time.perf_counter()
+        try:
+            if plan.kind == "aggregate":
+                names = plan.names
+                if any(name is None for name in names):
+                    names = output_names(self.shards[0].tool, query, params, names)
+                return merge_aggregate(plan, results, names)
+            return self._merge_rows(plan, results)
+        except sqlite3.Error as e:
+            return False, [], [], f"shard merge failed: {e}"
+        finally:
+            with self._lock:
+                self.merge_ms += (time.perf_counter() - started) * 1000
+
+    def _merge_rows(self, plan: ShardPlan, results: List[QueryResult]) -> QueryResult:
+        all_columns = results[0][2]
+        width = len(all_columns) - plan.hidden
+        columns = all_columns[:width]
+        if not plan.order:
+            rows = [row[:width] for _, shard_rows, _, _ in results for row in shard_rows]
+            end = None if plan.limit is None else plan.offset + plan.limit
+            return True, rows[plan.offset:end], columns, ""
+
+        # Merge the per-shard sorted top-k lists with SQLite's own ordering rules.
+        conn = sqlite3.connect(":memory:")
+        try:
+            names = [f"c{i}" for i in range(len(all_columns))]
+            conn.execute(f"CREATE TABLE partials ({', '.join(names)})")
+            placeholders = ", ".join("?" for _ in names)
+            for _, rows, _, _ in results:
+                conn.executemany(f"INSERT INTO partials VALUES ({placeholders})", rows)
+            order = ", ".join(
+                f"c{index if index >= 0 else width - index - 1} {suffix}".strip()
+                for index, suffix in plan.order
+            )
+            sql = f"SELECT {', '.join(names[:width])} FROM partials ORDER BY {order}"
+            if plan.limit is not None or plan.offset:
+                sql += f" LIMIT {plan.limit if plan.limit is not None else -1} OFFSET {plan.offset}"
+            return True, conn.execute(sql).fetchall(), columns, ""
+        finally:
+            conn.close()
+
+    # -- ATTACH + UNION ALL fallback ------------------------------------------
+
+    def _open_union_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect("file::memory:", uri=True, check_same_thread=False)
+        if len(self.shards) > 10 and hasattr(conn, "setlimit"):
+            conn.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, len(self.shards))
+        for i, shard in enumerate(self.shards):
+            uri = Path(shard.path).resolve().as_uri() + "?mode=ro"
+            conn.execute(f"ATTACH DATABASE ? AS shard{i}", (uri,))
+        replicated = set(self.replicated_tables)
+        for table in self.table_names:
+            sources = [0] if table in replicated else range(len(self.shards))
+            union = " UNION ALL ".join(f"SELECT * FROM shard{i}.{_quote(table)}" for i in sources)
+            conn.execute(f"CREATE TEMP VIEW {_quote(table)} AS {union}")
+        return conn
+
+    @contextmanager
+    def _union_connection(self) -> Iterator[sqlite3.Connection]:
+        try:
+            conn = self._union_pool.get_nowait()
+        except queue.Empty:
+            conn = self._open_union_connection()
+        try:
+            yield conn
+        finally:
+            conn.set_progress_handler(None, 0)
+            try:
+                self._union_pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def _execute_union(self, query: str, params: Optional[Sequence[Any]],
+                       timeout_s: Optional[float]) -> QueryResult:
+        try:
+            with self._union_connection() as conn:
+                if timeout_s:
+                    deadline = time.perf_counter() + timeout_s
+                    conn.set_progress_handler(lambda: time.perf_counter() > deadline, PROGRESS_OPCODES)
+                cursor = conn.execute(query, tuple(params or ()))
+                columns = [desc[0] for desc in cursor.description] if cursor.description else []
+                return True, cursor.fetchall(), columns, ""
+        except Exception as e:
+            error = str(e)
+            if timeout_s and error == "interrupted":
+                error = f"query timed out after {timeout_s:g}s"
+            return False, [], [], error
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "shards": [s.name for s in self.shards],
+                "executor": self.executor,
+                "plans": dict(self.plan_counts),
+                "fallback_reasons": dict(self.fallback_reasons),
+                "shard_queries": self.shard_queries,
+                "merge_ms": round(self.merge_ms, 3),
+                "replicated_tables": sorted(
+                    t for t in self.table_names if self._replicated and t.lower() in self._replicated
+                )
+            }
+
+    def close(self):
+        """Shut down the worker pool and close pooled connections."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        for shard in self.shards:
+            shard.tool.close()
+        while True:
+            try:
+                self._union_pool.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,319 @@
+"""Lightweight SQLite tokenizer and SELECT clause splitter.
+
+Not a full SQL parser: it understands tokens, parenthesis depth and the
+top-level clauses of a single SELECT, which is enough to decide whether
+a generated query can be rewritten (e.g. split into per-shard partial
+aggregates) and to rebuild it from the original text spans.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import List, NamedTuple, Optional
+
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<string>'(?:[^']|'')*'?)
+  | (?P<qident>"(?:[^"]|"")*"?|`[^`]*`?|\[[^\]]*\]?)
+  | (?P<number>0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<param>\?\d*|[:@$][A-Za-z_]\w*)
+  | (?P<ident>[A-Za-z_][\w$]*)
+  | (?P<op>\|\||<<|>>|<=|>=|==|!=|<>|[-+*/%<>=~&|])
+  | (?P<punct>[(),.;])
+  | (?P<other>.)
+""", re.S | re.X)
+
+# Clause keywords recognised at parenthesis depth 0 of a SELECT.
+CLAUSES = ("FROM", "WHERE", "GROUP", "HAVING", "WINDOW", "ORDER", "LIMIT")
+COMPOUND = ("UNION", "INTERSECT", "EXCEPT")
+AGGREGATES = ("SUM", "TOTAL", "COUNT", "MIN", "MAX", "AVG", "GROUP_CONCAT", "STRING_AGG")
+# Words that may appear in an expression without referring to a column.
+EXPRESSION_KEYWORDS = frozenset((
+    "AS", "AND", "OR", "NOT", "NULL", "IS", "IN", "BETWEEN", "LIKE", "GLOB", "ESCAPE",
+    "CASE", "WHEN", "THEN", "ELSE", "END", "CAST", "COLLATE", "NOCASE", "BINARY", "RTRIM",
+    "INTEGER", "INT", "REAL", "TEXT", "NUMERIC", "FLOAT", "DOUBLE", "BLOB", "TRUE", "FALSE",
+    "CURRENT_DATE", "CURRENT_TIME", "CURRENT_TIMESTAMP", "DISTINCT", "ALL"
+))
+
+
+class Token(NamedTuple):
+    kind: str
+    text: str
+    start: int
+    end: int
+
+    @property
+    def upper(self) -> str:
+        return self.text.upper() if self.kind == "ident" else ""
+
+    def is_punct(self, char: str) -> bool:
+        return self.kind == "punct" and self.text == char
+
+
+def tokenize(sql: str) -> List[Token]:
+    """Tokens of sql without whitespace and comments."""
+    tokens = []
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        if kind not in ("ws", "comment"):
+            tokens.append(Token(kind, match.group(), match.start(), match.end()))
+    return tokens
+
+
+def split_statements(sql: str) -> List[str]:
+    """Split on top-level semicolons, dropping empty statements."""
+    statements, start = [], 0
+    for token in tokenize(sql):
+        if token.is_punct(";"):
+            statements.append(sql[start:token.start])
+            start = token.end
+    statements.append(sql[start:])
+    return [s.strip() for s in statements if tokenize(s)]
+
+
+def tokens_text(sql: str, tokens: List[Token]) -> str:
+    """Original text spanned by tokens (comments inside are kept)."""
+    return sql[tokens[0].start:tokens[-1].end] if tokens else ""
+
+
+def unquote(token: Token) -> str:
+    if token.kind == "qident":
+        text = token.text[1:-1] if len(token.text) > 1 else token.text
+        return text.replace('""', '"')
+    return token.text
+
+
+def normalize(tokens: List[Token]) -> str:
+    """Comparable form of an expression: identifiers unquoted and case-folded."""
+    parts = []
+    for token in tokens:
+        if token.kind in ("ident", "qident"):
+            parts.append(unquote(token).lower())
+        else:
+            parts.append(token.text)
+    return " ".join(parts)
+
+
+def split_top_level(tokens: List[Token], char: str = ",") -> List[List[Token]]:
+    """Split a token list on a punctuation character at parenthesis depth 0."""
+    parts, current, depth = [], [], 0
+    for token in tokens:
+        if token.is_punct("("):
+            depth += 1
+        elif token.is_punct(")"):
+            depth -= 1
+        if depth == 0 and token.is_punct(char):
+            parts.append(current)
+            current = []
+        else:
+            current.append(token)
+    parts.append(current)
+    return parts
+
+
+def matching_paren(tokens: List[Token], open_index: int) -> int:
+    """Index of the ')' closing the '(' at open_index (len(tokens) if unbalanced)."""
+    depth = 0
+    for i in range(open_index, len(tokens)):
+        if tokens[i].is_punct("("):
+            depth += 1
+        elif tokens[i].is_punct(")"):
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(tokens)
+
+
+@dataclass
+class SelectItem:
+    tokens: List[Token]
+    alias: Optional[str] = None
+
+    @property
+    def is_star(self) -> bool:
+        return bool(self.tokens) and self.tokens[-1].kind == "op" and self.tokens[-1].text == "*" \
+            and (len(self.tokens) == 1 or self.tokens[-2].is_punct("."))
+
+
+@dataclass
+class OrderTerm:
+    tokens: List[Token]
+    suffix: str = ""
+
+
+@dataclass
+class AggregateCall:
+    func: str
+    start: int
+    end: int
+    args: List[Token]
+    distinct: bool = False
+    filtered: bool = False
+
+
+@dataclass
+class SelectQuery:
+    """Top-level clauses of one SELECT statement, as token lists over ``sql``."""
+    sql: str
+    tokens: List[Token]
+    distinct: bool = False
+    items: List[SelectItem] = field(default_factory=list)
+    from_tokens: List[Token] = field(default_factory=list)
+    where_tokens: List[Token] = field(default_factory=list)
+    group_by: List[List[Token]] = field(default_factory=list)
+    having: List[Token] = field(default_factory=list)
+    window: List[Token] = field(default_factory=list)
+    order_by: List[OrderTerm] = field(default_factory=list)
+    limit: List[Token] = field(default_factory=list)
+    offset: List[Token] = field(default_factory=list)
+    has_subquery: bool = False
+    has_window: bool = False
+
+    def text(self, tokens: List[Token]) -> str:
+        return tokens_text(self.sql, tokens)
+
+    @property
+    def source_text(self) -> str:
+        """FROM ... WHERE ... exactly as written."""
+        tokens = self.from_tokens + self.where_tokens
+        return self.text(tokens)
+
+
+def _split_alias(tokens: List[Token]) -> SelectItem:
+    if len(tokens) >= 3 and tokens[-2].upper == "AS" and tokens[-1].kind in ("ident", "qident", "string"):
+        return SelectItem(tokens[:-2], unquote(tokens[-1]).strip("'"))
+    if len(tokens) >= 2 and tokens[-1].kind in ("ident", "qident") \
+            and tokens[-1].upper not in EXPRESSION_KEYWORDS \
+            and (tokens[-2].kind in ("ident", "qident", "number", "string") or tokens[-2].is_punct(")")) \
+            and (tokens[-2].upper not in EXPRESSION_KEYWORDS or tokens[-2].upper == "END"):
+        return SelectItem(tokens[:-1], unquote(tokens[-1]))
+    return SelectItem(tokens)
+
+
+def _order_term(tokens: List[Token]) -> OrderTerm:
+    end = len(tokens)
+    if end >= 2 and tokens[end - 2].upper == "NULLS" and tokens[end - 1].upper in ("FIRST", "LAST"):
+        end -= 2
+    if end >= 1 and tokens[end - 1].upper in ("ASC", "DESC"):
+        end -= 1
+    if end >= 2 and tokens[end - 2].upper == "COLLATE":
+        end -= 2
+    suffix = " ".join(t.text for t in tokens[end:])
+    return OrderTerm(tokens[:end], suffix)
+
+
+def parse_select(sql: str) -> Optional[SelectQuery]:
+    """Split a single plain SELECT into clauses; None for anything else.
+
+    Compound selects (UNION/INTERSECT/EXCEPT), CTEs, multiple statements
+    and non-SELECT statements return None.
+    """
+    statements = split_statements(sql)
+    if len(statements) != 1:
+        return None
+    text = statements[0]
+    tokens = tokenize(text)
+    if not tokens or tokens[0].upper != "SELECT":
+        return None
+
+    query = SelectQuery(sql=text, tokens=tokens)
+    sections = {"SELECT": []}
+    current = "SELECT"
+    depth = 0
+    i = 1
+    while i < len(tokens):
+        token = tokens[i]
+        if token.is_punct("("):
+            depth += 1
+        elif token.is_punct(")"):
+            depth -= 1
+        elif token.upper == "SELECT" and depth > 0:
+            query.has_subquery = True
+        elif token.upper == "OVER" and i + 1 < len(tokens) \
+                and (tokens[i + 1].is_punct("(") or tokens[i + 1].kind == "ident"):
+            query.has_window = True
+        if depth == 0 and token.upper in COMPOUND:
+            return None
+        if depth == 0 and token.upper in CLAUSES + ("OFFSET",):
+            clause = token.upper
+            if clause in ("GROUP", "ORDER"):
+                if i + 1 >= len(tokens) or tokens[i + 1].upper != "BY":
+                    return None
+                i += 1
+            if clause in sections:
+                return None
+            current = clause
+            sections[current] = [token] if clause in ("FROM", "WHERE") else []
+            i += 1
+            continue
+        sections[current].append(token)
+        i += 1
+
+    select = sections["SELECT"]
+    if select and select[0].upper in ("DISTINCT", "ALL"):
+        query.distinct = select[0].upper == "DISTINCT"
+        select = select[1:]
+    if not select:
+        return None
+    query.items = [_split_alias(part) for part in split_top_level(select)]
+    query.from_tokens = sections.get("FROM", [])
+    query.where_tokens = sections.get("WHERE", [])
+    if "GROUP" in sections:
+        query.group_by = split_top_level(sections["GROUP"])
+    query.having = sections.get("HAVING", [])
+    query.window = sections.get("WINDOW", [])
+    if "ORDER" in sections:
+        query.order_by = [_order_term(part) for part in split_top_level(sections["ORDER"])]
+    limit = sections.get("LIMIT", [])
+    limit_parts = split_top_level(limit)
+    if len(limit_parts) == 2:
+        # SQLite's "LIMIT offset, count" form.
+        query.offset, query.limit = limit_parts
+    else:
+        query.limit = limit
+    if "OFFSET" in sections:
+        query.offset = sections["OFFSET"]
+    if any(not part for part in query.group_by) or any(not t.tokens for t in query.order_by) \
+            or any(not item.tokens for item in query.items):
+        return None
+    return query
+
+
+def aggregate_calls(tokens: List[Token]) -> List[AggregateCall]:
+    """Outermost aggregate function calls in an expression, in order.
+
+    Two-argument MIN/MAX are SQLite's scalar functions and are skipped.
+    """
+    calls = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.upper in AGGREGATES and i + 1 < len(tokens) and tokens[i + 1].is_punct("("):
+            close = matching_paren(tokens, i + 1)
+            args = tokens[i + 2:close]
+            if token.upper in ("MIN", "MAX") and len(split_top_level(args)) > 1:
+                i += 1
+                continue
+            distinct = bool(args) and args[0].upper == "DISTINCT"
+            filtered = close + 1 < len(tokens) and tokens[close + 1].upper == "FILTER"
+            calls.append(AggregateCall(token.upper, i, close, args, distinct, filtered))
+            i = close + 1
+            continue
+        i += 1
+    return calls
+
+
+def column_references(tokens: List[Token]) -> List[Token]:
+    """Identifier tokens that are neither function names nor SQL keywords."""
+    refs = []
+    for i, token in enumerate(tokens):
+        if token.kind not in ("ident", "qident"):
+            continue
+        if token.kind == "ident" and token.upper in EXPRESSION_KEYWORDS:
+            continue
+        if i + 1 < len(tokens) and tokens[i + 1].is_punct("("):
+            continue
+        if i > 0 and tokens[i - 1].upper == "COLLATE":
+            continue
+        refs.append(token)
+    return refs
@@ -0,0 +1,458 @@
+"""Clean up generated SQL before it reaches the database.
+
+LLM output often wraps a query in markdown fences or prose, appends a
+second statement, forgets the LIMIT of a top-N question, or filters dates
+through expressions that hide the column from the date-range index.
+``SQLRewriter.rewrite`` fixes what it can do without changing the result:
+
+- ``strip_fences`` / ``strip_leading_text`` / ``strip_trailing_text``:
+  keep only the SQL; trailing prose without a semicolon is found by
+  letting SQLite compile (EXPLAIN) successively shorter prefixes;
+- ``drop_extra_statements``: keep the first statement only;
+- ``reject_write``: anything but a read-only SELECT/WITH is refused
+  without being executed;
+- ``inject_limit``: an ORDER BY query without LIMIT gets ``LIMIT n`` for
+  a list when the question asks for the top n, or ``LIMIT 1`` for a name
+  or object answer when it asks which/the top item;
+- ``fold_date_literal``: ``DATE('1997-06-01')`` and ``DATE(DATE(x))``;
+- ``strftime_date`` / ``strftime_range`` / ``date_equals``: strftime year,
+  month or day comparisons and ``DATE(col) = x`` become the canonical
+  ``DATE(col) BETWEEN a AND b`` that ``tools/date_index.py`` makes sargable.
+
+``select_star_join`` is reported as a warning only: which columns the
+answer needs cannot be told from the SQL.
+"""
+import calendar
+import re
+import sqlite3
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from agent.format_hints import compile_format_hint
+from tools.date_index import _closes_between
+from tools.sql_parsing import SelectQuery, Token, parse_select, split_statements, tokenize
+
+
+READ_ONLY_STARTS = ("SELECT", "WITH", "VALUES")
+WRITE_KEYWORDS = frozenset((
+    "INSERT", "UPDATE", "DELETE", "REPLACE", "UPSERT", "CREATE", "DROP", "ALTER", "ATTACH",
+    "DETACH", "PRAGMA", "VACUUM", "REINDEX", "ANALYZE", "BEGIN", "COMMIT", "ROLLBACK",
+    "SAVEPOINT", "RELEASE"
+))
+# Tokens around a comparison that may be replaced by a BETWEEN without parentheses.
+PRECEDERS = frozenset(("WHERE", "AND", "OR", "ON", "NOT", "HAVING", "WHEN"))
+FOLLOWERS = frozenset((
+    "AND", "OR", "THEN", "GROUP", "ORDER", "LIMIT", "HAVING", "WINDOW", "JOIN", "INNER", "LEFT",
+    "RIGHT", "FULL", "CROSS", "NATURAL", "UNION", "INTERSECT", "EXCEPT", "WHERE"
+))
+# Trailing lines tried when looking for prose after the statement.
+MAX_TRIM_LINES = 20
+
+_FENCED = re.compile(r"```[ \t]*(?:sql|sqlite)?[ \t]*\n?(.*?)(?:```|$)", re.S | re.I)
+_STATEMENT_START = re.compile(r"^(?:[ \t]*(?:sql|sqlite|query)[ \t]*:)?[ \t]*(SELECT|WITH)\b", re.I | re.M)
+# Errors that trailing prose produces; other errors are never "fixed" by trimming.
+_SYNTAX_ERRORS = ("syntax error", "incomplete input", "unrecognized token")
+_PROSE_LINE = re.compile(r"[ \t]*[A-Za-z][A-Za-z']*[:,]?[ \t]+[A-Za-z]")
+# Words that continue a statement on a new line, so a line starting with one is not prose.
+SQL_CONTINUATIONS = frozenset((
+    "FROM", "WHERE", "GROUP", "ORDER", "HAVING", "LIMIT", "OFFSET", "JOIN", "INNER", "LEFT",
+    "RIGHT", "FULL", "CROSS", "NATURAL", "ON", "USING", "AND", "OR", "NOT", "UNION", "INTERSECT",
+    "EXCEPT", "WINDOW", "CASE", "WHEN", "THEN", "ELSE", "END", "AS", "SELECT", "WITH", "VALUES",
+    "BETWEEN", "IN", "IS", "LIKE", "DESC", "ASC", "DISTINCT", "OVER", "PARTITION", "FILTER"
+))
+_YEAR = re.compile(r"\d{4}")
+_MONTH = re.compile(r"(\d{4})-(\d{2})")
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+Validator = Callable[[str, Sequence[Any]], str]
+
+
+@dataclass
+class RewriteResult:
+    sql: str
+    params: List[Any] = field(default_factory=list)
+    rewrites: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+    error: str = ""
+
+
+def strip_noise(text: str, validate: Optional[Validator] = None,
+                params: Sequence[Any] = ()) -> Tuple[str, List[str]]:
+    """The first SQL statement in text, without fences and surrounding prose."""
+    rewrites = []
+    sql = text.strip()
+    if "```" in sql:
+        fenced = _FENCED.search(sql)
+        sql = fenced.group(1).strip() if fenced else sql.replace("```", "").strip()
+        rewrites.append("strip_fences")
+    start = _STATEMENT_START.search(sql)
+    if start and start.start(1) and tokenize(sql[:start.start(1)]):
+        sql = sql[start.start(1):]
+        rewrites.append("strip_leading_text")
+
+    statements = split_statements(sql)
+    if len(statements) > 1:
+        sql = statements[0]
+        starts = {tokenize(s)[0].upper for s in statements[1:]}
+        sql_like = starts & (set(READ_ONLY_STARTS) | WRITE_KEYWORDS)
+        rewrites.append("drop_extra_statements" if sql_like else "strip_trailing_text")
+    elif statements:
+        sql = statements[0]
+
+    if validate is not None and any(_prose_line(line) for line in sql.splitlines()[1:]):
+        error = validate(sql, params)
+        if error and any(e in error for e in _SYNTAX_ERRORS):
+            trimmed = _trim_trailing_prose(sql, validate, params)
+            if trimmed is not None:
+                sql = trimmed
+                if "strip_trailing_text" not in rewrites:
+                    rewrites.append("strip_trailing_text")
+    return sql, rewrites
+
+
+def _trim_trailing_prose(sql: str, validate: Validator, params: Sequence[Any]) -> Optional[str]:
+    """sql without the trailing lines, starting with a prose line, that SQLite cannot compile."""
+    lines = sql.splitlines()
+    for end in range(len(lines) - 1, max(len(lines) - 1 - MAX_TRIM_LINES, 0), -1):
+        if not _prose_line(lines[end]):
+            continue
+        candidate = "\n".join(lines[:end]).rstrip()
+        if not sqlite3.complete_statement(candidate + ";"):
+            continue
+        if sum(t.kind == "param" for t in tokenize(candidate)) != len(params):
+            continue
+        if not validate(candidate, params):
+            return candidate
+    return None
+
+
+def _prose_line(line: str) -> bool:
+    """Whether a line reads like a sentence rather than a continuation of the statement."""
+    return bool(_PROSE_LINE.match(line)) and line.split()[0].rstrip(":,").upper() not in SQL_CONTINUATIONS
+
+
+def write_keyword(sql: str) -> Optional[str]:
+    """The statement keyword that makes sql a non-read-only statement, if any."""
+    tokens = tokenize(sql)
+    if not tokens:
+        return "an empty query"
+    if tokens[0].upper not in READ_ONLY_STARTS:
+        return tokens[0].text.upper()
+    for i, token in enumerate(tokens):
+        if token.upper in WRITE_KEYWORDS:
+            # REPLACE(x, y, z) is also a string function.
+            if token.upper == "REPLACE" and i + 1 < len(tokens) and tokens[i + 1].is_punct("("):
+                continue
+            if i and tokens[i - 1].is_punct("."):
+                continue
+            return token.upper
+    return None
+
+
+def expected_rows(format_hint: str, top_n: Optional[int], single: bool = False) -> Optional[int]:
+    """How many rows an answer of this format can use, when that is known.
+
+    Only a list with a known top n, or a name/object for a question that
+    picks a single item, fixes the row count; a numeric scalar may be an
+    aggregate over all the ordered rows, so it never does.
+    """
+    spec = compile_format_hint(format_hint)
+    if spec.kind == "list" and top_n:
+        return top_n
+    if single and (spec.kind == "object" or spec.scalar_type == "str"):
+        return 1
+    return None
+
+
+def inject_limit(query: Optional[SelectQuery], rows: Optional[int]) -> Optional[str]:
+    """The query with ``LIMIT rows`` appended to a top-level ORDER BY lacking one, else None."""
+    if not rows or query is None or not query.order_by or query.limit:
+        return None
+    return f"{query.sql.rstrip()}\nLIMIT {int(rows)}"
+
+
+class _Edits:
+    """Token-span replacements over one statement, keeping ``?`` parameters in step."""
+
+    def __init__(self, sql: str, params: Sequence[Any]):
+        self.sql = sql
+        self.tokens = tokenize(sql)
+        self.params = list(params)
+        placeholders = [i for i, t in enumerate(self.tokens) if t.kind == "param"]
+        self.positional = all(self.tokens[i].text == "?" for i in placeholders) \
+            and len(placeholders) == len(self.params)
+        self.position = {i: n for n, i in enumerate(placeholders)} if self.positional else {}
+        self.edits: List[Tuple[int, int, str, List[Any]]] = []
+
+    def value(self, j: int) -> Tuple[bool, Any]:
+        """(known, value) of a string literal or bound parameter token."""
+        token = self.tokens[j]
+        if token.kind == "string" and len(token.text) > 1 and token.text.endswith("'"):
+            return True, token.text[1:-1].replace("''", "'")
+        if token.kind == "param" and j in self.position:
+            return True, self.params[self.position[j]]
+        return False, None
+
+    def replace(self, first: int, last: int, text: str, values: List[Any] = ()):
+        """Replace tokens first..last with text whose ``?`` placeholders bind values."""
+        self.edits.append((first, last, text, list(values)))
+
+    def apply(self) -> Tuple[str, List[Any]]:
+        if not self.edits:
+            return self.sql, self.params
+        self.edits.sort()
+        pieces, params, cursor, token_cursor = [], [], 0, 0
+        for first, last, text, values in self.edits:
+            params.extend(self._bound(token_cursor, first))
+            pieces.append(self.sql[cursor:self.tokens[first].start])
+            pieces.append(text)
+            params.extend(values)
+            cursor, token_cursor = self.tokens[last].end, last + 1
+        params.extend(self._bound(token_cursor, len(self.tokens)))
+        pieces.append(self.sql[cursor:])
+        # Without positional parameters no edit touches one, so they pass through unchanged.
+        return "".join(pieces), params if self.positional else self.params
+
+    def _bound(self, first: int, stop: int) -> List[Any]:
+        return [self.params[self.position[j]] for j in range(first, stop) if j in self.position]
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _valid_date(text: Any) -> bool:
+    if not isinstance(text, str) or not _ISO_DATE.fullmatch(text):
+        return False
+    year, month, day = map(int, text.split("-"))
+    return 1 <= month <= 12 and 1 <= day <= calendar.monthrange(year, month)[1]
+
+
+def _call(tokens: List[Token], i: int, name: str) -> Optional[Tuple[List[int], int]]:
+    """(argument start indexes, closing paren index) of ``name(...)`` at i, or None."""
+    if tokens[i].upper != name or i + 1 >= len(tokens) or not tokens[i + 1].is_punct("("):
+        return None
+    starts, depth = [i + 2], 0
+    for j in range(i + 1, len(tokens)):
+        if tokens[j].is_punct("("):
+            depth += 1
+        elif tokens[j].is_punct(")"):
+            depth -= 1
+            if depth == 0:
+                return starts, j
+        elif depth == 1 and tokens[j].is_punct(","):
+            starts.append(j + 1)
+    return None
+
+
+def _column_arg(tokens: List[Token], first: int, close: int) -> bool:
+    """Whether tokens[first:close] is a plain, possibly qualified, column reference."""
+    span = tokens[first:close]
+    names = ("ident", "qident")
+    return (len(span) == 1 and span[0].kind in names) or \
+        (len(span) == 3 and span[0].kind in names and span[1].is_punct(".") and span[2].kind in names)
+
+
+def fold_date_literals(sql: str, params: Sequence[Any]) -> Tuple[str, List[Any], List[str]]:
+    """Drop DATE() wrappers that cannot change their argument; rewrite strftime('%Y-%m-%d')."""
+    edits, fired = _Edits(sql, params), []
+    tokens, i = edits.tokens, 0
+    while i < len(tokens):
+        call = _call(tokens, i, "DATE") or _call(tokens, i, "STRFTIME")
+        if call is None:
+            i += 1
+            continue
+        starts, close = call
+        if tokens[i].upper == "STRFTIME":
+            fmt_ok, fmt = edits.value(starts[0]) if len(starts) == 2 else (False, None)
+            if fmt_ok and fmt == "%Y-%m-%d" and tokens[starts[0]].kind == "string" \
+                    and _column_arg(tokens, starts[1], close):
+                edits.replace(i, close, f"DATE({sql[tokens[starts[1]].start:tokens[close - 1].end]})")
+                fired.append("strftime_date")
+                i = close + 1
+                continue
+            i += 1
+            continue
+        if len(starts) == 1 and close == starts[0] + 1:
+            known, value = edits.value(starts[0])
+            if known and _valid_date(value):
+                text = tokens[starts[0]].text
+                edits.replace(i, close, text, [value] if text == "?" else [])
+                fired.append("fold_date_literal")
+                i = close + 1
+                continue
+        inner = _call(tokens, starts[0], "DATE") if len(starts) == 1 and starts[0] < close else None
+        if inner is not None and inner[1] == close - 1 and len(inner[0]) == 1:
+            inner_sql = sql[tokens[starts[0]].start:tokens[inner[1]].end]
+            values = [edits.params[edits.position[j]] for j in range(starts[0], close) if j in edits.position]
+            if edits.positional:
+                edits.replace(i, close, inner_sql, values)
+                fired.append("fold_date_literal")
+                i = close + 1
+                continue
+        i += 1
+    sql, params = edits.apply()
+    return sql, params, fired
+
+
+def rewrite_date_predicates(sql: str, params: Sequence[Any]) -> Tuple[str, List[Any], List[str]]:
+    """Turn strftime/DATE equality filters into ``DATE(col) BETWEEN a AND b``."""
+    edits, fired = _Edits(sql, params), []
+    tokens, i = edits.tokens, 0
+    while i < len(tokens):
+        previous = tokens[i - 1] if i else None
+        if previous is None or not (previous.upper in PRECEDERS or previous.is_punct("(")) \
+                or (previous.upper == "AND" and _closes_between(tokens, i - 1)):
+            i += 1
+            continue
+        call = _call(tokens, i, "STRFTIME") or _call(tokens, i, "DATE")
+        if call is None:
+            i += 1
+            continue
+        starts, close = call
+        if tokens[i].upper == "STRFTIME":
+            if len(starts) != 2 or tokens[starts[0]].kind != "string":
+                i += 1
+                continue
+            fmt, column_first = edits.value(starts[0])[1], starts[1]
+        else:
+            if len(starts) != 1:
+                i += 1
+                continue
+            fmt, column_first = "%Y-%m-%d", starts[0]
+        if not _column_arg(tokens, column_first, close) or fmt not in ("%Y", "%Y-%m", "%Y-%m-%d"):
+            i += 1
+            continue
+        column = sql[tokens[column_first].start:tokens[close - 1].end]
+        match = _comparison(edits, close + 1)
+        if match is None:
+            i += 1
+            continue
+        last, low, high = match
+        following = tokens[last + 1] if last + 1 < len(tokens) else None
+        if following is not None and not (following.upper in FOLLOWERS or following.is_punct(")")
+                                          or following.is_punct(";")):
+            i += 1
+            continue
+        bounds = _bounds(fmt, low, high)
+        if bounds is None:
+            i += 1
+            continue
+        if fmt == "%Y-%m-%d" and tokens[i].upper == "DATE":
+            kind = "date_equals"
+        else:
+            kind = "strftime_range"
+        edits.replace(i, last, f"DATE({column}) BETWEEN ? AND ?" if bounds[2] else
+                      f"DATE({column}) BETWEEN {_literal(bounds[0])} AND {_literal(bounds[1])}",
+                      bounds[:2] if bounds[2] else [])
+        fired.append(kind)
+        i = last + 1
+    sql, params = edits.apply()
+    return sql, params, fired
+
+
+def _comparison(edits: _Edits, j: int) -> Optional[Tuple[int, Tuple[Any, bool], Tuple[Any, bool]]]:
+    """``= v`` or ``BETWEEN a AND b`` at j: (last index, (low, is_param), (high, is_param))."""
+    tokens = edits.tokens
+    if j >= len(tokens):
+        return None
+    if tokens[j].kind == "op" and tokens[j].text in ("=", "==") and j + 1 < len(tokens):
+        known, value = edits.value(j + 1)
+        if not known:
+            return None
+        bound = (value, tokens[j + 1].kind == "param")
+        return j + 1, bound, bound
+    if tokens[j].upper == "BETWEEN" and j + 3 < len(tokens) and tokens[j + 2].upper == "AND":
+        (low_ok, low), (high_ok, high) = edits.value(j + 1), edits.value(j + 3)
+        if not (low_ok and high_ok):
+            return None
+        return j + 3, (low, tokens[j + 1].kind == "param"), (high, tokens[j + 3].kind == "param")
+    return None
+
+
+def _bounds(fmt: str, low: Tuple[Any, bool], high: Tuple[Any, bool]) -> Optional[Tuple[str, str, bool]]:
+    """(first day, last day, bind as parameters) covering the formatted values low..high."""
+    (low_value, low_param), (high_value, high_param) = low, high
+    if not isinstance(low_value, str) or not isinstance(high_value, str):
+        return None
+    as_params = low_param or high_param
+    if fmt == "%Y":
+        if not (_YEAR.fullmatch(low_value) and _YEAR.fullmatch(high_value)):
+            return None
+        return f"{low_value}-01-01", f"{high_value}-12-31", as_params
+    if fmt == "%Y-%m":
+        first, last = _MONTH.fullmatch(low_value), _MONTH.fullmatch(high_value)
+        if not (first and last and 1 <= int(first.group(2)) <= 12 and 1 <= int(last.group(2)) <= 12):
+            return None
+        days = calendar.monthrange(int(last.group(1)), int(last.group(2)))[1]
+        return f"{low_value}-01", f"{high_value}-{days:02d}", as_params
+    if low is high:
+        # DATE(col) = x: any text compares the same way against the BETWEEN.
+        return low_value, high_value, as_params
+    return None
+
+
+class SQLRewriter:
+    """Normalize generated SQL and count which rewrites fire."""
+
+    def __init__(self, validate: Optional[Validator] = None):
+        self.validate = validate
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.rewritten = 0
+        self.rejected = 0
+        self.counts: Counter = Counter()
+        self.warnings: Counter = Counter()
+
+    def rewrite(self, sql: str, params: Optional[Sequence[Any]] = None, format_hint: str = "",
+                top_n: Optional[int] = None, single: bool = False) -> RewriteResult:
+        """Apply every rewrite to sql; ``error`` is set when it must not be executed."""
+        params = list(params or ())
+        text, rewrites = strip_noise(sql or "", self.validate, params)
+        result = RewriteResult(text, params, rewrites)
+
+        keyword = write_keyword(text)
+        if keyword is not None:
+            result.rewrites.append("reject_write")
+            result.error = f"only a single read-only SELECT may be executed, got {keyword}"
+            return self._record(result)
+
+        upper = text.upper()
+        if "DATE" in upper or "STRFTIME" in upper:
+            for step in (fold_date_literals, rewrite_date_predicates):
+                text, params, fired = step(text, params)
+                result.rewrites.extend(fired)
+
+        rows = expected_rows(format_hint, top_n, single)
+        query = parse_select(text) if rows or "*" in text else None
+        limited = inject_limit(query, rows)
+        if limited is not None and (self.validate is None or not self.validate(limited, params)):
+            text = limited
+            result.rewrites.append("inject_limit")
+
+        if query is not None and any(item.is_star for item in query.items) \
+                and any(t.upper == "JOIN" or t.is_punct(",") for t in query.from_tokens):
+            result.warnings.append("select_star_join")
+        result.sql, result.params = text, params
+        return self._record(result)
+
+    def _record(self, result: RewriteResult) -> RewriteResult:
+        with self._lock:
+            self.queries += 1
+            self.rewritten += bool(result.rewrites)
+            self.rejected += bool(result.error)
+            self.counts.update(result.rewrites)
+            self.warnings.update(result.warnings)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "rewritten": self.rewritten,
+                "rejected": self.rejected,
+                "rewrites": dict(self.counts),
+                "warnings": dict(self.warnings)
+            }
@@ -1,12 +1,41 @@
+import os
+import queue
 import sqlite3
-from typing import Dict, List, Any
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Any, Optional, Sequence, Tuple
 import re
 
+from agent.tracing import get_tracer, STATUS_ERROR
+from tools.date_index import DateRangeIndex, rewrite_date_ranges
+
+
+# Opcodes between progress-handler checks; small enough for ~ms timeout precision.
+PROGRESS_OPCODES = 10000
+# Query backends: plain SQLite, the columnar engine (tools/columnar_engine.py),
+# or the columnar engine checked against SQLite on every query.
+SQL_ENGINES = ("sqlite", "columnar", "cross-check")
+# Date columns indexed by warm_up(); others are indexed on first use.
+DEFAULT_DATE_INDEXES = (("Orders", "OrderDate"),)
+
 
 class SQLiteTool:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, pool_size: int = 4, date_index: bool = True):
+        """With ``date_index``, ``DATE(col) BETWEEN`` filters are rewritten to
+        sargable predicates using in-process sorted date indexes (see
+        tools/date_index.py)."""
         self.db_path = db_path
         self.schema_cache = None
+        self.pool_size = pool_size
+        self.date_index = date_index
+        self.date_rewrites: Counter = Counter()
+        self._readonly_pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=pool_size)
+        self._date_indexes: Dict[Tuple[str, str], Optional[DateRangeIndex]] = {}
+        self._date_index_version: Optional[str] = None
+        self._date_lock = threading.Lock()
     
     def get_schema(self) -> str:
         """Get database schema information"""
@@ -25,7 +54,7 @@ class SQLiteTool:
         
         schema_parts = []
         for (table_name,) in tables:
-            cursor.execute(f"PRAGMA table_info({table_name})")
+            cursor.execute(f'PRAGMA table_info("{table_name}")')
             columns = cursor.fetchall()
             
             col_defs = []
@@ -41,28 +70,197 @@ class SQLiteTool:
         self.schema_cache = "\n".join(schema_parts)
         return self.schema_cache
     
+    def get_data_version(self) -> str:
+        """Fingerprint of the database file contents for cache invalidation.
+
+        ``PRAGMA data_version`` only reports changes seen by a single open
+        connection, so across runs we key on the file's mtime and size
+        (plus the WAL file, if any) instead.
+        """
+        parts = []
+        for path in (self.db_path, f"{self.db_path}-wal"):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            parts.append(f"{st.st_mtime_ns}:{st.st_size}")
+        return "|".join(parts)
+    
     def execute(self, query: str) -> Dict[str, Any]:
         """Execute SQL query and return results"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute(query)
-            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+        with get_tracer().span("sqlite.execute") as span:
+            span.set_attribute("db.system", "sqlite")
+            span.set_attribute("db.statement", query[:2000])
+            query, _ = self.rewrite_query(query, None, span)
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            try:
+                cursor.execute(query)
+                columns = [desc[0] for desc in cursor.description] if cursor.description else []
 
-            rows = cursor.fetchall()
-            tables_used = self._extract_tables(query)
+                rows = cursor.fetchall()
+                tables_used = self._extract_tables(query)
+                span.set_attribute("db.rows", len(rows))
+                
+                return {
+                    "columns": columns,
+                    "rows": rows,
+                    "tables_used": tables_used,
+                    "success": True
+                }
             
+            except Exception as e:
+                raise Exception(f"SQL execution error: {str(e)}")
+            
+            finally:
+                conn.close()
+    
+    def execute_query(self, query: str, params: Optional[Sequence[Any]] = None
+                      ) -> Tuple[bool, List[tuple], List[str], str]:
+        """Execute SQL query, returning (success, rows, columns, error) without raising"""
+        with get_tracer().span("sqlite.execute_query") as span:
+            span.set_attribute("db.system", "sqlite")
+            span.set_attribute("db.statement", query[:2000])
+            query, params = self.rewrite_query(query, params, span)
+            conn = sqlite3.connect(self.db_path)
+            try:
+                cursor = conn.execute(query, tuple(params or ()))
+                columns = [desc[0] for desc in cursor.description] if cursor.description else []
+                rows = cursor.fetchall()
+                span.set_attribute("db.rows", len(rows))
+                return True, rows, columns, ""
+            except Exception as e:
+                span.set_status(STATUS_ERROR, str(e))
+                return False, [], [], str(e)
+            finally:
+                conn.close()
+    
+    @contextmanager
+    def _readonly_connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a pooled read-only connection, returning it afterwards"""
+        try:
+            conn = self._readonly_pool.get_nowait()
+        except queue.Empty:
+            uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        try:
+            yield conn
+        finally:
+            conn.set_progress_handler(None, 0)
+            try:
+                self._readonly_pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+    
+    def execute_readonly(self, query: str, params: Optional[Sequence[Any]] = None,
+                         timeout_s: Optional[float] = None
+                         ) -> Tuple[bool, List[tuple], List[str], str]:
+        """Like execute_query, on a pooled read-only connection with an optional timeout.
+
+        Safe to call from several threads at once; writes fail with
+        "attempt to write a readonly database".
+        """
+        with get_tracer().span("sqlite.execute_readonly") as span:
+            span.set_attribute("db.system", "sqlite")
+            span.set_attribute("db.statement", query[:2000])
+            query, params = self.rewrite_query(query, params, span)
+            with self._readonly_connection() as conn:
+                if timeout_s:
+                    deadline = time.perf_counter() + timeout_s
+                    conn.set_progress_handler(lambda: time.perf_counter() > deadline, PROGRESS_OPCODES)
+                try:
+                    cursor = conn.execute(query, tuple(params or ()))
+                    columns = [desc[0] for desc in cursor.description] if cursor.description else []
+                    rows = cursor.fetchall()
+                    span.set_attribute("db.rows", len(rows))
+                    return True, rows, columns, ""
+                except Exception as e:
+                    error = str(e)
+                    if timeout_s and error == "interrupted":
+                        error = f"query timed out after {timeout_s:g}s"
+                    span.set_status(STATUS_ERROR, error)
+                    return False, [], [], error
+    
+    def validate(self, query: str, params: Optional[Sequence[Any]] = None) -> str:
+        """Compile query with EXPLAIN without running it; the error message, or "" if valid"""
+        with self._readonly_connection() as conn:
+            try:
+                conn.execute(f"EXPLAIN {query}", tuple(params or ())).fetchone()
+                return ""
+            except Exception as e:
+                return str(e)
+    
+    def rewrite_query(self, query: str, params: Optional[Sequence[Any]], span=None
+                      ) -> Tuple[str, Optional[Sequence[Any]]]:
+        """Apply the date-range rewrite (if enabled), counting rewrites by kind"""
+        if not self.date_index:
+            return query, params
+        query, params, kinds = rewrite_date_ranges(query, params, self.date_range_index)
+        if kinds:
+            with self._date_lock:
+                self.date_rewrites.update(kinds)
+            if span is not None:
+                span.set_attribute("db.date_rewrites", ",".join(kinds))
+        return query, params
+    
+    def date_range_index(self, table: str, column: str) -> Optional[DateRangeIndex]:
+        """Sorted date index of table.column, built on first use and whenever the file changes"""
+        version = self.get_data_version()
+        key = (table.lower(), column.lower())
+        with self._date_lock:
+            if version != self._date_index_version:
+                self._date_indexes.clear()
+                self._date_index_version = version
+            if key not in self._date_indexes:
+                uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+                conn = sqlite3.connect(uri, uri=True)
+                try:
+                    self._date_indexes[key] = DateRangeIndex.build(conn, table, column)
+                except sqlite3.Error:
+                    self._date_indexes[key] = None
+                finally:
+                    conn.close()
+            return self._date_indexes[key]
+    
+    def warm_up(self):
+        """Build the default date indexes now instead of on the first query"""
+        if self.date_index:
+            for table, column in DEFAULT_DATE_INDEXES:
+                self.date_range_index(table, column)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._date_lock:
             return {
-                "columns": columns,
-                "rows": rows,
-                "tables_used": tables_used,
-                "success": True
+                "date_rewrites": dict(self.date_rewrites),
+                "date_indexes": {
+                    f"{index.table}.{index.column}": index.stats()
+                    for index in self._date_indexes.values() if index is not None
+                }
             }
-        
-        except Exception as e:
-            raise Exception(f"SQL execution error: {str(e)}")
-        
+    
+    def close(self):
+        """Close pooled read-only connections"""
+        while True:
+            try:
+                self._readonly_pool.get_nowait().close()
+            except queue.Empty:
+                break
+    
+    def shards_for(self, query: str) -> List[str]:
+        """Shards a query reads; a single database has none to cite"""
+        return []
+    
+    def get_table_names(self) -> List[str]:
+        """List user tables in the database"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute("""
+                SELECT name FROM sqlite_master
+                WHERE type='table' AND name NOT LIKE 'sqlite_%'
+                ORDER BY name
+            """)
+            return [row[0] for row in cursor.fetchall()]
         finally:
             conn.close()
     
@@ -3,6 +3,8 @@ from pathlib import Path
 from rich.console import Console
 from rich.table import Table
 
+from agent.format_hints import compile_format_hint
+
 console = Console()
 
 
@@ -18,18 +20,10 @@ def load_outputs(filepath):
 
 def verify_format(output, format_hint):
     """Check if answer matches format hint"""
-    answer = output['final_answer']
-    
-    if format_hint == 'int':
-        return isinstance(answer, int)
-    elif format_hint == 'float':
-        return isinstance(answer, (int, float))
-    elif format_hint.startswith('list['):
-        return isinstance(answer, list)
-    elif format_hint.startswith('{'):
-        return isinstance(answer, dict)
-    
-    return False
+    spec = compile_format_hint(format_hint)
+    if spec.kind == 'text':
+        return False
+    return spec.is_valid(output['final_answer'])
 
 
 def verify_citations(output):